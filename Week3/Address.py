@@ -0,0 +1,47 @@
+""" IPv4 address math on 32-bit integers, shared by the Router model """
+
+FULL_MASK = 0xFFFFFFFF
+
+# MASKS[n] is the subnet mask of a /n prefix
+MASKS = [(FULL_MASK << (32 - length)) & FULL_MASK for length in range(33)]
+
+def ip_to_int(address):
+    """ convert dotted decimal address into uint32, return None when the address is invalid """
+    try:
+        a, b, c, d = map(int, address.split("."))
+    except ValueError:
+        return None
+
+    # Any octet above 255 or below 0 leaves bits outside the lowest 8
+    if (a | b | c | d) >> 8:
+        return None
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+def int_to_ip(value):
+    """ convert uint32 into dotted decimal address """
+    return "{}.{}.{}.{}".format(value >> 24, (value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+def parse_prefix(prefix):
+    """ split "a.b.c.d/n" into (uint32 address, prefix length), return None when invalid """
+    address, slash, length = prefix.partition("/")
+    if not slash or not length.isdecimal():
+        return None
+    length = int(length)
+    address = ip_to_int(address)
+    if address is None or length > 32:
+        return None
+    return address, length
+
+def format_prefix(network, length):
+    """ convert (uint32 network, prefix length) into "a.b.c.d/n" """
+    return int_to_ip(network) + "/" + str(length)
+
+def network_address(address, length):
+    return address & MASKS[length]
+
+def broadcast_address(address, length):
+    return address | (~MASKS[length] & FULL_MASK)
+
+def contains(network, length, address):
+    """ check that address is inside network/length """
+    return address & MASKS[length] == network
@@ -0,0 +1,137 @@
+""" Vectorized longest prefix match of many addresses at once with NumPy """
+import numpy as np
+from Address import FULL_MASK, broadcast_address
+
+# Interface index of ranges whose route is an ECMP group, their next hop is the index of the group
+GROUP = -2
+
+# Tables with more ranges than this also get a first level table indexed by the top STRIDE bits
+STRIDE_MIN = 65536
+STRIDE = 24
+
+class CompiledTable:
+    """ routing table flattened into sorted, non-overlapping address ranges
+
+    Every range starts at starts[i] and carries the route of its longest matching prefix, so a
+    batch lookup is one searchsorted over the starts. Big tables add a multibit stride table
+    (DIR-24-8 style) that resolves every /24 block covered by a single range with one gather,
+    leaving searchsorted for the few addresses in blocks that are split further. ECMP routes
+    pick one of their paths per address with the same flow hash as NextHopGroup.select.
+    """
+
+    def __init__(self, rows, default, groups=()):
+        """ rows are (network, length, nexthop, interface index) with distinct prefixes, default is (nexthop, interface index)
+
+        groups are lists of (nexthop, interface index) paths, rows and default point to one with (index, GROUP).
+        """
+        starts = [0]
+        values = [default]
+        stack = [(FULL_MASK, default)]
+
+        def emit(start, value):
+            if starts[-1] == start:
+                values[-1] = value
+            else:
+                starts.append(start)
+                values.append(value)
+
+        # Containing prefixes sort before the prefixes inside them
+        for network, length, nexthop, iface in sorted(rows):
+            while stack[-1][0] < network:
+                end, value = stack.pop()
+                emit(end + 1, stack[-1][1])
+            emit(network, (nexthop, iface))
+            stack.append((broadcast_address(network, length), (nexthop, iface)))
+
+        while len(stack) > 1:
+            end, value = stack.pop()
+            if end < FULL_MASK:
+                emit(end + 1, stack[-1][1])
+
+        self.__build(np.array(starts, dtype=np.uint32), np.array([value[0] for value in values], dtype=np.uint32),
+                     np.array([value[1] for value in values], dtype=np.int32), groups)
+
+    @classmethod
+    def fromArrayTable(cls, table, interfaceIndex, default, groups=()):
+        """ compile an ArrayRouteTable from its ranges, column by column, no row becomes a Python object
+
+        interfaceIndex maps the table's interface names to interface indexes, default and groups are
+        as for CompiledTable(), the next hops of the table's ECMP rows index into groups.
+        """
+        from RouteTable import GROUP as TABLE_GROUP
+
+        starts, rows = table.ranges()
+        ifaceMap = np.full(TABLE_GROUP + 1, -1, dtype=np.int32)
+        for index, name in enumerate(table.interfaces):
+            ifaceMap[index] = interfaceIndex.get(name, -1)
+        ifaceMap[TABLE_GROUP] = GROUP
+
+        # Row -1, addresses without a prefix, picks the default appended after the last row
+        rows = np.frombuffer(rows, dtype=np.int32)
+        nexthops = np.append(np.frombuffer(table.nexthops, dtype=np.uint32), np.uint32(default[0]))[rows]
+        ifaces = np.append(ifaceMap[np.frombuffer(table.ifaces, dtype=np.uint16)], np.int32(default[1]))[rows]
+        compiled = cls.__new__(cls)
+        compiled.__build(np.frombuffer(starts, dtype=np.uint32).copy(), nexthops, ifaces, groups)
+        return compiled
+
+    def __build(self, starts, nexthops, ifaces, groups):
+        self.starts = starts
+        self.nexthops = nexthops
+        self.ifaces = ifaces
+
+        self.stride = None
+        if len(starts) >= STRIDE_MIN:
+            # Count the ranges starting at or before the first address of every block, in place so
+            # the only big array is the stride table itself
+            shift = np.uint32(32 - STRIDE)
+            inside = (self.starts & np.uint32((1 << (32 - STRIDE)) - 1)) != 0
+            blocks = (self.starts >> shift).astype(np.int64) + inside
+            stride = np.zeros(1 << STRIDE, dtype=np.int32)
+            np.add.at(stride, blocks[blocks < len(stride)], 1)
+            np.cumsum(stride, out=stride)
+            stride -= 1
+
+            # Blocks with a range starting inside them need the full search
+            stride[self.starts[inside] >> shift] = -1
+            self.stride = stride
+
+        # Paths of every group one after the other
+        self.groupStarts = np.array([0] + [len(paths) for paths in groups], dtype=np.int64).cumsum()
+        self.pathNexthops = np.array([path[0] for paths in groups for path in paths], dtype=np.uint32)
+        self.pathIfaces = np.array([path[1] for paths in groups for path in paths], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, addresses, flows=None):
+        """ return (nexthop array, interface index array) for a uint32 address array
+
+        ECMP routes give the path of flows, an array of NextHop.flow_hash() values, or of the destination address alone.
+        """
+        addresses = np.asarray(addresses, dtype=np.uint32)
+        if self.stride is None:
+            index = np.searchsorted(self.starts, addresses, side="right") - 1
+        else:
+            index = self.stride[addresses >> np.uint32(32 - STRIDE)]
+            split = index < 0
+            index[split] = np.searchsorted(self.starts, addresses[split], side="right") - 1
+        nexthops, ifaces = self.nexthops[index], self.ifaces[index]
+
+        ecmp = ifaces == GROUP
+        if len(self.pathNexthops) and ecmp.any():
+            groups = nexthops[ecmp].astype(np.int64)
+            flow = flow_hash_many(addresses[ecmp]) if flows is None else np.asarray(flows, dtype=np.uint64)[ecmp]
+            sizes = (self.groupStarts[groups + 1] - self.groupStarts[groups]).astype(np.uint64)
+            path = self.groupStarts[groups] + (flow * sizes >> np.uint64(32)).astype(np.int64)
+            nexthops[ecmp] = self.pathNexthops[path]
+            ifaces[ecmp] = self.pathIfaces[path]
+        return nexthops, ifaces
+
+def flow_hash_many(addresses):
+    """ NextHop.flow_hash(0, address) of every address of a uint32 array, as uint64 """
+    key = np.asarray(addresses, dtype=np.uint64)
+    # uint64 products wrap around like the & M64 of flow_hash
+    with np.errstate(over="ignore"):
+        key = (key ^ key >> np.uint64(30)) * np.uint64(0xBF58476D1CE4E5B9)
+        key = (key ^ key >> np.uint64(27)) * np.uint64(0x94D049BB133111EB)
+    return (key ^ key >> np.uint64(31)) & np.uint64(0xFFFFFFFF)
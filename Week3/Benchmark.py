@@ -0,0 +1,289 @@
+""" Scale benchmarks of the Router model with JSON results and a comparison against a stored baseline
+
+    python Benchmark.py --baseline benchmark_baseline.json
+    python Benchmark.py --scale 0.1 --output results.json
+
+benchmark_baseline.json holds a full scale run, write a new one with --output after an intended change.
+
+Every scenario runs in its own process so its peak memory is not mixed up with the others.
+Metrics ending in "_per_s" are better when higher, every other metric is better when lower.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from Address import int_to_ip, format_prefix, network_address
+from Generator import generate, build
+from RouteTable import ArrayRouteTable
+from Router import Router
+from Snapshot import write_snapshot
+from Topology import Topology
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SEED = 2020
+
+# Production sizes at --scale 1
+INTERFACES = 10000
+ROUTES = 1000000
+ROUTERS = 10000
+LOOKUPS = 100000
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def _peak_mb():
+    """ peak resident memory of this process in MB, None where the platform can't tell """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bench_interfaces(scale):
+    count = max(1, int(INTERFACES * scale))
+    router = Router("Cisco", "c7200", "IOS", "R1")
+    names = ["GigabitEthernet{}/{}".format(index // 48, index % 48) for index in range(count)]
+
+    start = time.perf_counter()
+    for interfaceName in names:
+        router.addInterface(interfaceName)
+    added = time.perf_counter() - start
+
+    # One /30 per interface
+    addresses = [int_to_ip((10 << 24) + index * 4 + 1) + "/30" for index in range(count)]
+    start = time.perf_counter()
+    for interfaceName, ip in zip(names, addresses):
+        router.setIP(interfaceName, ip)
+    assigned = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for interfaceName in names:
+        router.deleteIP(interfaceName)
+    deleted = time.perf_counter() - start
+
+    return {
+        "interfaces.addInterface_per_s": _rate(count, added),
+        "interfaces.setIP_per_s": _rate(count, assigned),
+        "interfaces.deleteIP_per_s": _rate(count, deleted),
+    }
+
+def _random_routes(rng, count):
+    routes = {}
+    while len(routes) < count:
+        length = rng.choice((16, 20, 22, 24, 24, 24, 28, 32))
+        network = network_address(rng.getrandbits(32), length)
+        routes[format_prefix(network, length)] = None
+    return list(routes)
+
+def bench_routes(scale, table=None):
+    name = "routes" if table is None else "routes_" + table.__name__
+    rng = random.Random(SEED)
+    count = max(1, int(ROUTES * scale))
+    router = Router("Cisco", "c7200", "IOS", "R1", None if table is None else table())
+    router.addInterface("G0/0")
+    router.setIP("G0/0", "192.0.2.1/24")
+    destinations = _random_routes(rng, count)
+
+    start = time.perf_counter()
+    for dst in destinations:
+        router.addRoute(dst, "192.0.2.2", "G0/0")
+    added = time.perf_counter() - start
+    metrics = {name + ".addRoute_per_s": _rate(count, added)}
+
+    # The first lookup is timed on its own, tables that don't keep a trie build theirs there
+    start = time.perf_counter()
+    router.lookup("192.0.2.9")
+    metrics[name + ".first_lookup_s"] = round(time.perf_counter() - start, 3)
+
+    samples = max(1000, int(LOOKUPS * min(scale, 1)))
+    addresses = [rng.getrandbits(32) for index in range(samples)]
+    latencies = []
+    clock = time.perf_counter_ns
+    for address in addresses:
+        start = clock()
+        router.lookup(address)
+        latencies.append(clock() - start)
+    latencies.sort()
+    metrics[name + ".lookup_p50_us"] = round(_percentile(latencies, 0.5) / 1000, 2)
+    metrics[name + ".lookup_p99_us"] = round(_percentile(latencies, 0.99) / 1000, 2)
+    metrics[name + ".lookup_per_s"] = _rate(samples, sum(latencies) / 1e9)
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        batch = np.array(addresses, dtype=np.uint32)
+        router.lookup_many(batch[:1])
+        start = time.perf_counter()
+        router.lookup_many(batch)
+        metrics[name + ".lookup_many_per_s"] = _rate(samples, time.perf_counter() - start)
+
+    removed = destinations[:max(1, count // 10)]
+    start = time.perf_counter()
+    for dst in removed:
+        router.deleteRoute(dst)
+    metrics[name + ".deleteRoute_per_s"] = _rate(len(removed), time.perf_counter() - start)
+    return metrics
+
+def bench_array_routes(scale):
+    return bench_routes(scale, ArrayRouteTable)
+
+def bench_bulk_routes(scale, table=None):
+    """ the whole table in one addRoutes call, the way RouteLoader loads it """
+    name = "bulk_routes" if table is None else "bulk_routes_" + table.__name__
+    count = max(1, int(ROUTES * scale))
+    router = Router("Cisco", "c7200", "IOS", "R1", None if table is None else table())
+    router.addInterface("G0/0")
+    router.setIP("G0/0", "192.0.2.1/24")
+    routes = [(dst, "192.0.2.2", "G0/0") for dst in _random_routes(random.Random(SEED), count)]
+
+    start = time.perf_counter()
+    router.addRoutes(routes)
+    metrics = {name + ".addRoutes_per_s": _rate(count, time.perf_counter() - start)}
+
+    start = time.perf_counter()
+    router.lookup("192.0.2.9")
+    metrics[name + ".first_lookup_s"] = round(time.perf_counter() - start, 3)
+    return metrics
+
+def bench_array_bulk_routes(scale):
+    return bench_bulk_routes(scale, ArrayRouteTable)
+
+def bench_topology(scale):
+    count = max(2, int(ROUTERS * scale))
+    topology = Topology()
+    routers = []
+    for index in range(count):
+        router = Router("Cisco", "c7200", "IOS", "R{}".format(index))
+        router.addInterface("G0/0")
+        router.addInterface("G0/1")
+        topology.addRouter(router)
+        routers.append(router)
+
+    # A ring: G0/1 of every router to G0/0 of the next one
+    start = time.perf_counter()
+    for index, router in enumerate(routers):
+        router.connect("G0/1", routers[(index + 1) % count], "G0/0")
+    connected = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index, router in enumerate(routers):
+        router.disconnect("G0/1", routers[(index + 1) % count], "G0/0")
+    disconnected = time.perf_counter() - start
+
+    return {
+        "topology.connect_per_s": _rate(count, connected),
+        "topology.disconnect_per_s": _rate(count, disconnected),
+    }
+
+def bench_generated(scale):
+    """ a generated spine-leaf fabric: generation, building the Topology and a snapshot round trip """
+    count = max(4, int(ROUTERS * scale))
+    metrics = {}
+    start = time.perf_counter()
+    records = generate("spine-leaf", count, SEED, routes=10)
+    metrics["generated.generate_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    build(records)
+    metrics["generated.build_s"] = round(time.perf_counter() - start, 3)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fabric.snap")
+        start = time.perf_counter()
+        write_snapshot(path, records)
+        metrics["generated.snapshot_write_s"] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        Topology.load(path)
+        metrics["generated.snapshot_load_s"] = round(time.perf_counter() - start, 3)
+    return metrics
+
+SCENARIOS = {
+    "interfaces": bench_interfaces,
+    "routes": bench_routes,
+    "array_routes": bench_array_routes,
+    "bulk_routes": bench_bulk_routes,
+    "array_bulk_routes": bench_array_bulk_routes,
+    "topology": bench_topology,
+    "generated": bench_generated,
+}
+
+def _run_scenario(name, scale):
+    metrics = SCENARIOS[name](scale)
+    peak = _peak_mb()
+    if peak is not None:
+        metrics[name + ".peak_memory_mb"] = peak
+    return metrics
+
+def run(names, scale):
+    """ run the scenarios, each in a fresh process, return the result document """
+    metrics = {}
+    for name in names:
+        with multiprocessing.Pool(1) as pool:
+            metrics.update(pool.apply(_run_scenario, (name, scale)))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "metrics": metrics,
+    }
+
+def compare(results, baseline, tolerance):
+    """ return [(metric, baseline, current, change)] of metrics that got worse than tolerance """
+    regressions = []
+    for metric, before in baseline["metrics"].items():
+        after = results["metrics"].get(metric)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        worse = -change if metric.endswith("_per_s") else change
+        if worse > tolerance:
+            regressions.append((metric, before, after, change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scale benchmarks of the Router model")
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of the production sizes, default 1")
+    parser.add_argument("--only", action="append", choices=sorted(SCENARIOS), help="scenario to run, can be repeated")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a metric counts as regressed, default 0.2")
+    args = parser.parse_args(argv)
+
+    results = run(args.only or list(SCENARIOS), args.scale)
+    for metric, value in results["metrics"].items():
+        print("{:<40} {:>14}".format(metric, value))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as stored:
+            baseline = json.load(stored)
+        if baseline.get("scale") != results["scale"]:
+            print("warning: baseline was run at scale {}".format(baseline.get("scale")))
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, before, after, change in regressions:
+            print("REGRESSION {:<40} {} -> {} ({:+.0%})".format(metric, before, after, change))
+        if regressions:
+            return 1
+        print("no regressions against {}".format(args.baseline))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+""" Change events emitted by Router to its subscribers """
+
+# Event kinds, key is the interface name, the local interface of the link or the route destination
+HOSTNAME_CHANGED = "hostnameChanged"
+INTERFACE_ADDED = "interfaceAdded"
+INTERFACE_DELETED = "interfaceDeleted"
+ADDRESS_SET = "addressSet"
+ADDRESS_DELETED = "addressDeleted"
+ROUTE_ADDED = "routeAdded"
+ROUTE_CHANGED = "routeChanged"
+ROUTE_REMOVED = "routeRemoved"
+LINK_UP = "linkUp"
+LINK_DOWN = "linkDown"
+VRF_CHANGED = "vrfChanged"
+
+# family: (kind when something appears, kind when it changes, kind when it disappears)
+_FAMILIES = {
+    "hostname": (None, HOSTNAME_CHANGED, None),
+    "interface": (INTERFACE_ADDED, None, INTERFACE_DELETED),
+    "address": (ADDRESS_SET, ADDRESS_SET, ADDRESS_DELETED),
+    "route": (ROUTE_ADDED, ROUTE_CHANGED, ROUTE_REMOVED),
+    "link": (LINK_UP, None, LINK_DOWN),
+    "vrf": (VRF_CHANGED, VRF_CHANGED, VRF_CHANGED),
+}
+_FAMILY = dict((kind, family) for family, kinds in _FAMILIES.items() for kind in kinds if kind is not None)
+
+class Event:
+    """ one change of a router: old and new are the value before and after it, None when there was none
+
+    Values are the interface or address string, the "nexthop iface" route, the (remote Router,
+    remote interface) of a link, the hostname or the VRF of an interface. source is the route
+    source of route events, None for the routing table, and vrf their VRF, None for the global table.
+    """
+    __slots__ = ("kind", "router", "key", "old", "new", "source", "vrf")
+
+    def __init__(self, kind, router, key, old=None, new=None, source=None, vrf=None):
+        self.kind = kind
+        self.router = router
+        self.key = key
+        self.old = old
+        self.new = new
+        self.source = source
+        self.vrf = vrf
+
+    def __repr__(self):
+        return "Event({}, {}, {!r}, {!r}, {!r})".format(self.kind, self.router.getHostname(), self.key, self.old, self.new)
+
+def coalesce(events):
+    """ merge events on the same thing into one from its first old value to its last new value
+
+    A route added and removed again in the same batch leaves nothing, events keep the order of
+    their first occurrence.
+    """
+    merged = {}
+    for event in events:
+        key = (_FAMILY[event.kind], event.key, event.source, event.vrf)
+        if key in merged:
+            merged[key].new = event.new
+        else:
+            merged[key] = Event(event.kind, event.router, event.key, event.old, event.new, event.source, event.vrf)
+
+    result = []
+    for (family, key, source, vrf), event in merged.items():
+        appeared, changed, disappeared = _FAMILIES[family]
+        if event.old == event.new:
+            continue
+        if event.old is None:
+            event.kind = appeared
+        elif event.new is None:
+            event.kind = disappeared
+        elif changed is not None:
+            event.kind = changed
+        else:
+            # Removed and added back with another value
+            result.append(Event(disappeared, event.router, key, event.old, None, source, vrf))
+            event.kind, event.old = appeared, None
+        result.append(event)
+    return result
+
+class Subscription:
+    """ handler and filter of one subscriber, returned by Router.subscribe """
+    __slots__ = ("router", "handler", "kinds", "batch", "coalesce", "pending")
+
+    def __init__(self, router, handler, kinds, batch, coalesce):
+        self.router = router
+        self.handler = handler
+        self.kinds = None if kinds is None else frozenset(kinds)
+        self.batch = batch or coalesce
+        self.coalesce = coalesce
+        self.pending = []
+
+    def deliver(self, event, batching):
+        if self.kinds is not None and event.kind not in self.kinds:
+            return
+        if not self.batch:
+            self.handler(event)
+        elif batching:
+            self.pending.append(event)
+        else:
+            self.handler([event])
+
+    def flush(self):
+        """ hand the events held during a batch to the handler """
+        events, self.pending = self.pending, []
+        if self.coalesce:
+            events = coalesce(events)
+        if events:
+            self.handler(events)
+
+    def unsubscribe(self):
+        self.router.unsubscribe(self)
@@ -0,0 +1,121 @@
+""" Hop-by-hop packet forwarding over the routers of a Topology """
+from Address import ip_to_int
+
+# Recursive next hop lookups give up after this many levels
+MAX_RECURSION = 8
+
+class Forwarder:
+
+    def __init__(self, topology):
+        self.__topology = topology
+
+        # router -> (router version, {(destination prefix, nexthop, interface): next hop entry})
+        self.__cache = {}
+
+        # router -> (router version, set of its interface addresses)
+        self.__addresses = {}
+
+    def __owns(self, router, address):
+        version = router.getVersion()
+        cached = self.__addresses.get(router)
+        if cached is None or cached[0] != version:
+            addresses = set()
+            for interfaceName in router.getInterfaces():
+                configured = router.getAddress(interfaceName)
+                if configured is not None:
+                    addresses.add(configured[0])
+            cached = (version, addresses)
+            self.__addresses[router] = cached
+        return address in cached[1]
+
+    def __resolve(self, router, nexthop, iface):
+        """ next hop entry (out interface, neighbor Router, neighbor version, uint32 nexthop) of a route
+
+        Out interface is None when the next hop can't be reached, nexthop is None on connected routes.
+        """
+        if nexthop == "directly connected":
+            gateway = None
+        else:
+            gateway = ip_to_int(nexthop)
+
+            # Static routes without an interface resolve their next hop through a connected route
+            depth = 0
+            while iface == "" and depth < MAX_RECURSION:
+                match = router.lookup(gateway)
+                if match is None:
+                    return None, None, 0, gateway
+                if match[1] == "directly connected":
+                    iface = match[2]
+                else:
+                    gateway = ip_to_int(match[1])
+                    iface = match[2]
+                depth += 1
+            if iface == "":
+                return None, None, 0, gateway
+
+        link = self.__topology.neighbor(router, iface)
+        neighbor = link[0] if link is not None else None
+        if gateway is not None and (neighbor is None or not self.__owns(neighbor, gateway)):
+            return None, None, 0, gateway
+        return iface, neighbor, neighbor.getVersion() if neighbor is not None else 0, gateway
+
+    def __nextHop(self, router, address, flow):
+        match = router.lookup(address, flow=flow)
+        if match is None:
+            return None
+
+        version = router.getVersion()
+        cached = self.__cache.get(router)
+        if cached is None or cached[0] != version:
+            # Only this router's entries are dropped when its table changes
+            cached = (version, {})
+            self.__cache[router] = cached
+
+        # ECMP routes resolve every path of a prefix on its own
+        entry = cached[1].get(match)
+        if entry is not None:
+            iface, neighbor, neighbor_version = entry[:3]
+            link = self.__topology.neighbor(router, iface) if iface is not None else None
+            current = link[0] if link is not None else None
+            if iface is None or (current is neighbor and (neighbor is None or neighbor.getVersion() == neighbor_version)):
+                return entry
+
+        entry = self.__resolve(router, match[1], match[2])
+        cached[1][match] = entry
+        return entry
+
+    def trace(self, router, ip, flow=None):
+        """ forward a packet to ip starting at router, return (status, [(hostname, out interface)])
+
+        status is "delivered", "blackhole" when a router has no usable route, or "loop". ECMP routes
+        forward on the path of flow, a NextHop.flow_hash() value, so one flow always takes one path.
+        """
+        address = ip_to_int(ip) if isinstance(ip, str) else ip
+        path = []
+        visited = set()
+        while True:
+            if router in visited:
+                return "loop", path
+            visited.add(router)
+
+            if self.__owns(router, address):
+                path.append((router.getHostname(), ""))
+                return "delivered", path
+
+            entry = self.__nextHop(router, address, flow)
+            if entry is None or entry[0] is None:
+                path.append((router.getHostname(), ""))
+                return "blackhole", path
+
+            iface, neighbor, neighbor_version, gateway = entry
+            path.append((router.getHostname(), iface))
+            if gateway is None and (neighbor is None or not self.__owns(neighbor, address)):
+                # Host on the connected subnet
+                return "delivered", path
+            router = neighbor
+
+    def traceAll(self, ip, flow=None):
+        """ yield (hostname, status, path) for a packet to ip from every router of the topology """
+        for hostname, router in self.__topology.getRouters().items():
+            status, path = self.trace(router, ip, flow)
+            yield hostname, status, path
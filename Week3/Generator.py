@@ -0,0 +1,177 @@
+""" Reproducible synthetic topologies for load tests
+
+    python Generator.py spine-leaf 100000 --seed 7 --routes 100 --output fabric.snap
+
+Routers are produced as snapshot records (see Snapshot.py) instead of through addInterface, setIP,
+connect and addRoute calls, with routing tables built as sorted ArrayRouteTable columns, so a 100k
+router network can be written to a snapshot file or turned into Routers with Router.fromRecords
+without parsing a single prefix string. Every link is a /30 out of
+10.0.0.0/8 between two "Ethernet1/n" interfaces, static routes are random /24s through the first
+neighbor of a router. The same arguments and seed always give the same network.
+"""
+import argparse
+import random
+import sys
+import time
+from array import array
+from Router import Router
+from RouteTable import ArrayRouteTable, DIRECT, MAX_INTERFACES, TYPECODES
+from Snapshot import write_snapshot
+from Topology import Topology
+
+# Links are numbered /30s of 10.0.0.0/8
+LINK_BASE = 10 << 24
+MAX_LINKS = 1 << 22
+
+# Spokes a hub gets when the number of hubs is not given
+SPOKES_PER_HUB = 1024
+
+# Static routes are /24s above the link addresses
+ROUTE_BASE = 11 << 24
+ROUTE_SPACE = (223 - 11) << 16
+
+def spine_leaf_links(count, rng, spines=None, uplinks=4):
+    """ (hostnames, links) of a two tier fabric, links None when there are too many
+
+    Every leaf has uplinks links to consecutive spines, so small fabrics are a full mesh and
+    large ones spread the leaves evenly instead of giving a spine a port per leaf.
+    """
+    spines = min(count, spines or max(2, count // 32))
+    leaves = count - spines
+    uplinks = min(uplinks, spines)
+    if uplinks * leaves > MAX_LINKS:
+        return None, None
+    hostnames = ["spine{}".format(index + 1) for index in range(spines)] + ["leaf{}".format(index + 1) for index in range(leaves)]
+    return hostnames, [((leaf * uplinks + uplink) % spines, spines + leaf) for leaf in range(leaves) for uplink in range(uplinks)]
+
+def ring_links(count, rng):
+    hostnames = ["R{}".format(index + 1) for index in range(count)]
+    if count < 2:
+        return hostnames, []
+    if count == 2:
+        return hostnames, [(0, 1)]
+    return hostnames, [(index, (index + 1) % count) for index in range(count)]
+
+def random_links(count, rng, degree=3):
+    """ connected random graph: a random spanning tree plus random links up to an average degree """
+    hostnames = ["R{}".format(index + 1) for index in range(count)]
+    links = set((rng.randrange(index), index) for index in range(1, count))
+    wanted = min(count * degree // 2, count * (count - 1) // 2)
+    while len(links) < wanted:
+        a, b = rng.randrange(count), rng.randrange(count)
+        if a != b:
+            links.add((min(a, b), max(a, b)))
+    return hostnames, sorted(links)
+
+def hub_spoke_links(count, rng, hubs=None):
+    """ spokes spread over the hubs, hubs connected to each other in a full mesh
+
+    Without hubs there is one hub for every SPOKES_PER_HUB routers.
+    """
+    hubs = max(1, min(hubs or count // SPOKES_PER_HUB, count))
+    if hubs * (hubs - 1) // 2 + count - hubs > MAX_LINKS:
+        return None, None
+    hostnames = ["hub{}".format(index + 1) for index in range(hubs)] + ["spoke{}".format(index + 1) for index in range(count - hubs)]
+    links = [(a, b) for a in range(hubs) for b in range(a + 1, hubs)]
+    links.extend((spoke % hubs, hubs + spoke) for spoke in range(count - hubs))
+    return hostnames, links
+
+TOPOLOGIES = {
+    "spine-leaf": spine_leaf_links,
+    "ring": ring_links,
+    "random": random_links,
+    "hub-spoke": hub_spoke_links,
+}
+
+def generate(kind, count, seed=0, routes=0, brand="Cisco", model="c7200", os="IOS", **options):
+    """ snapshot records of a kind of topology with count routers, None when it needs more links than 10.0.0.0/8 holds
+    or a router with more interfaces than an ArrayRouteTable holds
+
+    options go to the links function of the kind: spines and uplinks for "spine-leaf", degree for
+    "random" and hubs for "hub-spoke". routes is the number of static routes of every router.
+    """
+    rng = random.Random(seed)
+    hostnames, links = TOPOLOGIES[kind](count, rng, **options)
+    if links is None or len(links) > MAX_LINKS:
+        return None
+    degrees = [0] * len(hostnames)
+    for a, b in links:
+        degrees[a] += 1
+        degrees[b] += 1
+    if degrees and max(degrees) > MAX_INTERFACES:
+        return None
+
+    interfaces = [[] for hostname in hostnames]
+    connections = [[] for hostname in hostnames]
+    for number, (a, b) in enumerate(links):
+        network = LINK_BASE + number * 4
+        names = []
+        for index, address in ((a, network + 1), (b, network + 2)):
+            interfaceName = "Ethernet1/{}".format(len(interfaces[index]) + 1)
+            interfaces[index].append((interfaceName, address, 30, None))
+            names.append(interfaceName)
+        connections[a].append((names[0], hostnames[b], names[1]))
+        connections[b].append((names[1], hostnames[a], names[0]))
+
+    records = []
+    for index, hostname in enumerate(hostnames):
+        records.append((brand, model, os, hostname, interfaces[index], connections[index],
+                        [(None, None, _table(interfaces[index], routes, rng))]))
+    return records
+
+def _table(interfaces, routes, rng):
+    """ ArrayRouteTable of the connected routes of interfaces and routes random /24s through the first neighbor """
+    # {network: (network, length, nexthop, interface index)}, interface index 0 is "" in ArrayRouteTable
+    rows = {}
+    if routes and interfaces:
+        # The neighbor's address is the other end of the first link
+        nexthop = interfaces[0][1] ^ 3
+        for network in [ROUTE_BASE + (int(rng.random() * ROUTE_SPACE) << 8) for prefix in range(routes)]:
+            rows[network] = (network, 24, nexthop, 1)
+    for number, (interfaceName, address, length, vrf) in enumerate(interfaces):
+        rows[address & ~3] = (address & ~3, length, DIRECT, number + 1)
+
+    columns = zip(*sorted(rows.values())) if rows else [()] * 4
+    columns = [array(typecode, column) for typecode, column in zip(TYPECODES, columns)]
+    return ArrayRouteTable.fromColumns(*columns, [""] + [interface[0] for interface in interfaces])
+
+def build(records):
+    """ Topology of generated records """
+    topology = Topology()
+    for router in Router.fromRecords(records):
+        topology.addRouter(router)
+    return topology
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic topology")
+    parser.add_argument("kind", choices=sorted(TOPOLOGIES))
+    parser.add_argument("count", type=int, help="number of routers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--routes", type=int, default=0, help="static routes per router")
+    parser.add_argument("--spines", type=int, help="spines of a spine-leaf fabric")
+    parser.add_argument("--uplinks", type=int, help="spines every leaf is connected to")
+    parser.add_argument("--degree", type=int, help="average degree of a random graph")
+    parser.add_argument("--hubs", type=int, help="hubs of a hub-spoke network")
+    parser.add_argument("--output", help="write the topology to this snapshot file")
+    args = parser.parse_args(argv)
+
+    options = dict((name, getattr(args, name)) for name in ("spines", "uplinks", "degree", "hubs") if getattr(args, name) is not None)
+    start = time.perf_counter()
+    records = generate(args.kind, args.count, args.seed, args.routes, **options)
+    if records is None:
+        print("too many links for 10.0.0.0/8")
+        return 1
+    links = sum(len(record[5]) for record in records) // 2
+    print("generated {} routers and {} links in {:.2f}s".format(len(records), links, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    if args.output:
+        write_snapshot(args.output, records)
+        print("wrote {} in {:.2f}s".format(args.output, time.perf_counter() - start))
+    else:
+        topology = build(records)
+        print("built a topology of {} routers in {:.2f}s".format(len(topology), time.perf_counter() - start))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+""" Next hop groups: the equal-cost paths of an ECMP route, one shared object for every prefix using them """
+import sys
+import weakref
+
+M64 = 0xFFFFFFFFFFFFFFFF
+
+def flow_hash(src, dst, protocol=0, sport=0, dport=0):
+    """ 32 bit hash of a flow 5-tuple, addresses are uint32
+
+    A packed 64 bit key through the splitmix64 finalizer: a handful of integer operations that
+    still spread flows differing in one port bit evenly over the paths of a group.
+    """
+    key = (src << 32 | dst) ^ ((protocol << 32 | sport << 16 | dport) * 0x9E3779B97F4A7C15 & M64)
+    key = (key ^ key >> 30) * 0xBF58476D1CE4E5B9 & M64
+    key = (key ^ key >> 27) * 0x94D049BB133111EB & M64
+    return (key ^ key >> 31) & 0xFFFFFFFF
+
+class NextHopGroup:
+    """ immutable, sorted and deduplicated "nexthop iface" paths of an ECMP route
+
+    Get groups from next_hop_group() so that equal groups are the same object: routes then
+    compare and hash by identity and a million prefixes over one fabric share a few groups.
+    """
+    __slots__ = ("paths", "__weakref__")
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __str__(self):
+        return ", ".join(self.paths)
+
+    def __repr__(self):
+        return "NextHopGroup({})".format(", ".join(self.paths))
+
+    def select(self, flow):
+        """ path of the flow with flow_hash() value flow, the same flow always takes the same path """
+        return self.paths[flow * len(self.paths) >> 32]
+
+# Groups stay in the registry as long as a route uses them
+_groups = weakref.WeakValueDictionary()
+
+def next_hop_group(paths):
+    """ shared NextHopGroup of the "nexthop iface" paths, in any order and with duplicates """
+    paths = tuple(sorted(set(sys.intern(path) for path in paths)))
+    group = _groups.get(paths)
+    if group is None:
+        group = NextHopGroup(paths)
+        _groups[paths] = group
+    return group
@@ -0,0 +1,209 @@
+""" Overlapping and duplicate interface addresses across the routers of a Topology
+
+Two interface prefixes of the same VRF overlap when one contains the other. Prefixes never
+partially overlap, so after one sort the prefixes containing the current one form a stack and
+every overlap is found in O(n log n) plus the number of overlaps. The two ends of a link share
+their subnet, so the same prefix on connected interfaces with different addresses is allowed.
+"""
+from bisect import bisect_left, bisect_right, insort
+from Address import MASKS, parse_prefix, network_address
+from Events import ADDRESS_SET, ADDRESS_DELETED, INTERFACE_DELETED
+from Summarize import HOSTMASKS
+
+def _interface_prefixes(router):
+    """ yield ((router, interface), (VRF, network, prefix length, address)) of its addressed interfaces """
+    for interfaceName in router.getInterfaces():
+        configured = router.getAddress(interfaceName)
+        if configured is not None:
+            address, length = configured
+            yield (router, interfaceName), (router.getVrf(interfaceName), network_address(address, length), length, address)
+
+def _sweep(prefixes):
+    """ yield every (endpoint, endpoint) pair whose prefixes overlap, prefixes is {endpoint: (VRF, network, length, address)} """
+    groups = {}
+    for endpoint, (vrf, network, length, address) in prefixes.items():
+        groups.setdefault(vrf, {}).setdefault(network << 6 | length, []).append(endpoint)
+
+    for keys in groups.values():
+        # (last address, endpoints) of the prefixes containing the current one
+        stack = []
+        for key in sorted(keys):
+            network, length = key >> 6, key & 63
+            endpoints = keys[key]
+            while stack and stack[-1][0] < network:
+                stack.pop()
+            for last, others in stack:
+                for other in others:
+                    for endpoint in endpoints:
+                        yield other, endpoint
+            for index, endpoint in enumerate(endpoints):
+                for other in endpoints[index + 1:]:
+                    yield endpoint, other
+            stack.append((network | HOSTMASKS[length], endpoints))
+
+def _allowed(topology, endpoint, prefix, other, otherPrefix):
+    """ both ends of one link in the same subnet with their own address """
+    return prefix[1:3] == otherPrefix[1:3] and prefix[3] != otherPrefix[3] and \
+        endpoint[0].topology is topology and topology.neighbor(*endpoint) == other
+
+def _describe(endpoint):
+    router, interfaceName = endpoint
+    return router.getHostname(), interfaceName, router.getInterfaces()[interfaceName]
+
+def _report(pairs):
+    """ sorted [((hostname, interface, ip), (hostname, interface, ip))] of endpoint pairs, each pair once """
+    return sorted(set(tuple(sorted((_describe(endpoint), _describe(other)))) for endpoint, other in pairs))
+
+def find_overlaps(topology):
+    """ every pair of overlapping interface prefixes of the topology as ((hostname, interface, ip), (hostname, interface, ip)) """
+    prefixes = {}
+    for router in topology.getRouters().values():
+        prefixes.update(_interface_prefixes(router))
+    return _report((endpoint, other) for endpoint, other in _sweep(prefixes)
+                   if not _allowed(topology, endpoint, prefixes[endpoint], other, prefixes[other]))
+
+class OverlapDetector:
+    """ overlaps of a Topology kept up to date from the address events of its routers
+
+    Routers joining or leaving the topology afterwards are watched or dropped as the topology
+    reports them, addRouter() and removeRouter() do the same for routers outside it.
+    """
+
+    def __init__(self, topology):
+        self.__topology = topology
+
+        # (router, interface) -> (VRF, network, prefix length, address)
+        self.__prefixes = {}
+
+        # (VRF, network, prefix length) -> [(router, interface)]
+        self.__owners = {}
+
+        # VRF -> sorted network << 6 | length of its prefixes
+        self.__keys = {}
+
+        # (router, interface) -> set of (router, interface) it overlaps with
+        self.__conflicts = {}
+        self.__subscriptions = {}
+
+        # The initial state is one sweep, later changes are indexed one prefix at a time
+        for router in topology.getRouters().values():
+            self.__prefixes.update(_interface_prefixes(router))
+            self.__watch(router)
+        for endpoint, (vrf, network, length, address) in self.__prefixes.items():
+            self.__owners.setdefault((vrf, network, length), []).append(endpoint)
+        for vrf, network, length in self.__owners:
+            self.__keys.setdefault(vrf, []).append(network << 6 | length)
+        for keys in self.__keys.values():
+            keys.sort()
+        for endpoint, other in _sweep(self.__prefixes):
+            if not _allowed(topology, endpoint, self.__prefixes[endpoint], other, self.__prefixes[other]):
+                self.__link(endpoint, other)
+        topology.addListener(self)
+
+    def __watch(self, router):
+        self.__subscriptions[router] = router.subscribe(self.__routerChanged, (ADDRESS_SET, ADDRESS_DELETED, INTERFACE_DELETED))
+
+    def addRouter(self, router):
+        if router in self.__subscriptions:
+            return False
+        self.__watch(router)
+        for endpoint, prefix in list(_interface_prefixes(router)):
+            self.__insert(endpoint, prefix)
+        return True
+
+    def removeRouter(self, router):
+        if router not in self.__subscriptions:
+            return False
+        self.__subscriptions.pop(router).unsubscribe()
+        for endpoint in [endpoint for endpoint in self.__prefixes if endpoint[0] is router]:
+            self.__remove(endpoint)
+        return True
+
+    # Index
+    def __link(self, endpoint, other):
+        self.__conflicts.setdefault(endpoint, set()).add(other)
+        self.__conflicts.setdefault(other, set()).add(endpoint)
+
+    def __overlapping(self, vrf, network, length):
+        """ endpoints whose prefix contains or is contained in network/length """
+        found = []
+        for shorter in range(length + 1):
+            found.extend(self.__owners.get((vrf, network & MASKS[shorter], shorter), ()))
+        keys = self.__keys.get(vrf, [])
+        start = bisect_left(keys, network << 6 | length + 1)
+        end = bisect_right(keys, (network | HOSTMASKS[length]) << 6 | 32)
+        for key in keys[start:end]:
+            found.extend(self.__owners[vrf, key >> 6, key & 63])
+        return found
+
+    def __insert(self, endpoint, prefix):
+        vrf, network, length, address = prefix
+        for other in self.__overlapping(vrf, network, length):
+            if not _allowed(self.__topology, endpoint, prefix, other, self.__prefixes[other]):
+                self.__link(endpoint, other)
+        self.__prefixes[endpoint] = prefix
+        owners = self.__owners.setdefault((vrf, network, length), [])
+        if not owners:
+            insort(self.__keys.setdefault(vrf, []), network << 6 | length)
+        owners.append(endpoint)
+
+    def __remove(self, endpoint):
+        prefix = self.__prefixes.pop(endpoint, None)
+        if prefix is None:
+            return
+        vrf, network, length, address = prefix
+        owners = self.__owners[vrf, network, length]
+        owners.remove(endpoint)
+        if not owners:
+            del self.__owners[vrf, network, length]
+            keys = self.__keys[vrf]
+            del keys[bisect_left(keys, network << 6 | length)]
+        for other in self.__conflicts.pop(endpoint, ()):
+            self.__conflicts[other].discard(endpoint)
+            if not self.__conflicts[other]:
+                del self.__conflicts[other]
+
+    def __update(self, router, interfaceName):
+        endpoint = (router, interfaceName)
+        self.__remove(endpoint)
+        configured = router.getAddress(interfaceName)
+        if configured is not None:
+            address, length = configured
+            self.__insert(endpoint, (router.getVrf(interfaceName), network_address(address, length), length, address))
+
+    def __routerChanged(self, event):
+        self.__update(event.router, event.key)
+
+    # Topology listener, a link decides whether the same subnet on both ends is allowed
+    def routerAdded(self, router):
+        self.addRouter(router)
+
+    def routerRemoved(self, router):
+        self.removeRouter(router)
+
+    def linkUp(self, router, local_int, remote_host, remote_int):
+        self.__update(router, local_int)
+        self.__update(remote_host, remote_int)
+
+    def linkDown(self, router, local_int, remote_host, remote_int):
+        self.__update(router, local_int)
+        self.__update(remote_host, remote_int)
+
+    # Results
+    def conflicts(self):
+        """ every overlapping pair as ((hostname, interface, ip), (hostname, interface, ip)) """
+        return _report((endpoint, other) for endpoint, others in self.__conflicts.items() for other in others)
+
+    def isClean(self):
+        return not self.__conflicts
+
+    def check(self, router, interfaceName, ip):
+        """ (hostname, interface, ip) of the interfaces ip would overlap with if it were set on the interface, without setting it """
+        parsed = parse_prefix(ip)
+        if parsed is None:
+            return []
+        address, length = parsed
+        prefix = (router.getVrf(interfaceName), network_address(address, length), length, address)
+        endpoint = (router, interfaceName)
+        return sorted(_describe(other) for other in self.__overlapping(*prefix[:3])
+                      if other != endpoint and not _allowed(self.__topology, endpoint, prefix, other, self.__prefixes[other]))
@@ -0,0 +1,151 @@
+""" Stream routes from "show ip route" text or CSV files into a Router """
+import re
+
+# Protocol code, destination, optional prefix length, and the rest of the line
+ROUTE_LINE = re.compile(r"^([A-Za-z][A-Za-z*+%]*(?: (?:IA|N1|N2|E1|E2|EX|L1|L2|ia|su))?)\s+(\d+\.\d+\.\d+\.\d+)(/\d+)?(?:\s+(.*))?$")
+SUBNETTED_LINE = re.compile(r"^\s+\d+\.\d+\.\d+\.\d+(/\d+)? is (?:variably )?subnetted")
+ECMP_LINE = re.compile(r"^\s+\[\d+/\d+\] via (\d+\.\d+\.\d+\.\d+)(.*)$")
+
+NOISE = ("Codes:", "Gateway of last resort", "Routing Table:", "Routing entry")
+
+def _outgoing_interface(rest):
+    """ interface at the end of ", 00:12:33, GigabitEthernet0/1", empty when the route has none """
+    last = rest.rsplit(",", 1)[-1].strip()
+    if last and last[0].isalpha():
+        return last
+    return ""
+
+def parse_route_line(line, mask=""):
+    """ parse one route line into (destination, nexthop, interface), return None when it is not a route """
+    if line[:1].isdigit():
+        # CSV "destination,nexthop[,interface]"
+        fields = line.replace(" ", "").split(",")
+        if len(fields) == 3:
+            return tuple(fields)
+        if len(fields) == 2:
+            return fields[0], fields[1], ""
+        return None
+
+    match = ROUTE_LINE.match(line)
+    if match is None:
+        return None
+    code, destination, length, rest = match.groups()
+    destination += length or mask
+    rest = rest or ""
+
+    if rest.startswith("is directly connected,"):
+        return destination, "directly connected", _outgoing_interface(rest)
+    via = rest.find("via ")
+    if via == -1:
+        return None
+    nexthop = rest[via + 4:].split(",", 1)[0].strip()
+    return destination, nexthop, _outgoing_interface(rest[via:]) if "," in rest else ""
+
+def parse_routes(lines):
+    """ yield (line number, line, route) for every line, route is None when the line can't be parsed
+
+    Legend lines and subnet headers are skipped. Extra equal-cost paths below a route are yielded
+    as (None, nexthop, interface), another path of the route before them. A prefix wrapped onto
+    the next line, "[110/20] via ..." below it, is yielded once as the two lines joined.
+    """
+    mask = ""
+
+    # (line number, line) of a prefix without its path, waiting for the line that continues it
+    wrapped = None
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if wrapped is not None:
+            prefix_lineno, prefix = wrapped
+            wrapped = None
+            if ECMP_LINE.match(line):
+                joined = prefix + " " + line.strip()
+                yield prefix_lineno, joined, parse_route_line(joined, mask)
+                continue
+            yield prefix_lineno, prefix, None
+
+        if line[:1].isdigit():
+            yield lineno, line, parse_route_line(line)
+            continue
+
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#") or stripped.startswith(NOISE):
+            continue
+
+        # "172.16.0.0/24 is subnetted" gives the mask of the classful routes below it
+        subnetted = SUBNETTED_LINE.match(line)
+        if subnetted:
+            mask = subnetted.group(1) or ""
+            continue
+        ecmp = ECMP_LINE.match(line)
+        if ecmp:
+            nexthop, rest = ecmp.groups()
+            yield lineno, line, (None, nexthop, _outgoing_interface(rest) if "," in rest else "")
+            continue
+        if line[0].isspace() and " - " in line:
+            continue
+        if lineno == 1 and "," in line and not line[0].isdigit():
+            # CSV header
+            continue
+
+        match = ROUTE_LINE.match(stripped)
+        if match is not None and not match.group(4):
+            wrapped = lineno, stripped
+            continue
+        yield lineno, line, parse_route_line(stripped, mask)
+
+    if wrapped is not None:
+        yield wrapped[0], wrapped[1], None
+
+def load_routes(router, source, batch_size=10000, vrf=None):
+    """ load routes from a file path or an iterable of lines, return (number of routes loaded, [(line number, line, reason)]) """
+    if isinstance(source, str):
+        with open(source) as lines:
+            return load_routes(router, lines, batch_size, vrf)
+    return load_parsed_routes(router, parse_routes(source), batch_size, vrf)
+
+def load_parsed_routes(router, parsed, batch_size=10000, vrf=None):
+    """ add (line number, line, route) from parse_routes to router, return (number of routes loaded, [(line number, line, reason)])
+
+    Extra equal-cost paths are added to the route before them, which becomes an ECMP route.
+    """
+    loaded = 0
+    rejected = []
+    batch = []
+    origin = []
+
+    # Whether the last line was a route in batch that more paths can join
+    open_route = False
+
+    def flush():
+        failed = router.addRoutes(batch, batch_size, vrf)
+        for index, route, reason in failed:
+            rejected.append(origin[index] + (reason,))
+        return len(batch) - len(failed)
+
+    for lineno, line, route in parsed:
+        if route is None:
+            rejected.append((lineno, line, "unrecognised line"))
+            open_route = False
+            continue
+        if route[0] is None:
+            if not open_route:
+                rejected.append((lineno, line, "path without a route"))
+                continue
+            dst, paths = batch[-1][0], batch[-1][1]
+            if isinstance(paths, str):
+                paths = [(paths, batch[-1][2] if len(batch[-1]) > 2 else "")]
+            batch[-1] = (dst, paths + [route[1:]])
+            continue
+
+        # Batches are sent before a new route so the paths of the last one can still join it
+        if len(batch) >= batch_size:
+            loaded += flush()
+            batch = []
+            origin = []
+        batch.append(route)
+        origin.append((lineno, line))
+        open_route = True
+
+    loaded += flush()
+    rejected.sort()
+    return loaded, rejected
@@ -0,0 +1,512 @@
+""" Compact routing table storage: parallel typed arrays sorted by (network, prefix length) """
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from contextlib import contextmanager
+from collections.abc import ItemsView, MutableMapping
+from itertools import repeat
+from operator import and_, lshift, or_, rshift
+from Address import MASKS, ip_to_int, int_to_ip, parse_prefix, format_prefix
+from NextHop import NextHopGroup
+
+# Next hop value of "directly connected" routes
+DIRECT = 0xFFFFFFFF
+
+# Interface index of ECMP rows, their next hop column is an index into the table's groups.
+# Index 0 is "", so a table holds at most MAX_INTERFACES named interfaces
+GROUP = 0xFFFF
+MAX_INTERFACES = GROUP - 1
+
+# Pending changes are merged into the arrays once there are FLUSH_SIZE of them, or half of the
+# table when it is bigger, so loads only rebuild the arrays a logarithmic number of times. Inside
+# bulk() they wait for the end of the load and are merged once
+FLUSH_SIZE = 65536
+
+# A flush rebuilds every row at C speed when the changes are at least 1/REBUILD_SHARE of the
+# table, below that it copies the rows between changes, paying a bisect per change
+REBUILD_SHARE = 16
+
+# Rows compared at once when diff() skips over the parts two tables have in common
+DIFF_RUN = 64
+
+# Type codes of the networks, lengths, nexthops and ifaces columns
+TYPECODES = ("I", "B", "I", "H")
+
+def _copy(column, source, start, end):
+    """ append source[start:end] to column as one memory copy """
+    size = column.itemsize
+    column.frombytes(memoryview(source).cast("B")[start * size:end * size])
+
+class RouteEntry:
+    """ read-only view of one row of an ArrayRouteTable, valid until the table is changed """
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        object.__setattr__(self, "_table", table)
+        object.__setattr__(self, "_index", index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RouteEntry is read-only")
+
+    def __repr__(self):
+        if self.group is not None:
+            return "RouteEntry({} via {})".format(self.prefix, self.group)
+        return "RouteEntry({} via {} {})".format(self.prefix, self.nexthop, self.iface)
+
+    @property
+    def network(self):
+        return self._table.networks[self._index]
+
+    @property
+    def length(self):
+        return self._table.lengths[self._index]
+
+    @property
+    def prefix(self):
+        return format_prefix(self.network, self.length)
+
+    @property
+    def group(self):
+        """ NextHopGroup of an ECMP route, None for a single path """
+        if self._table.ifaces[self._index] != GROUP:
+            return None
+        return self._table.groups[self._table.nexthops[self._index]]
+
+    @property
+    def nexthop(self):
+        """ next hop, the one of the first path of an ECMP route """
+        group = self.group
+        if group is not None:
+            return group.paths[0].rsplit(" ", 1)[0]
+        return self._table.nexthopName(self._table.nexthops[self._index])
+
+    @property
+    def iface(self):
+        group = self.group
+        if group is not None:
+            return group.paths[0].rsplit(" ", 1)[1]
+        return self._table.interfaces[self._table.ifaces[self._index]]
+
+class _Keys:
+    """ sort keys of the table rows for bisect """
+    __slots__ = ("networks", "lengths")
+
+    def __init__(self, networks, lengths):
+        self.networks = networks
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.networks)
+
+    def __getitem__(self, index):
+        return self.networks[index] << 8 | self.lengths[index]
+
+class _ItemsView(ItemsView):
+    """ items() of an ArrayRouteTable, iterated in prefix order without searching for every key """
+
+    def __iter__(self):
+        return self._mapping._items()
+
+class ArrayRouteTable(MutableMapping):
+    """ Router routing table with the same "a.b.c.d/n" -> "nexthop iface" mapping interface as a dict
+
+    Rows live in four parallel arrays (uint32 network, uint8 prefix length, uint32 next hop,
+    uint16 interned interface index), so a route costs 11 bytes instead of two Python strings.
+    ECMP rows store the index of their NextHopGroup in groups as next hop and GROUP as interface.
+    Writes are collected in a small pending dict of packed ints, network << 8 | length to
+    nexthop << 16 | iface, and merged into the sorted arrays in one pass. Groups no route uses
+    any more are dropped by the flush that removes their last row.
+
+    Lookups need no index of Python objects either: every flush sweeps the rows into sorted,
+    non-overlapping address ranges (starts, row index), so match() is one bisect plus a probe of
+    the pending dict per pending prefix length. Loads are fastest through Router.addRoutes or
+    bulk(), routes added one at a time pay for the merges.
+    """
+
+    def __init__(self):
+        self.networks = array("I")
+        self.lengths = array("B")
+        self.nexthops = array("I")
+        self.ifaces = array("H")
+        self.interfaces = [""]
+        self.__interfaceIndex = {"": 0}
+        self.groups = []
+        self.__groupIndex = {}
+
+        # Rows using each group, None until counted for tables made by fromColumns
+        self.__groupRefs = []
+        self.__default = "not set"
+        self.__pending = {}
+        self.__encoded = {}
+        self.__bulkDepth = 0
+
+        # Prefix lengths set since the last flush, longest first, and the ranges of the arrays
+        self.__pendingLengths = []
+        self.__ranges = None
+
+    @classmethod
+    def fromColumns(cls, networks, lengths, nexthops, ifaces, interfaces, default="not set", groups=()):
+        """ table over existing sorted columns such as memoryviews of a snapshot, they are only copied by the first flush that changes them """
+        table = cls()
+        table.networks, table.lengths, table.nexthops, table.ifaces = networks, lengths, nexthops, ifaces
+        table.interfaces = list(interfaces)
+        table.__interfaceIndex = dict((name, index) for index, name in enumerate(table.interfaces))
+        table.groups = list(groups)
+        table.__groupIndex = dict((group, index) for index, group in enumerate(table.groups))
+        table.__groupRefs = None if table.groups else []
+        table.__default = default
+        return table
+
+    # Encoding
+    def nexthopName(self, value):
+        return "directly connected" if value == DIRECT else int_to_ip(value)
+
+    def __encode(self, route):
+        # Many routes share a next hop, so each distinct route string is encoded once
+        if route in self.__encoded:
+            return self.__encoded[route]
+        if isinstance(route, NextHopGroup):
+            if route not in self.__groupIndex:
+                self.__countGroups()
+                self.__groupIndex[route] = len(self.groups)
+                self.groups.append(route)
+                self.__groupRefs.append(0)
+            return self.__groupIndex[route] << 16 | GROUP
+        nexthop, iface = route.rsplit(" ", 1)
+        if iface not in self.__interfaceIndex:
+            if len(self.interfaces) > MAX_INTERFACES:
+                raise OverflowError("an ArrayRouteTable holds at most {} interfaces".format(MAX_INTERFACES))
+            self.__interfaceIndex[iface] = len(self.interfaces)
+            self.interfaces.append(iface)
+        encoded = (DIRECT if nexthop == "directly connected" else ip_to_int(nexthop)) << 16 | self.__interfaceIndex[iface]
+        self.__encoded[route] = encoded
+        return encoded
+
+    def __decode(self, nexthop, iface):
+        if iface == GROUP:
+            return self.groups[nexthop]
+        return self.nexthopName(nexthop) + " " + self.interfaces[iface]
+
+    # Groups
+    def __countGroups(self):
+        """ count the rows of every group when a table made by fromColumns is first changed """
+        if self.__groupRefs is None:
+            counts = Counter(nexthop for nexthop, iface in zip(self.nexthops, self.ifaces) if iface == GROUP)
+            self.__groupRefs = [counts[index] for index in range(len(self.groups))]
+
+    def __dropGroups(self):
+        """ forget groups without rows once they are half of all groups, renumbering the rows of the others """
+        unused = self.__groupRefs.count(0)
+        if not unused or unused * 2 < len(self.groups):
+            return
+        live = [index for index, refs in enumerate(self.__groupRefs) if refs]
+        renumber = dict((old, new) for new, old in enumerate(live))
+        if live:
+            for index, iface in enumerate(self.ifaces):
+                if iface == GROUP:
+                    self.nexthops[index] = renumber[self.nexthops[index]]
+        self.groups = [self.groups[index] for index in live]
+        self.__groupRefs = [self.__groupRefs[index] for index in live]
+        self.__groupIndex = dict((group, index) for index, group in enumerate(self.groups))
+
+    # Row search
+    def __find(self, network, length):
+        """ row index of network/length, -1 when it is not stored in the arrays """
+        index = bisect_left(_Keys(self.networks, self.lengths), network << 8 | length)
+        if index < len(self.networks) and self.networks[index] == network and self.lengths[index] == length:
+            return index
+        return -1
+
+    def __key(self, dst):
+        """ packed network << 8 | length of dst """
+        parsed = parse_prefix(dst)
+        if parsed is None:
+            raise KeyError(dst)
+        return parsed[0] << 8 | parsed[1]
+
+    def flush(self):
+        """ merge pending changes into the sorted arrays """
+        if not self.__pending:
+            return
+        changes = self.__pending
+        self.__pending = {}
+        self.__pendingLengths = []
+        self.__countGroups()
+        self.__merge(changes)
+        self.__ranges = self.__sweep()
+
+    def __merge(self, changes):
+        """ write changes into the arrays """
+
+        if len(changes) * REBUILD_SHARE >= len(self.networks):
+            # Rebuild every row when the change set is a good share of the table. Rows are packed
+            # like the pending changes with C level maps, no tuple is made per row
+            keys = map(or_, map(lshift, self.networks, repeat(8)), self.lengths)
+            if None not in changes.values() and changes.keys().isdisjoint(keys):
+                self.__insert(changes)
+                return
+            rows = dict(zip(map(or_, map(lshift, self.networks, repeat(8)), self.lengths),
+                            map(or_, map(lshift, self.nexthops, repeat(16)), self.ifaces)))
+            for key, value in changes.items():
+                if value is None:
+                    rows.pop(key, None)
+                else:
+                    rows[key] = value
+            keys = sorted(rows)
+            values = list(map(rows.__getitem__, keys))
+            del rows
+            self.networks = array("I", map(rshift, keys, repeat(8)))
+            self.lengths = array("B", map(and_, keys, repeat(0xFF)))
+            self.nexthops = array("I", map(rshift, values, repeat(16)))
+            self.ifaces = array("H", map(and_, values, repeat(0xFFFF)))
+            if self.groups:
+                counts = Counter(value >> 16 for value in values if value & 0xFFFF == GROUP)
+                self.__groupRefs = [counts[index] for index in range(len(self.groups))]
+                self.__dropGroups()
+            return
+
+        old = (self.networks, self.lengths, self.nexthops, self.ifaces)
+        new = tuple(array(typecode) for typecode in TYPECODES)
+        refs = self.__groupRefs
+        keys = _Keys(self.networks, self.lengths)
+        start = 0
+        for key, value in sorted(changes.items()):
+            index = bisect_left(keys, key, start)
+
+            # Untouched rows are copied a slice at a time
+            for column, source in zip(new, old):
+                _copy(column, source, start, index)
+            if value is not None:
+                for column, item in zip(new, (key >> 8, key & 0xFF, value >> 16, value & 0xFFFF)):
+                    column.append(item)
+                if value & 0xFFFF == GROUP:
+                    refs[value >> 16] += 1
+            start = index
+            if index < len(keys) and keys[index] == key:
+                if old[3][index] == GROUP:
+                    refs[old[2][index]] -= 1
+                start += 1
+
+        for column, source in zip(new, old):
+            _copy(column, source, start, len(source))
+        self.networks, self.lengths, self.nexthops, self.ifaces = new
+        if self.groups:
+            self.__dropGroups()
+
+    def __insert(self, changes):
+        """ merge changes that only add new rows: key and value of every row in one int, one sort """
+        rows = list(map(or_, map(lshift, map(or_, map(lshift, self.networks, repeat(8)), self.lengths), repeat(48)),
+                        map(or_, map(lshift, self.nexthops, repeat(16)), self.ifaces)))
+        rows.extend([key << 48 | value for key, value in changes.items()])
+        # The old rows are one sorted run, Timsort merges the changes in
+        rows.sort()
+        self.networks = array("I", map(rshift, rows, repeat(56)))
+        self.lengths = array("B", map(and_, map(rshift, rows, repeat(48)), repeat(0xFF)))
+        self.nexthops = array("I", map(and_, map(rshift, rows, repeat(16)), repeat(0xFFFFFFFF)))
+        self.ifaces = array("H", map(and_, rows, repeat(0xFFFF)))
+        refs = self.__groupRefs
+        for value in changes.values():
+            if value & 0xFFFF == GROUP:
+                refs[value >> 16] += 1
+
+    # Longest prefix match
+    def __sweep(self):
+        """ (starts, rows): row rows[i] is the longest prefix of every address from starts[i] up to the next start, -1 for none """
+        starts = array("I", [0])
+        rows = array("i", [-1])
+
+        # (first address after the prefix, row) of the prefixes containing the current one
+        stack = []
+
+        # Containing prefixes sort before the prefixes inside them
+        for row, (network, length) in enumerate(zip(self.networks, self.lengths)):
+            while stack and stack[-1][0] <= network:
+                end = stack.pop()[0]
+                parent = stack[-1][1] if stack else -1
+                if starts[-1] == end:
+                    rows[-1] = parent
+                else:
+                    starts.append(end)
+                    rows.append(parent)
+            if starts[-1] == network:
+                rows[-1] = row
+            else:
+                starts.append(network)
+                rows.append(row)
+            stack.append((network + (1 << (32 - length)), row))
+
+        while stack:
+            end = stack.pop()[0]
+            if end > 0xFFFFFFFF:
+                continue
+            parent = stack[-1][1] if stack else -1
+            if starts[-1] == end:
+                rows[-1] = parent
+            else:
+                starts.append(end)
+                rows.append(parent)
+        return starts, rows
+
+    def ranges(self):
+        """ (starts, rows) arrays of the address ranges of the table, see __sweep, after merging pending changes """
+        self.flush()
+        if self.__ranges is None:
+            self.__ranges = self.__sweep()
+        return self.__ranges
+
+    def match(self, address):
+        """ (network, length, route) of the longest stored prefix containing the uint32 address, None when none does
+
+        The default route is not a row, callers fall back to self["default"].
+        """
+        if self.__ranges is None:
+            self.__ranges = self.__sweep()
+        pending = self.__pending
+        found = None
+        if pending:
+            # Routes set since the last flush win over the rows they are longer than or replace
+            for length in self.__pendingLengths:
+                network = address & MASKS[length]
+                value = pending.get(network << 8 | length)
+                if value is not None:
+                    found = network, length, self.__decode(value >> 16, value & 0xFFFF)
+                    break
+
+        starts, rows = self.__ranges
+        row = rows[bisect_right(starts, address) - 1]
+        networks, lengths = self.networks, self.lengths
+        while row != -1 and (found is None or lengths[row] > found[1]):
+            network, length = networks[row], lengths[row]
+            if not pending or network << 8 | length not in pending:
+                return network, length, self.__decode(self.nexthops[row], self.ifaces[row])
+
+            # The row is deleted, the next shorter row containing address takes over
+            row = -1
+            for length in range(length - 1, 0, -1):
+                row = self.__find(address & MASKS[length], length)
+                if row != -1:
+                    break
+        return found
+
+    # Mapping interface
+    def __getitem__(self, dst):
+        if dst == "default":
+            return self.__default
+        key = self.__key(dst)
+        if key in self.__pending:
+            value = self.__pending[key]
+            if value is None:
+                raise KeyError(dst)
+            return self.__decode(value >> 16, value & 0xFFFF)
+        index = self.__find(key >> 8, key & 0xFF)
+        if index == -1:
+            raise KeyError(dst)
+        return self.__decode(self.nexthops[index], self.ifaces[index])
+
+    def __setitem__(self, dst, route):
+        if dst == "default":
+            self.__default = route
+            return
+        key = self.__key(dst)
+        self.setRoute(key >> 8, key & 0xFF, route)
+
+    def setRoute(self, network, length, route):
+        """ store the route of network/length, for callers that parsed the destination already """
+        self.__pending[network << 8 | length] = self.__encode(route)
+        if length not in self.__pendingLengths:
+            self.__pendingLengths.append(length)
+            self.__pendingLengths.sort(reverse=True)
+        if len(self.__pending) >= FLUSH_SIZE and len(self.__pending) * 2 >= len(self.networks) and not self.__bulkDepth:
+            self.flush()
+
+    @contextmanager
+    def bulk(self):
+        """ hold the writes of a load in the pending dict and merge them once when the outermost bulk() ends """
+        self.__bulkDepth += 1
+        try:
+            yield self
+        finally:
+            self.__bulkDepth -= 1
+            if self.__bulkDepth == 0:
+                self.flush()
+
+    def __delitem__(self, dst):
+        if dst == "default":
+            raise KeyError(dst)
+        key = self.__key(dst)
+        if key in self.__pending:
+            if self.__pending[key] is None:
+                raise KeyError(dst)
+        elif self.__find(key >> 8, key & 0xFF) == -1:
+            raise KeyError(dst)
+        self.__pending[key] = None
+
+    def __iter__(self):
+        self.flush()
+        yield "default"
+        networks, lengths = self.networks, self.lengths
+        for index in range(len(networks)):
+            yield format_prefix(networks[index], lengths[index])
+
+    def __len__(self):
+        self.flush()
+        return len(self.networks) + 1
+
+    def items(self):
+        """ view of the (destination, route) pairs, iterated in prefix order """
+        return _ItemsView(self)
+
+    def _items(self):
+        self.flush()
+        yield "default", self.__default
+        for index in range(len(self.networks)):
+            yield format_prefix(self.networks[index], self.lengths[index]), self.__decode(self.nexthops[index], self.ifaces[index])
+
+    def entries(self):
+        """ yield RouteEntry views in prefix order """
+        self.flush()
+        for index in range(len(self.networks)):
+            yield RouteEntry(self, index)
+
+    def diff(self, other):
+        """ yield ((network, length), old route, new route) in prefix order for the rows of other that differ from this table
+
+        old is None for rows only in other, new is None for rows only in this table.
+        """
+        self.flush()
+        other.flush()
+        mine = (self.networks, self.lengths, self.nexthops, self.ifaces)
+        theirs = (other.networks, other.lengths, other.nexthops, other.ifaces)
+        decode, otherDecode = self.__decode, other.__decode
+
+        # Interface and group indexes can only be compared directly when both tables interned the same ones
+        runs = self.interfaces == other.interfaces and self.groups == other.groups
+        i = j = 0
+        n, m = len(self.networks), len(other.networks)
+        while i < n and j < m:
+            # Unchanged stretches are skipped a run at a time with C level comparisons
+            if runs and i + DIFF_RUN <= n and j + DIFF_RUN <= m and \
+                    all(a[i:i + DIFF_RUN] == b[j:j + DIFF_RUN] for a, b in zip(mine, theirs)):
+                i += DIFF_RUN
+                j += DIFF_RUN
+                continue
+
+            key = (mine[0][i], mine[1][i])
+            otherKey = (theirs[0][j], theirs[1][j])
+            if key == otherKey:
+                old, new = decode(mine[2][i], mine[3][i]), otherDecode(theirs[2][j], theirs[3][j])
+                if old != new:
+                    yield key, old, new
+                i += 1
+                j += 1
+            elif key < otherKey:
+                yield key, decode(mine[2][i], mine[3][i]), None
+                i += 1
+            else:
+                yield otherKey, None, otherDecode(theirs[2][j], theirs[3][j])
+                j += 1
+
+        for index in range(i, n):
+            yield (mine[0][index], mine[1][index]), decode(mine[2][index], mine[3][index]), None
+        for index in range(j, m):
+            yield (theirs[0][index], theirs[1][index]), None, otherDecode(theirs[2][index], theirs[3][index])
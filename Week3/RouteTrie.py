@@ -0,0 +1,140 @@
+""" Compressed binary (Patricia) trie for longest prefix match on uint32 addresses """
+from Address import MASKS
+
+class _Node:
+    __slots__ = ("network", "length", "value", "left", "right")
+
+    def __init__(self, network, length, value=None):
+        self.network = network
+        self.length = length
+        self.value = value
+        self.left = None
+        self.right = None
+
+    def child(self, address):
+        """ child on the side of the bit right after this node's prefix """
+        if (address >> (31 - self.length)) & 1:
+            return self.right
+        return self.left
+
+    def setChild(self, address, node):
+        if (address >> (31 - self.length)) & 1:
+            self.right = node
+        else:
+            self.left = node
+
+def _common_length(a, b):
+    """ number of leading bits shared by two addresses """
+    return 32 - (a ^ b).bit_length()
+
+class RouteTrie:
+
+    def __init__(self):
+        # The root is a /0 glue node, so every prefix hangs below it
+        self.__root = _Node(0, 0)
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def insert(self, network, length, value):
+        """ add network/length or replace its value """
+        node = self.__root
+        while True:
+            if node.length == length:
+                if node.value is None:
+                    self.__size += 1
+                node.value = value
+                return
+
+            # Inlined node.child(network) and setChild, every added route walks this loop
+            right = (network >> (31 - node.length)) & 1
+            child = node.right if right else node.left
+            if child is None:
+                if right:
+                    node.right = _Node(network, length, value)
+                else:
+                    node.left = _Node(network, length, value)
+                self.__size += 1
+                return
+
+            if child.length <= length and network & MASKS[child.length] == child.network:
+                node = child
+                continue
+
+            common = min(length, _common_length(child.network, network))
+
+            # The new prefix splits the edge between node and child
+            if common == length:
+                middle = _Node(network, length, value)
+            else:
+                middle = _Node(network & MASKS[common], common)
+                middle.setChild(network, _Node(network, length, value))
+            middle.setChild(child.network, child)
+            node.setChild(network, middle)
+            self.__size += 1
+            return
+
+    def delete(self, network, length):
+        """ remove network/length, return False when it is not in the trie """
+        parent = grandparent = None
+        node = self.__root
+        masks = MASKS
+        while node is not None and node.length < length:
+            if network & masks[node.length] != node.network:
+                return False
+            grandparent, parent = parent, node
+            node = node.right if (network >> (31 - node.length)) & 1 else node.left
+
+        if node is None or node.length != length or node.network != network or node.value is None:
+            return False
+        node.value = None
+        self.__size -= 1
+
+        # Drop nodes that no longer split or hold anything
+        if node is self.__root or (node.left is not None and node.right is not None):
+            return True
+        remain = node.left if node.left is not None else node.right
+        parent.setChild(network, remain)
+        if remain is None and parent is not self.__root and parent.value is None:
+            grandparent.setChild(network, parent.left if parent.left is not None else parent.right)
+        return True
+
+    def get(self, network, length):
+        """ value stored for exactly network/length """
+        node = self.__root
+        while node is not None and node.length < length:
+            node = node.child(network)
+        if node is not None and node.length == length and node.network == network:
+            return node.value
+        return None
+
+    def lookup(self, address):
+        """ value of the longest prefix that contains address, None when nothing matches """
+        best = None
+        node = self.__root
+        masks = MASKS
+        while node is not None:
+            length = node.length
+            if address & masks[length] != node.network:
+                break
+            if node.value is not None:
+                best = node.value
+            if length == 32:
+                break
+
+            # Inlined node.child(address), this loop is the hot path
+            node = node.right if (address >> (31 - length)) & 1 else node.left
+        return best
+
+    def items(self):
+        """ yield (network, length, value) in prefix order """
+        stack = [self.__root]
+        while stack:
+            node = stack.pop()
+            if node.value is not None:
+                yield node.network, node.length, node.value
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
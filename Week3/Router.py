@@ -1,65 +1,145 @@
+import sys
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from termcolor import cprint
-import re
+from Address import ip_to_int, parse_prefix, format_prefix, network_address, broadcast_address
+from RouteTrie import RouteTrie
+from RouteTable import ArrayRouteTable
+from NextHop import NextHopGroup, next_hop_group, flow_hash
+from Show import show, interface_lines, cdp_lines, routing_lines
+from Events import Event, Subscription, HOSTNAME_CHANGED, INTERFACE_ADDED, INTERFACE_DELETED, ADDRESS_SET, \
+    ADDRESS_DELETED, ROUTE_ADDED, ROUTE_CHANGED, ROUTE_REMOVED, LINK_UP, LINK_DOWN, VRF_CHANGED
+
+class _Dependents:
+    """ reverse index of a routing table: the destinations routed through each interface and next hop """
+    __slots__ = ("interfaces", "nexthops", "addresses")
+
+    def __init__(self, routing):
+        # {interface: set of destinations}, {uint32 nexthop: set of destinations} of routes without an interface
+        self.interfaces = {}
+        self.nexthops = {}
+
+        # Sorted keys of nexthops for the next hops inside a subnet
+        self.addresses = []
+        for dst, route in routing.items():
+            self.add(dst, route)
+
+    @staticmethod
+    def paths(route):
+        return route.paths if isinstance(route, NextHopGroup) else (route,)
+
+    def add(self, dst, route):
+        if route == "not set":
+            return
+        for path in self.paths(route):
+            nexthop, iface = path.rsplit(" ", 1)
+            if iface:
+                self.interfaces.setdefault(iface, set()).add(dst)
+                continue
+            address = ip_to_int(nexthop)
+            # "directly connected" without an interface depends on nothing
+            if address is None:
+                continue
+            if address not in self.nexthops:
+                self.nexthops[address] = set()
+                insort(self.addresses, address)
+            self.nexthops[address].add(dst)
+
+    def discard(self, dst, route):
+        if route is None or route == "not set":
+            return
+        for path in self.paths(route):
+            nexthop, iface = path.rsplit(" ", 1)
+            if iface:
+                dsts = self.interfaces.get(iface)
+                key, index = iface, self.interfaces
+            else:
+                key = ip_to_int(nexthop)
+                if key is None:
+                    continue
+                dsts, index = self.nexthops.get(key), self.nexthops
+            if dsts is None:
+                continue
+            dsts.discard(dst)
+            if not dsts:
+                del index[key]
+                if index is self.nexthops:
+                    del self.addresses[bisect_left(self.addresses, key)]
+
+    def find(self, interfaceName, first=None, last=None):
+        """ destinations routed out of interfaceName or through a next hop between the addresses first and last """
+        found = set(self.interfaces.get(interfaceName, ()))
+        if first is not None:
+            for address in self.addresses[bisect_left(self.addresses, first):bisect_right(self.addresses, last)]:
+                found.update(self.nexthops[address])
+        return found
+
+class _Vrf:
+    """ routing table, learned routes and lookup structures of one VRF, name is None for the global table """
+    __slots__ = ("name", "routing", "sources", "trie", "compiled", "summary", "dependents")
+
+    def __init__(self, name, routing):
+        self.name = name
+        self.routing = routing
+
+        # Routes learned from other sources such as "ospf", {source: {destination: "nexthop iface"}}
+        self.sources = {}
+
+        # Dict tables keep their trie from the start so no lookup pays for building it, array tables
+        # match their rows themselves so theirs only holds the sources, other tables get theirs on the first lookup
+        self.trie = RouteTrie() if isinstance(routing, ArrayRouteTable) else None
+        if type(routing) is dict:
+            self.trie = RouteTrie()
+            for dst in routing:
+                if dst != "default":
+                    self.trie.insert(*parse_prefix(dst), dst)
+        self.compiled = None
+        self.summary = None
+
+        # _Dependents of the routing table, built by the first interface or address removal
+        self.dependents = None
 
 class Router:
 
-    def __init__(self, brand, model, os, hostname):
+    def __init__(self, brand, model, os, hostname, table=None):
         self.__brand = brand
         self.__model = model
         self.__os = os
         self.__hostname = hostname
         self.__interfaces = {}
+        self.__addresses = {}
         self.connection = {}
-        self.__routing = {"default" : "not set"}
-
-    def __find_network_and_broadcast(self, ip):
-        """ find network address and broadcast address where nw = network addr, bc = broadcast addr"""
-        address, mask = ip.split("/")
-        mask = int(mask)
-        binary = ""
-
-        decimal_address = [int(octet) for octet in address.split(".")]
-        
-        # Change decimal address to binary address
-        for number in decimal_address:
-            binary += bin(number)[2:].zfill(8)
-
-        # find the network address on binary address using subnet mask
-        bin_addr = binary[:mask]
-        remainder = 32 - len(bin_addr)
-        bin_nw = bin_addr + '0' * remainder
-        bin_bc = bin_addr + '1' * remainder
-
-        # Slice binary address every 8 indices for group and convert into decimal
-        dec_nw = re.findall('.' * 8, bin_nw)
-        dec_bc = re.findall('.' * 8, bin_bc)
-
-        # Convert binary address to decimal
-        nw = [str(int(dec, 2)) for dec in dec_nw]
-        bc = [str(int(dec, 2)) for dec in dec_bc]
-        
-        # Join list into network address by "."
-        nw = ".".join(nw) + "/" + str(32 - remainder)
-        bc = ".".join(bc) + "/" + str(32 - remainder)
-
-        return nw, bc
-
-    def __validateIP(self, ip, nw_addr, bc_addr):
-        checkNumber = True
-        ip, mask = ip.split("/")
-        for octet in ip.split("."):
-            if int(octet) > 255:
-                checkNumber = False
-                break
-
-        ip += "/" + str(mask)
-        if ip not in [nw_addr, bc_addr] and checkNumber and int(mask) <= 32:
-            return True
-        return False
+        self.topology = None
+        # table replaces the dict storage, e.g. with RouteTable.ArrayRouteTable for very large tables,
+        # VRFs get an empty table of the same type
+        self.__tableType = None if table is None or type(table) is dict else type(table)
+        self.__vrfs = {None: _Vrf(None, {"default" : "not set"} if table is None else table)}
+
+        # Interfaces bound to a VRF, {interface: VRF name}, the others are in the global table
+        self.__bindings = {}
+
+        # Bumped on every route, address or interface change so caches built on the router can tell they are stale
+        self.__version = 0
+
+        # Change event subscriptions, see subscribe()
+        self.__subscribers = []
+        self.__batchDepth = 0
+
+    def __validateIP(self, address, length):
+        """ host address must not be the network address or broadcast address of its subnet, /31 links and /32 loopbacks have neither """
+        return length >= 31 or address != network_address(address, length) and address != broadcast_address(address, length)
 
     # Hostname
     def setHostname(self, hostname):
+        # Hostnames are unique inside a topology
+        if self.topology is not None and not self.topology.canRename(self, hostname):
+            return False
+        old_hostname = self.__hostname
+        if old_hostname == hostname:
+            return True
         self.__hostname = hostname
+        self.__emit(HOSTNAME_CHANGED, None, old_hostname, hostname)
+        return True
 
     def getHostname(self):
         return self.__hostname
@@ -78,21 +158,33 @@ class Router:
     def addInterface(self, interfaceName):
         if interfaceName not in self.__interfaces:
             self.__interfaces[interfaceName] = "unassigned IP"
+            self.__version += 1
+            self.__emit(INTERFACE_ADDED, interfaceName, None, "unassigned IP")
             return True
         return False
 
     def deleteInterface(self, interfaceName):
         if interfaceName in self.__interfaces:
-            ip = self.__interfaces[interfaceName]
-            if ip != "unassigned IP":
-                self.deleteRoute(ip)
+            with self.batch():
+                # Routes out of the interface can't be forwarded anymore, the ones through its subnet neither
+                if interfaceName in self.__addresses:
+                    self.deleteIP(interfaceName, True)
+                vrf = self.__vrfs[self.__bindings.get(interfaceName)]
+                self.__removeDependents(vrf, self.__dependents(vrf).find(interfaceName), interfaceName)
+            self.__bindings.pop(interfaceName, None)
             del self.__interfaces[interfaceName]
+            self.__version += 1
+            self.__emit(INTERFACE_DELETED, interfaceName, "unassigned IP", None)
             return True
         return False
 
     def getInterfaces(self):
         return self.__interfaces
 
+    def getAddress(self, interfaceName):
+        """ (uint32 address, prefix length) configured on the interface, None when it has no IP """
+        return self.__addresses.get(interfaceName)
+
     # Connectivity
     def connect(self, local_int, remote_host, remote_int):
         local_int_exist = local_int in self.getInterfaces()
@@ -104,6 +196,8 @@ class Router:
         if local_int_exist and remote_int_exist and local_int_not_connected and remote_int_not_connected:
             self.connection[local_int] = [remote_host.getHostname(), remote_int]
             remote_host.connection[remote_int] = [self.getHostname(), local_int]
+            self.__emit(LINK_UP, local_int, None, (remote_host, remote_int))
+            remote_host.__emit(LINK_UP, remote_int, None, (self, local_int))
             return True
         return False
 
@@ -124,103 +218,629 @@ class Router:
         if local_int_exist and remote_int_exist and local_int_connect_to_remote_int and remote_int_connect_to_local_int:
             del self.connection[local_int]
             del remote_host.connection[remote_int]
+            self.__emit(LINK_DOWN, local_int, (remote_host, remote_int), None)
+            remote_host.__emit(LINK_DOWN, remote_int, (self, local_int), None)
             return True
         return False
 
     # Addressing
     def setIP(self, interfaceName, ip):
-        nw_address, bc_address = self.__find_network_and_broadcast(ip)
-        if interfaceName in self.__interfaces and self.__validateIP(ip, nw_address, bc_address):
+        parsed = parse_prefix(ip)
+        if interfaceName in self.__interfaces and parsed is not None and self.__validateIP(*parsed):
+            old_ip = self.__interfaces[interfaceName] if interfaceName in self.__addresses else None
             self.__interfaces[interfaceName] = ip
-            
+            self.__addresses[interfaceName] = parsed
+
             # Add directly connected
-            self.addRoute(nw_address, "directly connected", interfaceName)
+            vrf = self.__vrfs[self.__bindings.get(interfaceName)]
+            self.__installRoute(vrf, *self.__connectedNetwork(interfaceName), "directly connected", interfaceName)
+            self.__emit(ADDRESS_SET, interfaceName, old_ip, ip)
             return True
         return False
 
-    def deleteIP(self, interfaceName):
+    def deleteIP(self, interfaceName, cascade=False):
+        """ remove the interface address, with cascade also every route out of the interface or through its subnet """
 
         # Delete directly connected
-        if interfaceName in self.__interfaces and self.__interfaces[interfaceName] != "unassigned IP":
-            self.deleteRoute(self.__interfaces[interfaceName])
-            
+        if interfaceName in self.__addresses:
+            vrf = self.__vrfs[self.__bindings.get(interfaceName)]
+            network, length = self.__connectedNetwork(interfaceName)
+            with self.batch():
+                self.__removeRoute(vrf, network, length)
+                if cascade:
+                    dependents = self.__dependents(vrf).find(interfaceName, network, broadcast_address(network, length))
+                    self.__removeDependents(vrf, dependents, interfaceName, network, length)
+
             # Delete IP address
+            del self.__addresses[interfaceName]
+            old_ip = self.__interfaces[interfaceName]
             self.__interfaces[interfaceName] = "unassigned IP"
+            self.__emit(ADDRESS_DELETED, interfaceName, old_ip, None)
             return True
         return False
 
-    # Routing
-    def addRoute(self, dst, nexthop, iface=""):
+    def __dependents(self, vrf):
+        if vrf.dependents is None:
+            vrf.dependents = _Dependents(vrf.routing)
+        return vrf.dependents
+
+    def __removeDependents(self, vrf, dsts, interfaceName, network=None, length=None):
+        """ remove the paths of routes to dsts that go out of interfaceName or through network/length """
+        for dst in dsts:
+            route = vrf.routing[dst]
+            kept = []
+            for path in _Dependents.paths(route):
+                nexthop, iface = path.rsplit(" ", 1)
+                if iface != interfaceName and (iface or network is None or network_address(ip_to_int(nexthop), length) != network):
+                    kept.append((nexthop, iface))
+            parsed = (0, 0) if dst == "default" else parse_prefix(dst)
+            if kept:
+                # ECMP routes keep their other paths
+                self.__storeRoute(vrf, *parsed, self.__pathsRoute(kept))
+            else:
+                self.__removeRoute(vrf, *parsed)
+
+    def __connectedNetwork(self, interfaceName):
+        """ (network, prefix length) of the subnet configured on the interface """
+        address, length = self.__addresses[interfaceName]
+        return network_address(address, length), length
+
+    # VRF
+    def addVrf(self, name):
+        if name is None or name in self.__vrfs:
+            return False
+        self.__vrfs[name] = _Vrf(name, {"default" : "not set"} if self.__tableType is None else self.__tableType())
+        self.__version += 1
+        return True
+
+    def deleteVrf(self, name):
+        """ remove VRF name with its routes, its interfaces go back to the global table without their IP """
+        if name is None or name not in self.__vrfs:
+            return False
+        for interfaceName in [interfaceName for interfaceName, vrf in self.__bindings.items() if vrf == name]:
+            self.setVrf(interfaceName, None)
+        del self.__vrfs[name]
+        self.__version += 1
+        return True
+
+    def getVrfs(self):
+        return [name for name in self.__vrfs if name is not None]
+
+    def setVrf(self, interfaceName, vrf):
+        """ bind the interface to VRF vrf, None for the global table; like IOS this removes its IP address """
+        if interfaceName not in self.__interfaces or vrf not in self.__vrfs:
+            return False
+        old_vrf = self.__bindings.get(interfaceName)
+        if old_vrf == vrf:
+            return True
+        with self.batch():
+            # Routes of the old VRF out of the interface or through its subnet can't be forwarded anymore
+            self.deleteIP(interfaceName, True)
+            old = self.__vrfs[old_vrf]
+            self.__removeDependents(old, self.__dependents(old).find(interfaceName), interfaceName)
+        if vrf is None:
+            del self.__bindings[interfaceName]
+        else:
+            self.__bindings[interfaceName] = vrf
+        self.__version += 1
+        self.__emit(VRF_CHANGED, interfaceName, old_vrf, vrf)
+        return True
 
-        destination, mask = dst.split("/")
+    def getVrf(self, interfaceName):
+        """ VRF name the interface is bound to, None for the global table """
+        return self.__bindings.get(interfaceName)
 
-        # Validate destination address
-        for octet in destination.split("."):
-            if int(octet) > 255 or int(mask) > 32:
-                return False
+    # Routing
+    def addRoute(self, dst, nexthop, iface="", vrf=None):
+        if vrf not in self.__vrfs:
+            return False
+        checked = self.__checkDestination(dst)
+        if isinstance(checked, str) or self.__checkNexthop(nexthop, iface, vrf) is not None:
+            return False
+        self.__installRoute(self.__vrfs[vrf], *checked, nexthop, iface)
+        return True
+
+    def addEcmpRoute(self, dst, paths, vrf=None):
+        """ route dst over the equal-cost [(nexthop, interface)] paths, every path has to be valid """
+        if vrf not in self.__vrfs:
+            return False
+        checked = self.__checkDestination(dst)
+        if isinstance(checked, str) or not paths or \
+                any(self.__checkNexthop(nexthop, iface, vrf) is not None for nexthop, iface in paths):
+            return False
+        self.__storeRoute(self.__vrfs[vrf], *checked, self.__pathsRoute(paths))
+        return True
 
-        # Validate next hop
-        if nexthop != "directly connected":
-            for octet in nexthop.split("."):
-                if int(octet) > 255:
-                    return False
+    @staticmethod
+    def __pathsRoute(paths):
+        """ "nexthop iface" of a single path, the shared NextHopGroup of several """
+        routes = set(nexthop + " " + iface for nexthop, iface in paths)
+        if len(routes) == 1:
+            return sys.intern(routes.pop())
+        return next_hop_group(routes)
+
+    def addRoutes(self, routes, batch_size=10000, vrf=None):
+        """ add many routes, return [(index, route, reason)] of the rejected ones
+
+        Routes are (destination, nexthop[, interface]) or (destination, [(nexthop, interface)]) for ECMP routes.
+        """
+        if vrf not in self.__vrfs:
+            return [(index, route, "unknown vrf") for index, route in enumerate(routes)]
+        vrf = self.__vrfs[vrf]
+        with self.batch():
+            if isinstance(vrf.routing, ArrayRouteTable):
+                # One merge into the arrays for the whole load
+                with vrf.routing.bulk():
+                    return self.__addRoutes(vrf, routes, batch_size)
+            return self.__addRoutes(vrf, routes, batch_size)
+
+    def __addRoutes(self, vrf, routes, batch_size):
+        rejected = []
+        batch = []
+
+        # Tables reuse a handful of next hops, so each (nexthop, interface) pair is validated once
+        nexthop_reasons = {}
+
+        for index, route in enumerate(routes):
+            paths = [(route[1], route[2] if len(route) > 2 else "")] if isinstance(route[1], str) else route[1]
+            checked = None if paths else "no path"
+            for path in paths:
+                if path not in nexthop_reasons:
+                    nexthop_reasons[path] = self.__checkNexthop(*path, vrf.name)
+                checked = checked or nexthop_reasons[path]
+            checked = checked or self.__checkDestination(route[0])
+            if isinstance(checked, str):
+                rejected.append((index, route, checked))
+                continue
+            batch.append((checked[0], checked[1], paths))
+
+            # Install validated routes a batch at a time
+            if len(batch) >= batch_size:
+                self.__installBatch(vrf, batch)
+                batch = []
+
+        self.__installBatch(vrf, batch)
+        return rejected
+
+    def __installBatch(self, vrf, batch):
+        for network, length, paths in batch:
+            if len(paths) == 1:
+                self.__installRoute(vrf, network, length, *paths[0])
+            else:
+                self.__storeRoute(vrf, network, length, self.__pathsRoute(paths))
+
+    def __checkDestination(self, dst):
+        """ return (network, prefix length) of dst or the reason it is rejected """
+        parsed = parse_prefix(dst)
+        if parsed is None:
+            return "invalid destination"
+        address, length = parsed
+        return network_address(address, length), length
+
+    def __checkNexthop(self, nexthop, iface, vrf=None):
+        """ return the reason the nexthop or interface is rejected, None when they are valid """
+        if nexthop != "directly connected" and ip_to_int(nexthop) is None:
+            return "invalid nexthop"
 
         # Check that interface is existing
         if iface != "" and iface not in self.__interfaces:
+            return "unknown interface"
+        if iface != "" and self.__bindings.get(iface) != vrf:
+            return "interface in another vrf"
+        return None
+
+    def deleteRoute(self, dst, iface="", vrf=None):
+        parsed = parse_prefix(dst)
+        if parsed is None or vrf not in self.__vrfs:
             return False
+        address, length = parsed
+        return self.__removeRoute(self.__vrfs[vrf], network_address(address, length), length)
 
-        # Check if it default route
-        if dst == "0.0.0.0/0":
-            dst = "default"
+    def __installRoute(self, vrf, network, length, nexthop, iface):
+        # Default route has no interface
+        if length == 0:
             iface = ""
-        self.__routing[dst] = nexthop + " " + iface
-        return True
 
-    def deleteRoute(self, dst, iface=""):
-        if dst == "0.0.0.0/0":
-            self.__routing["default"] = "not set"
-            return True
+        # VRFs repeat the same prefixes and next hops, interned strings are stored once for all of them
+        self.__storeRoute(vrf, network, length, sys.intern(nexthop + " " + iface))
+
+    def __storeRoute(self, vrf, network, length, route):
+        """ set the "nexthop iface" or NextHopGroup route of network/length """
+        dst = "default" if length == 0 else sys.intern(format_prefix(network, length))
+        if self.__subscribers or vrf.dependents is not None:
+            old = vrf.routing.get(dst)
+            old = None if old == "not set" else old
+            self.__emit(ROUTE_ADDED if old is None else ROUTE_CHANGED, dst, old, route, vrf=vrf.name)
+            if vrf.dependents is not None:
+                vrf.dependents.discard(dst, old)
+                vrf.dependents.add(dst, route)
+        if length != 0 and isinstance(vrf.routing, ArrayRouteTable):
+            # The destination is parsed already
+            vrf.routing.setRoute(network, length, route)
         else:
-            nw, bc = self.__find_network_and_broadcast(dst)
-            if nw in self.__routing:
-                del self.__routing[nw]
-                return True
+            vrf.routing[dst] = route
+            if vrf.trie is not None and length != 0:
+                vrf.trie.insert(network, length, dst)
+        self.__version += 1
+
+    def __removeRoute(self, vrf, network, length):
+        self.__version += 1
+        routing = vrf.routing
+        if length == 0:
+            if routing["default"] != "not set":
+                self.__emit(ROUTE_REMOVED, "default", routing["default"], None, vrf=vrf.name)
+                if vrf.dependents is not None:
+                    vrf.dependents.discard("default", routing["default"])
+            routing["default"] = "not set"
+            return True
+
+        dst = format_prefix(network, length)
+        if dst in routing:
+            if self.__subscribers:
+                self.__emit(ROUTE_REMOVED, dst, routing[dst], None, vrf=vrf.name)
+            if vrf.dependents is not None:
+                vrf.dependents.discard(dst, routing[dst])
+            del routing[dst]
+            if vrf.trie is not None and not self.__trieHolds(vrf, dst):
+                vrf.trie.delete(network, length)
+            return True
+        return False
+
+    def __bestRoute(self, vrf, dst):
+        """ route used for dst, connected and static routes win over the ones learned from other sources """
+        if dst in vrf.routing:
+            return vrf.routing[dst]
+        for routes in vrf.sources.values():
+            if dst in routes:
+                return routes[dst]
+        return None
+
+    def __trieHolds(self, vrf, dst):
+        """ whether the trie of a VRF still needs dst, array tables leave their own rows out of it """
+        if not isinstance(vrf.routing, ArrayRouteTable) and dst in vrf.routing:
+            return True
+        return any(dst in routes for routes in vrf.sources.values())
+
+    def getRoute(self, source=None, vrf=None):
+        if vrf not in self.__vrfs:
+            return {}
+        if source is None:
+            return self.__vrfs[vrf].routing
+        return self.__vrfs[vrf].sources.get(source, {})
+
+    def getRouteSources(self, vrf=None):
+        if vrf not in self.__vrfs:
+            return []
+        return list(self.__vrfs[vrf].sources)
+
+    def setRoutes(self, source, routes, vrf=None):
+        """ replace every route learned from source with routes {destination: "nexthop iface"} """
+        if vrf not in self.__vrfs:
+            return False
+        current = self.__vrfs[vrf].sources.get(source, {})
+        changes = dict.fromkeys(dst for dst in current if dst not in routes)
+        changes.update((dst, route) for dst, route in routes.items() if current.get(dst) != route)
+        return self.updateRoutes(source, changes, vrf)
+
+    def updateRoutes(self, source, changes, vrf=None):
+        """ apply {destination: "nexthop iface", or None to withdraw it} to the routes learned from source """
+        if vrf not in self.__vrfs:
             return False
+        vrf = self.__vrfs[vrf]
+        routes = vrf.sources.setdefault(source, {})
+        with self.batch():
+            for dst, route in changes.items():
+                checked = self.__checkDestination(dst)
+                if isinstance(checked, str):
+                    continue
+
+                # Destinations are stored the way __installRoute writes them so both tables agree on keys
+                dst = sys.intern(format_prefix(*checked))
+                old = routes.get(dst)
+                if route is not None:
+                    route = sys.intern(route) if isinstance(route, str) else route
+                    routes[dst] = route
+                    if vrf.trie is not None:
+                        vrf.trie.insert(*checked, dst)
+                elif routes.pop(dst, None) is not None and vrf.trie is not None and not self.__trieHolds(vrf, dst):
+                    vrf.trie.delete(*checked)
+                if old != route:
+                    self.__emit(ROUTE_ADDED if old is None else ROUTE_REMOVED if route is None else ROUTE_CHANGED,
+                                dst, old, route, source, vrf.name)
+        self.__version += 1
+        return True
 
-    def getRoute(self):
-        return self.__routing
+    def diff(self, other, source=None, vrf=None):
+        """ yield (change, destination, old route, new route) in prefix order for every route that differs in other
 
-def show_interface(device):
-    """ print Device's interface(s)"""
-    device_hostname = device.getHostname()
-    device_int = device.getInterfaces()
-    print("Show interface(s) of {}".format(device_hostname))
-    print("{} has {} interface(s)".format(device_hostname, len(device_int)))
-    for iface in device_int:
-        print(iface, device_int[iface])
-    print()
+        change is "added", "removed" or "changed". Destinations are compared as (network, prefix length),
+        so "10.1.0.1/16" and "10.1.0.0/16" are the same route. The default route is reported as "default".
+        """
+        mine, theirs = self.getRoute(source, vrf), other.getRoute(source, vrf)
+        old, new = mine.get("default", "not set"), theirs.get("default", "not set")
+        if old != new:
+            yield ("added" if old == "not set" else "removed" if new == "not set" else "changed"), "default", \
+                None if old == "not set" else old, None if new == "not set" else new
 
-def show_cdp(device):
+        if isinstance(mine, ArrayRouteTable) and isinstance(theirs, ArrayRouteTable):
+            rows = mine.diff(theirs)
+        else:
+            rows = self.__diffRows(mine, theirs)
+        for key, old, new in rows:
+            yield ("added" if old is None else "removed" if new is None else "changed"), format_prefix(*key), old, new
+
+    @staticmethod
+    def __diffRows(mine, theirs):
+        """ sorted merge of the routes that are not identical under the same key in both tables """
+
+        # Identical (destination, route) pairs are dropped by one set operation, only what is left is normalized and sorted
+        old, new = {}, {}
+        for dst, route in mine.items() ^ theirs.items():
+            parsed = parse_prefix(dst)
+            if parsed is not None:
+                rows = old if mine.get(dst) == route else new
+                rows[network_address(*parsed), parsed[1]] = route
+        old, new = sorted(old.items()), sorted(new.items())
+        i = j = 0
+        while i < len(old) and j < len(new):
+            if old[i][0] == new[j][0]:
+                if old[i][1] != new[j][1]:
+                    yield old[i][0], old[i][1], new[j][1]
+                i += 1
+                j += 1
+            elif old[i][0] < new[j][0]:
+                yield old[i][0], old[i][1], None
+                i += 1
+            else:
+                yield new[j][0], None, new[j][1]
+                j += 1
+        for key, route in old[i:]:
+            yield key, route, None
+        for key, route in new[j:]:
+            yield key, None, route
+
+    # Change events
+    def subscribe(self, handler, kinds=None, batch=False, coalesce=False):
+        """ call handler(event) for every change, or for the kinds given, return the Subscription
+
+        Batched subscriptions get a list of events instead, once per change or once at the end of
+        the outermost batch(). coalesce also merges the events of a batch on the same thing.
+        """
+        subscription = Subscription(self, handler, kinds, batch, coalesce)
+        self.__subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.__subscribers:
+            self.__subscribers.remove(subscription)
+            return True
+        return False
+
+    @contextmanager
+    def batch(self):
+        """ hold the events of batched subscriptions until the outermost batch ends """
+        self.__batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.__batchDepth -= 1
+            if self.__batchDepth == 0:
+                for subscription in list(self.__subscribers):
+                    subscription.flush()
+
+    def __emit(self, kind, key, old=None, new=None, source=None, vrf=None):
+        # Nothing is built while nobody listens
+        if self.__subscribers:
+            event = Event(kind, self, key, old, new, source, vrf)
+            for subscription in list(self.__subscribers):
+                subscription.deliver(event, self.__batchDepth > 0)
+
+    def getVersion(self):
+        return self.__version
+
+    def lookup(self, ip, vrf=None, flow=None):
+        """ longest prefix match for ip in a VRF, return (destination, nexthop, interface) or None when there is no route
+
+        ECMP routes give the path of flow, a NextHop.flow_hash() value, or of the destination address alone.
+        """
+        address = ip_to_int(ip) if isinstance(ip, str) else ip
+        if address is None or vrf not in self.__vrfs:
+            return None
+        vrf = self.__vrfs[vrf]
+
+        # Tables without one get their trie here, __storeRoute/__removeRoute keep it in sync after that
+        if vrf.trie is None:
+            vrf.trie = RouteTrie()
+            for routes in [vrf.routing] + list(vrf.sources.values()):
+                for dst in routes:
+                    if dst != "default":
+                        vrf.trie.insert(*parse_prefix(dst), dst)
+
+        dst = vrf.trie.lookup(address)
+        if isinstance(vrf.routing, ArrayRouteTable):
+            # The rows are matched in the arrays, the trie only knows the sources. The routing
+            # table wins a tie like in __bestRoute
+            row = vrf.routing.match(address)
+            if row is not None and (dst is None or row[1] >= int(dst.rsplit("/", 1)[1])):
+                dst, route = format_prefix(row[0], row[1]), row[2]
+            elif dst is not None:
+                route = next(routes[dst] for routes in vrf.sources.values() if dst in routes)
+            else:
+                dst, route = "default", vrf.routing["default"]
+        else:
+            if dst is None:
+                dst = "default"
+            route = self.__bestRoute(vrf, dst)
+        if route == "not set":
+            return None
+        if isinstance(route, NextHopGroup):
+            route = route.select(flow_hash(0, address) if flow is None else flow)
+        nexthop, iface = route.rsplit(" ", 1)
+        return dst, nexthop, iface
+
+    def lookup_many(self, addresses, vrf=None, flows=None):
+        """ longest prefix match for a NumPy uint32 address array, return (nexthop array, interface index array) or None for an unknown VRF
+
+        Next hops are uint32 addresses, 0xFFFFFFFF for directly connected and 0 when there is no route.
+        Interface indexes point into list(getInterfaces()), -1 when the route has no interface.
+        ECMP routes give the same path as lookup: the one of flows, an array of NextHop.flow_hash()
+        values, or of the destination address alone.
+        """
+        from BatchLookup import CompiledTable
+
+        if vrf not in self.__vrfs:
+            return None
+        vrf = self.__vrfs[vrf]
+        if vrf.compiled is None or vrf.compiled[0] != self.__version:
+            vrf.compiled = (self.__version, self.__compileRoutes(vrf, CompiledTable))
+        return vrf.compiled[1].lookup(addresses, flows)
+
+    def __compileRoutes(self, vrf, CompiledTable):
+        from BatchLookup import GROUP
+
+        ifaceIndex = dict((interfaceName, index) for index, interfaceName in enumerate(self.__interfaces))
+        groups = {}
+
+        def encodePath(route):
+            nexthop, iface = route.rsplit(" ", 1)
+            return 0xFFFFFFFF if nexthop == "directly connected" else ip_to_int(nexthop), ifaceIndex.get(iface, -1)
+
+        def encode(route):
+            if isinstance(route, NextHopGroup):
+                # Groups are shared, each one is compiled once
+                if route not in groups:
+                    groups[route] = len(groups)
+                return groups[route], GROUP
+            return encodePath(route)
+
+        if isinstance(vrf.routing, ArrayRouteTable) and not any(vrf.sources.values()):
+            # Array tables are compiled from their own ranges, without a summary of parsed rows
+            table = vrf.routing
+            table.flush()
+            for group in table.groups:
+                groups[group] = len(groups)
+            default = table["default"]
+            default = (0, -1) if default == "not set" else encode(default)
+            return CompiledTable.fromArrayTable(table, ifaceIndex, default,
+                                                [[encodePath(path) for path in group.paths] for group in groups])
+
+        # The summarized table has the same lookup results with fewer ranges to compile
+        rows = self.__summarized(vrf)
+        default = rows.get((0, 0))
+        rows = [key + encode(route) for key, route in rows.items() if key != (0, 0)]
+        default = (0, -1) if default is None else encode(default)
+        return CompiledTable(rows, default, [[encodePath(path) for path in group.paths] for group in groups])
+
+    def __summarized(self, vrf):
+        """ {(network, length): route} of the summarized forwarding table of a VRF, cached until the next change """
+        from Summarize import summarize_routes
+
+        if vrf.summary is None or vrf.summary[0] != self.__version:
+            # Walk the sources from the least preferred so connected and static routes overwrite them
+            rows = {}
+            for routes in list(vrf.sources.values())[::-1] + [vrf.routing]:
+                for dst, route in routes.items():
+                    if dst != "default":
+                        address, length = parse_prefix(dst)
+                        rows[network_address(address, length), length] = route
+            if vrf.routing["default"] != "not set":
+                rows[0, 0] = vrf.routing["default"]
+            vrf.summary = (self.__version, summarize_routes(rows))
+        return vrf.summary[1]
+
+    def summarize(self, vrf=None):
+        """ smallest table {destination: "nexthop iface"} with the same lookup results as this router
+
+        Prefixes contained in one with the same route are dropped and sibling prefixes with the same
+        route are merged, over the routing table and every route source.
+        """
+        if vrf not in self.__vrfs:
+            return None
+        rows = self.__summarized(self.__vrfs[vrf])
+        table = {"default": rows.get((0, 0), "not set")}
+        for (network, length), route in sorted(rows.items()):
+            if length != 0:
+                table[format_prefix(network, length)] = route
+        return table
+
+    # Snapshot
+    def save(self, path):
+        """ write the router to a binary snapshot file, see Snapshot.py """
+        Router.saveAll(path, [self])
+
+    @staticmethod
+    def saveAll(path, routers):
+        from Snapshot import write_snapshot
+        write_snapshot(path, [router.__snapshot() for router in routers])
+
+    @classmethod
+    def load(cls, path):
+        """ first router of a snapshot file, None when path is not a snapshot """
+        routers = cls.loadAll(path)
+        return routers[0] if routers else None
+
+    @classmethod
+    def loadAll(cls, path):
+        """ every router of a snapshot file, their routing tables are ArrayRouteTables over the mapped file """
+        from Snapshot import read_snapshot
+
+        records = read_snapshot(path)
+        if records is None:
+            return None
+        return cls.fromRecords(records)
+
+    @classmethod
+    def fromRecords(cls, records):
+        """ routers of snapshot records, see Snapshot.write_snapshot for their layout """
+        return [cls.__restore(*record) for record in records]
+
+    def __snapshot(self):
+        interfaces = [(interfaceName,) + self.__addresses.get(interfaceName, (None, 0)) + (self.__bindings.get(interfaceName),)
+                      for interfaceName in self.__interfaces]
+        connections = [(local_int, remote_name, remote_int) for local_int, (remote_name, remote_int) in self.connection.items()]
+        tables = []
+        for name, vrf in self.__vrfs.items():
+            tables.append((name, None, vrf.routing))
+            tables.extend((name, source, routes) for source, routes in vrf.sources.items())
+        return self.__brand, self.__model, self.__os, self.__hostname, interfaces, connections, tables
+
+    @classmethod
+    def __restore(cls, brand, model, os, hostname, interfaces, connections, tables):
+        # The routing tables already hold the connected routes, so addresses are set without setIP
+        router = cls(brand, model, os, hostname, tables[0][2])
+        for vrf, source, table in tables[1:]:
+            if source is None:
+                router.__vrfs[vrf] = _Vrf(vrf, table)
+            else:
+                routes = dict((dst, route) for dst, route in table.items() if dst != "default")
+                router.__vrfs[vrf].sources[source] = routes
+                trie = router.__vrfs[vrf].trie
+                if trie is not None:
+                    for dst in routes:
+                        trie.insert(*parse_prefix(dst), dst)
+        for interfaceName, address, length, vrf in interfaces:
+            if address is None:
+                router.__interfaces[interfaceName] = "unassigned IP"
+            else:
+                router.__interfaces[interfaceName] = format_prefix(address, length)
+                router.__addresses[interfaceName] = (address, length)
+            if vrf is not None:
+                router.__bindings[interfaceName] = vrf
+        for local_int, remote_name, remote_int in connections:
+            router.connection[local_int] = [remote_name, remote_int]
+        return router
+
+def show_interface(device, **options):
+    """ print Device's interface(s), options are the filters and pagination of Show.show() """
+    show(interface_lines(device), **options)
+
+def show_cdp(device, **options):
     """ Show Device's connection"""
-    device_hostname = device.getHostname()
-    print("Show cdp of {}".format(device_hostname))
-    print("{} has {} neighbor(s)".format(device_hostname, len(device.connection)))
-    for iface in device.connection:
-        remotehost_info = device.connection[iface]
-        print("interface {} connect to {} on {}".format(iface, remotehost_info[0], remotehost_info[1]))
-    print()
-
-def show_routing(device):
+    show(cdp_lines(device), **options)
+
+def show_routing(device, vrf=None, **options):
     """ Show ip routing """
-    device_hostname = device.getHostname()
-    routing = device.getRoute()
-    print("Show routing table of {}".format(device_hostname))
-    print("Gateway of last resort is {}".format(routing["default"]))
-    for dst in routing:
-        if dst != "default":
-            nexthop = routing[dst]
-            print("{} via {}".format(dst, nexthop))
-    print()
+    show(routing_lines(device, vrf), **options)
 
 if __name__ == "__main__":
     rt1 = Router("Cisco", "c7200", "IOS", "R1")
@@ -0,0 +1,305 @@
+""" Link-state (OSPF-like) SPF over the links of a Topology with incremental recomputation """
+from array import array
+from heapq import heappush, heappop
+from Address import int_to_ip, format_prefix, network_address
+
+INFINITY = 0xFFFFFFFF
+
+def _connected_networks(router):
+    """ networks advertised by default: every connected subnet of the router in the global table """
+    networks = []
+    for interfaceName in router.getInterfaces():
+        configured = router.getAddress(interfaceName)
+        if configured is not None and router.getVrf(interfaceName) is None:
+            address, length = configured
+            networks.append((network_address(address, length), length))
+    return networks
+
+class _Tree:
+    """ shortest path tree of one source router, indexed by router number """
+    __slots__ = ("dist", "parent", "first")
+
+    def __init__(self, size):
+        self.dist = array("I", [INFINITY]) * size
+        self.parent = array("i", [-1]) * size
+        self.first = array("i", [-1]) * size
+
+class SPFEngine:
+    """ computes every router's shortest paths with Dijkstra and installs them as route source "ospf"
+
+    After run(), link changes reported by the Topology only re-run Dijkstra for the part of each
+    tree they touch: a lost tree link re-attaches the subtree below it, a new link relaxes outward
+    from its ends, which also advertise the subnets addressed since. Routers join and leave without
+    a full run, the slot of a removed router is taken by the next one added. Other address changes
+    need another run(), changes before the first run() are left for it.
+    """
+
+    def __init__(self, topology, source="ospf", cost=None, networks=None):
+        self.__topology = topology
+        self.__source = source
+        self.__cost = cost if cost is not None else (lambda router, iface: 1)
+        self.__networks = networks if networks is not None else _connected_networks
+        self.__routers = []
+        self.__index = {}
+        self.__trees = []
+
+        # Router numbers of removed routers, reused by the next routers added
+        self.__free = []
+        topology.addListener(self)
+
+    # Graph
+    def __linkCost(self, u, v):
+        """ (cost, local interface, remote interface) of the cheapest link from router u to router v """
+        best = None
+        router = self.__routers[u]
+        for local_int, (remote_host, remote_int) in self.__topology.neighbors(router).items():
+            if remote_host is self.__routers[v]:
+                candidate = (self.__cost(router, local_int), local_int, remote_int)
+                if best is None or candidate < best:
+                    best = candidate
+        return best
+
+    def __buildGraph(self):
+        self.__free = []
+        self.__routers = list(self.__topology.getRouters().values())
+        self.__index = dict((router, index) for index, router in enumerate(self.__routers))
+        self.__edges = [{} for router in self.__routers]
+        for router, local_int, remote_host, remote_int in self.__topology.links():
+            self.__updateEdge(self.__index[router], self.__index[remote_host])
+
+        # (network, length) -> router numbers that advertise it
+        self.__advertised = [self.__networks(router) for router in self.__routers]
+        self.__advertisers = {}
+        for index, networks in enumerate(self.__advertised):
+            for network in networks:
+                self.__advertisers.setdefault(network, []).append(index)
+
+    def __advertise(self, u, networks):
+        """ make router u advertise networks instead of what it did, return the networks that changed """
+        old, new = set(self.__advertised[u]), set(networks)
+        for network in old - new:
+            advertisers = self.__advertisers[network]
+            advertisers.remove(u)
+            if not advertisers:
+                del self.__advertisers[network]
+        for network in new - old:
+            self.__advertisers.setdefault(network, []).append(u)
+        self.__advertised[u] = networks
+        return old ^ new
+
+    def __updateEdge(self, u, v):
+        # Interface costs may differ at the two ends, so each direction is priced on its own
+        for a, b in ((u, v), (v, u)):
+            link = self.__linkCost(a, b)
+            if link is None:
+                self.__edges[a].pop(b, None)
+            else:
+                self.__edges[a][b] = link[0]
+
+    # Dijkstra
+    def __relax(self, s, tree, heap, changed):
+        dist, parent, first, edges = tree.dist, tree.parent, tree.first, self.__edges
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue
+            changed.add(u)
+            for v, cost in edges[u].items():
+                if d + cost < dist[v]:
+                    dist[v] = d + cost
+                    parent[v] = u
+                    first[v] = v if u == s else first[u]
+                    heappush(heap, (d + cost, v))
+
+    def __subtree(self, tree, root):
+        """ root and every router whose shortest path goes through it """
+        inside = {root}
+        parent = tree.parent
+
+        # Children are linked to their parent, so the walk only looks at the edges of the subtree
+        stack = [root]
+        while stack:
+            u = stack.pop()
+            for v in self.__edges[u]:
+                if parent[v] == u and v not in inside:
+                    inside.add(v)
+                    stack.append(v)
+        return inside
+
+    def __linkLost(self, s, tree, u, v):
+        """ re-attach the subtree that hung below link u-v, return the routers whose path changed """
+        if tree.parent[v] == u:
+            root = v
+        elif tree.parent[u] == v:
+            root = u
+        else:
+            return set()
+
+        inside = self.__subtree(tree, root)
+        for x in inside:
+            tree.dist[x] = INFINITY
+            tree.parent[x] = -1
+            tree.first[x] = -1
+
+        # Seed the subtree from the routers around it that still have a path
+        heap = []
+        for x in inside:
+            for y in self.__edges[x]:
+                cost = self.__edges[y][x]
+                if y not in inside and tree.dist[y] != INFINITY and tree.dist[y] + cost < tree.dist[x]:
+                    tree.dist[x] = tree.dist[y] + cost
+                    tree.parent[x] = y
+                    tree.first[x] = x if y == s else tree.first[y]
+        for x in inside:
+            if tree.dist[x] != INFINITY:
+                heap.append((tree.dist[x], x))
+        heap.sort()
+
+        changed = set(inside)
+        self.__relax(s, tree, heap, changed)
+        return changed
+
+    def __linkAdded(self, s, tree, u, v):
+        """ relax outward from a new or cheaper link u-v, return the routers whose path improved """
+        heap = []
+        for a, b in ((u, v), (v, u)):
+            cost = self.__edges[a].get(b)
+            if cost is not None and tree.dist[a] != INFINITY and tree.dist[a] + cost < tree.dist[b]:
+                tree.dist[b] = tree.dist[a] + cost
+                tree.parent[b] = a
+                tree.first[b] = b if a == s else tree.first[a]
+                heappush(heap, (tree.dist[b], b))
+        changed = set()
+        self.__relax(s, tree, heap, changed)
+        return changed
+
+    # Routes
+    def __route(self, s, tree, network):
+        """ "nexthop iface" of network seen from router s, None when it is unreachable or connected """
+        best = None
+        for index in self.__advertisers.get(network, ()):
+            if index == s:
+                return None
+            if tree.dist[index] != INFINITY and (best is None or tree.dist[index] < tree.dist[best]):
+                best = index
+        if best is None:
+            return None
+
+        neighbor = tree.first[best]
+        cost, local_int, remote_int = self.__linkCost(s, neighbor)
+        nexthop = self.__routers[neighbor].getAddress(remote_int)
+        if nexthop is None:
+            return None
+        return int_to_ip(nexthop[0]) + " " + local_int
+
+    def __install(self, s, changed, networks=()):
+        """ refresh the routes of router s for networks advertised by the changed routers and for networks """
+        tree = self.__trees[s]
+        networks = set(networks)
+        for index in changed:
+            networks.update(self.__advertised[index])
+        changes = {}
+        for network in networks:
+            changes[format_prefix(*network)] = self.__route(s, tree, network)
+        self.__routers[s].updateRoutes(self.__source, changes)
+
+    def run(self):
+        """ full SPF for every router of the topology """
+        self.__buildGraph()
+        size = len(self.__routers)
+        self.__trees = []
+        for s in range(size):
+            tree = _Tree(size)
+            tree.dist[s] = 0
+            self.__relax(s, tree, [(0, s)], set())
+            self.__trees.append(tree)
+
+            routes = {}
+            for network in self.__advertisers:
+                route = self.__route(s, tree, network)
+                if route is not None:
+                    routes[format_prefix(*network)] = route
+            self.__routers[s].setRoutes(self.__source, routes)
+
+    def getDistance(self, router, destination):
+        """ path cost from router to destination, None when it is unreachable """
+        distance = self.__trees[self.__index[router]].dist[self.__index[destination]]
+        return None if distance == INFINITY else distance
+
+    # Topology listener
+    def linkUp(self, router, local_int, remote_host, remote_int):
+        if not self.__trees:
+            return
+        if router not in self.__index or remote_host not in self.__index:
+            self.run()
+            return
+        u, v = self.__index[router], self.__index[remote_host]
+        self.__updateEdge(u, v)
+
+        # The link's interfaces are often addressed just before it comes up
+        networks = self.__advertise(u, self.__networks(router)) | self.__advertise(v, self.__networks(remote_host))
+        for s, tree in enumerate(self.__trees):
+            if tree is None:
+                continue
+            changed = self.__linkAdded(s, tree, u, v)
+            if changed or networks:
+                self.__install(s, changed, networks)
+
+    def linkDown(self, router, local_int, remote_host, remote_int):
+        if not self.__trees:
+            return
+        if router not in self.__index or remote_host not in self.__index:
+            self.run()
+            return
+        u, v = self.__index[router], self.__index[remote_host]
+        before = (self.__edges[u].get(v), self.__edges[v].get(u))
+        self.__updateEdge(u, v)
+
+        # A parallel link with the same cost keeps every tree as it is
+        if (self.__edges[u].get(v), self.__edges[v].get(u)) == before:
+            return
+        for s, tree in enumerate(self.__trees):
+            if tree is None:
+                continue
+            changed = self.__linkLost(s, tree, u, v)
+            if changed:
+                self.__install(s, changed)
+
+    def routerAdded(self, router):
+        """ give a router joining the topology its number and tree, its links are reported right after """
+        if not self.__trees or router in self.__index:
+            return
+        if self.__free:
+            s = self.__free.pop()
+            self.__routers[s] = router
+        else:
+            s = len(self.__routers)
+            self.__routers.append(router)
+            self.__edges.append({})
+            self.__advertised.append([])
+            for tree in self.__trees:
+                if tree is not None:
+                    tree.dist.append(INFINITY)
+                    tree.parent.append(-1)
+                    tree.first.append(-1)
+            self.__trees.append(None)
+        self.__index[router] = s
+        self.__advertise(s, self.__networks(router))
+
+        # Nothing is reachable until its links come up
+        tree = _Tree(len(self.__routers))
+        tree.dist[s] = 0
+        self.__trees[s] = tree
+        router.setRoutes(self.__source, {})
+
+    def routerRemoved(self, router):
+        """ forget a router that left the topology, its links are down already so no tree reaches it """
+        if not self.__trees or router not in self.__index:
+            return
+        s = self.__index.pop(router)
+        self.__advertise(s, [])
+        self.__routers[s] = None
+        self.__edges[s] = {}
+        self.__trees[s] = None
+        self.__free.append(s)
+        router.setRoutes(self.__source, {})
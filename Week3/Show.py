@@ -0,0 +1,125 @@
+""" Streaming show command renderers: lines come out one at a time in interface and prefix order
+
+Renderers are generators, so a million-route table is never held as text. filter_lines() works
+like IOS "| begin" / "| include" / "| exclude", page() cuts out one page and write_lines() sends
+the result to a file in large chunks instead of one print per line.
+"""
+import heapq
+import re
+import sys
+from itertools import islice
+from operator import itemgetter
+from Address import parse_prefix
+from RouteTable import ArrayRouteTable
+
+# Lines of one page and lines joined into one write
+PAGE_SIZE = 24
+CHUNK_SIZE = 4096
+
+_NUMBERS = re.compile(r"(\d+)")
+
+def interface_key(interfaceName):
+    """ sort key that puts "G0/2" before "G0/10" """
+    return tuple(int(part) if index % 2 else part for index, part in enumerate(_NUMBERS.split(interfaceName)))
+
+def _prefix_key(dst):
+    address, length = parse_prefix(dst)
+    return address << 6 | length
+
+def _sorted_routes(routes):
+    """ (destination, route) of a routing table in prefix order, without the default route """
+    if isinstance(routes, ArrayRouteTable):
+        # Rows are stored in prefix order already
+        return islice(routes.items(), 1, None)
+    return sorted(((dst, route) for dst, route in routes.items() if dst != "default"), key=lambda item: _prefix_key(item[0]))
+
+def interface_lines(device):
+    """ yield the lines of "show interface" """
+    device_hostname = device.getHostname()
+    device_int = device.getInterfaces()
+    yield "Show interface(s) of {}".format(device_hostname)
+    yield "{} has {} interface(s)".format(device_hostname, len(device_int))
+    for iface in sorted(device_int, key=interface_key):
+        yield "{} {}".format(iface, device_int[iface])
+    yield ""
+
+def cdp_lines(device):
+    """ yield the lines of "show cdp" """
+    device_hostname = device.getHostname()
+    yield "Show cdp of {}".format(device_hostname)
+    yield "{} has {} neighbor(s)".format(device_hostname, len(device.connection))
+    for iface in sorted(device.connection, key=interface_key):
+        remotehost_info = device.connection[iface]
+        yield "interface {} connect to {} on {}".format(iface, remotehost_info[0], remotehost_info[1])
+    yield ""
+
+def routing_lines(device, vrf=None):
+    """ yield the lines of "show ip route", the routing table and every route source merged in prefix order """
+    device_hostname = device.getHostname()
+    routing = device.getRoute(vrf=vrf)
+    if vrf is None:
+        yield "Show routing table of {}".format(device_hostname)
+    else:
+        yield "Show routing table of {} vrf {}".format(device_hostname, vrf)
+    yield "Gateway of last resort is {}".format(routing["default"])
+
+    sources = device.getRouteSources(vrf)
+    if not sources:
+        for dst, route in _sorted_routes(routing):
+            yield "{} via {}".format(dst, route)
+        yield ""
+        return
+
+    streams = [((_prefix_key(dst), dst, route, "") for dst, route in _sorted_routes(routing))]
+    for source in sources:
+        streams.append(((_prefix_key(dst), dst, route, " ({})".format(source))
+                        for dst, route in _sorted_routes(device.getRoute(source, vrf))))
+    for key, dst, route, source in heapq.merge(*streams, key=itemgetter(0)):
+        yield "{} via {}{}".format(dst, route, source)
+    yield ""
+
+def filter_lines(lines, begin=None, include=None, exclude=None):
+    """ lines from the first one matching regex begin, then only those matching include and not exclude """
+    if begin is not None:
+        pattern = re.compile(begin)
+        lines = iter(lines)
+        for line in lines:
+            if pattern.search(line):
+                yield from _include(_exclude([line], exclude), include)
+                break
+    yield from _include(_exclude(lines, exclude), include)
+
+def _include(lines, include):
+    if include is None:
+        return lines
+    return filter(re.compile(include).search, lines)
+
+def _exclude(lines, exclude):
+    if exclude is None:
+        return lines
+    pattern = re.compile(exclude)
+    return (line for line in lines if not pattern.search(line))
+
+def page(lines, number, size=PAGE_SIZE):
+    """ lines of page number, counted from 1, lines after it are never rendered """
+    return islice(lines, (number - 1) * size, number * size)
+
+def write_lines(lines, output=None, chunk=CHUNK_SIZE):
+    """ write lines to output, sys.stdout by default, chunk lines per write; return the number of lines written """
+    output = sys.stdout if output is None else output
+    lines = iter(lines)
+    count = 0
+    while True:
+        block = list(islice(lines, chunk))
+        if not block:
+            return count
+        block.append("")
+        output.write("\n".join(block))
+        count += len(block) - 1
+
+def show(lines, begin=None, include=None, exclude=None, page_number=None, page_size=PAGE_SIZE, output=None):
+    """ filter, paginate and write rendered lines, return the number of lines written """
+    lines = filter_lines(lines, begin, include, exclude)
+    if page_number is not None:
+        lines = page(lines, page_number, page_size)
+    return write_lines(lines, output)
@@ -0,0 +1,156 @@
+""" Build Routers and a Topology from IOS "sh ip int br", "sh ip route [vrf X]" and "show cdp nei" output
+
+Every parser takes a string or any iterable of lines (an open file, a socket reader, ...) and
+reads it one line at a time, so a device's routing table never has to be held as one string.
+"""
+import io
+import re
+from Address import ip_to_int, int_to_ip, parse_prefix, network_address
+from RouteLoader import parse_routes, load_parsed_routes
+from Router import Router
+from Topology import Topology
+
+# Full interface types, abbreviations resolve to the first one they are a prefix of
+INTERFACE_TYPES = ("GigabitEthernet", "FastEthernet", "TenGigabitEthernet", "TwentyFiveGigE", "FortyGigabitEthernet",
+                   "HundredGigE", "Ethernet", "Loopback", "Serial", "Tunnel", "Port-channel", "Vlan", "Management", "Null")
+INTERFACE_ALIASES = {"mgmt": "Management", "eth": "Ethernet", "po": "Port-channel"}
+
+INTERFACE_NAME = re.compile(r"^([A-Za-z-]+)\s*(\d.*)$")
+
+_normalized = {}
+
+def _lines(source):
+    """ iterate the lines of a string or pass any other iterable of lines through """
+    if isinstance(source, str):
+        return io.StringIO(source)
+    return source
+
+def normalize_interface(name):
+    """ expand an abbreviated interface such as "Gi0/1" or "Gig 0/1" into "GigabitEthernet0/1" """
+    if name in _normalized:
+        return _normalized[name]
+    normalized = name
+    match = INTERFACE_NAME.match(name.strip())
+    if match is not None:
+        kind, number = match.groups()
+        kind = INTERFACE_ALIASES.get(kind.lower(), kind)
+        for full in INTERFACE_TYPES:
+            if full.lower().startswith(kind.lower()):
+                kind = full
+                break
+        normalized = kind + number
+    _normalized[name] = normalized
+    return normalized
+
+def parse_interfaces(lines):
+    """ yield (interface, address or None, status, protocol) for every row of "sh ip int br" """
+    for line in _lines(lines):
+        fields = line.split()
+        if len(fields) < 6 or fields[0] == "Interface" or not INTERFACE_NAME.match(fields[0]):
+            continue
+        address = fields[1] if ip_to_int(fields[1]) is not None else None
+
+        # Status may be "administratively down"
+        yield normalize_interface(fields[0]), address, " ".join(fields[4:-1]), fields[-1]
+
+def _cdp_interface(fields):
+    """ interface written as "Gig 0/1" or "GigabitEthernet0/1" at the start of fields, (name, fields used) """
+    if len(fields) > 1 and fields[1][:1].isdigit():
+        return normalize_interface(fields[0] + fields[1]), 2
+    return normalize_interface(fields[0]), 1
+
+def parse_cdp(lines):
+    """ yield (local interface, remote hostname, remote interface) for every neighbor of "show cdp nei"
+
+    Remote hostnames lose their domain, device IDs too long for their column are joined with the next line.
+    """
+    in_table = False
+    device = None
+    for line in _lines(lines):
+        line = line.rstrip("\r\n")
+        if line.startswith("Device ID"):
+            in_table = True
+            continue
+        if not in_table or not line.strip():
+            continue
+        if line.startswith("Total cdp entries"):
+            break
+
+        fields = line.split()
+        if not line[0].isspace():
+            device = fields[0]
+            fields = fields[1:]
+            if not fields:
+                # The rest of the entry is on the next line
+                continue
+        if device is None or len(fields) < 3:
+            continue
+
+        local_int, used = _cdp_interface(fields)
+        if fields[-1][:1].isdigit() and len(fields) - used >= 2:
+            remote_int = normalize_interface(fields[-2] + fields[-1])
+        else:
+            remote_int = normalize_interface(fields[-1])
+        yield local_int, device.split(".")[0], remote_int
+        device = None
+
+def _connected_routes(router, addresses, parsed, vrf=None):
+    """ configure interface masks and VRFs from connected routes, pass every other route through """
+    for lineno, line, route in parsed:
+        if route is None:
+            yield lineno, line, route
+            continue
+        dst, nexthop, iface = route
+        iface = normalize_interface(iface) if iface else ""
+
+        if nexthop == "directly connected" and iface in addresses:
+            parsed_dst = parse_prefix(dst)
+            address = addresses[iface]
+            if parsed_dst is not None and network_address(address, parsed_dst[1]) == network_address(*parsed_dst):
+                # "sh ip int br" has no masks, the connected subnet of the interface gives it. Local /32 routes
+                # are skipped once the interface has its subnet, a /32 loopback has nothing else
+                if parsed_dst[0] != address or router.getAddress(iface) is None:
+                    router.setVrf(iface, vrf)
+                    router.setIP(iface, "{}/{}".format(int_to_ip(address), parsed_dst[1]))
+                continue
+        yield lineno, line, (dst, nexthop, iface)
+
+def build_router(hostname, interfaces, routes=(), brand="Cisco", model="", os="IOS", batch_size=10000, vrf_routes=None):
+    """ Router from "sh ip int br" and "sh ip route" output, return (router, [(line number, line, reason)] of rejected routes)
+
+    vrf_routes is {VRF name: "sh ip route vrf" output}, interfaces with a connected route in a VRF
+    are bound to it. Interfaces without a connected route keep "unassigned IP" since their mask is unknown.
+    """
+    router = Router(brand, model, os, hostname)
+    addresses = {}
+    for interfaceName, address, status, protocol in parse_interfaces(interfaces):
+        router.addInterface(interfaceName)
+        if address is not None:
+            addresses[interfaceName] = ip_to_int(address)
+
+    loaded, rejected = load_parsed_routes(router, _connected_routes(router, addresses, parse_routes(_lines(routes))), batch_size)
+    for vrf, lines in (vrf_routes or {}).items():
+        router.addVrf(vrf)
+        parsed = _connected_routes(router, addresses, parse_routes(_lines(lines)), vrf)
+        rejected.extend(load_parsed_routes(router, parsed, batch_size, vrf)[1])
+    return router, rejected
+
+def build_topology(devices, batch_size=10000):
+    """ Topology from {hostname: (sh ip int br, sh ip route, show cdp nei)} output
+
+    Return (topology, {hostname: rejected routes}). CDP neighbors that are not in devices are left out.
+    """
+    topology = Topology()
+    rejected = {}
+    for hostname, (interfaces, routes, cdp) in devices.items():
+        router, rejected[hostname] = build_router(hostname, interfaces, routes, batch_size=batch_size)
+        topology.addRouter(router)
+
+    # Both ends report a link, connect() refuses the second one
+    for hostname, (interfaces, routes, cdp) in devices.items():
+        router = topology.getRouter(hostname)
+        for local_int, remote_name, remote_int in parse_cdp(cdp):
+            remote_host = topology.getRouter(remote_name)
+            if remote_host is not None:
+                router.connect(local_int, remote_host, remote_int)
+    return topology, rejected
@@ -0,0 +1,205 @@
+""" Binary snapshot of routers that loads through mmap without copying the route tables
+
+The file is a magic, a router count and one block per router. Every number is little-endian and
+every route column starts on an 8 byte boundary, so the loaded tables are memoryviews of the
+mapped file that many processes can share until a route is changed.
+
+    router block  uint32 string count, strings as uint32 length + utf-8 bytes
+                  brand, model, os, hostname      4 x uint32 string
+                  interfaces                      uint32 count, (uint32 name, uint32 VRF, uint32 address, uint8 prefix length) records
+                  connections                     uint32 count, (uint32 local, uint32 remote host, uint32 remote) records
+                  tables                          uint32 count, the global routing table first, then every VRF's
+                                                  routing table before the tables of its route sources
+    table         uint32 VRF, uint32 source, uint32 default route, uint32 rows,
+                  uint32 interface name count, uint32 group count, uint32 names,
+                  groups as uint32 path count + uint32 "nexthop iface" paths, then the ArrayRouteTable columns
+                  networks uint32[rows], lengths uint8[rows], nexthops uint32[rows], ifaces uint16[rows]
+"""
+import mmap
+import struct
+import sys
+from array import array
+from RouteTable import ArrayRouteTable, TYPECODES
+from NextHop import next_hop_group
+
+MAGIC = b"NPASNAP1"
+
+# VRF of the global table and source of routing tables, the others are string numbers
+MAIN = 0xFFFFFFFF
+
+# Prefix length of interfaces without an IP
+UNASSIGNED = 255
+
+# Flag of a default route that is the group of this index instead of a string number
+DEFAULT_GROUP = 0x80000000
+
+_INTERFACE = "<IIIB"
+_CONNECTION = "<III"
+
+def _as_table(routes):
+    """ ArrayRouteTable holding routes, the table itself when it already is one """
+    if isinstance(routes, ArrayRouteTable):
+        routes.flush()
+        return routes
+    table = ArrayRouteTable()
+    table.update(routes)
+    table.flush()
+    return table
+
+class _Writer:
+
+    def __init__(self, output):
+        self.output = output
+        self.offset = 0
+
+    def write(self, data):
+        self.output.write(data)
+        self.offset += len(data)
+
+    def pack(self, fmt, *values):
+        self.write(struct.pack(fmt, *values))
+
+    def records(self, fmt, rows):
+        self.pack("<I", len(rows))
+        self.write(b"".join(struct.pack(fmt, *row) for row in rows))
+
+    def column(self, column, typecode):
+        self.write(bytes(-self.offset % 8))
+        if sys.byteorder == "big":
+            column = array(typecode, column)
+            column.byteswap()
+        self.write(memoryview(column).cast("B"))
+
+class _Reader:
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def records(self, fmt):
+        count, = self.unpack("<I")
+        size = struct.calcsize(fmt) * count
+        rows = list(struct.iter_unpack(fmt, self.buffer[self.offset:self.offset + size]))
+        self.offset += size
+        return rows
+
+    def string(self):
+        size, = self.unpack("<I")
+        text = bytes(self.buffer[self.offset:self.offset + size]).decode("utf-8")
+        self.offset += size
+        return text
+
+    def column(self, typecode, count):
+        self.offset += -self.offset % 8
+        size = array(typecode).itemsize * count
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        if sys.byteorder == "big":
+            column = array(typecode, bytes(data))
+            column.byteswap()
+            return column
+        return data.cast(typecode)
+
+def _table_header(table, intern):
+    """ (default route, interface name numbers, group path numbers) of an ArrayRouteTable """
+    groups = list(table.groups)
+    default = table["default"]
+    if isinstance(default, str):
+        default = intern(default)
+    else:
+        groups.append(default)
+        default = DEFAULT_GROUP | len(groups) - 1
+    return default, [intern(name) for name in table.interfaces], [[intern(path) for path in group] for group in groups]
+
+def _write_router(writer, record):
+    brand, model, os, hostname, interfaces, connections, tables = record
+    strings = {}
+
+    def intern(text):
+        return strings.setdefault(text, len(strings))
+
+    def number(text):
+        return MAIN if text is None else intern(text)
+
+    # Records are built first so the string table in front of them is complete
+    names = [intern(brand), intern(model), intern(os), intern(hostname)]
+    interfaces = [(intern(name), number(vrf), address or 0, UNASSIGNED if address is None else length)
+                  for name, address, length, vrf in interfaces]
+    connections = [(intern(local_int), intern(remote_name), intern(remote_int)) for local_int, remote_name, remote_int in connections]
+    tables = [(number(vrf), number(source), _as_table(routes)) for vrf, source, routes in tables]
+    tables = [(vrf, source, table) + _table_header(table, intern) for vrf, source, table in tables]
+
+    writer.pack("<I", len(strings))
+    for text in strings:
+        encoded = text.encode("utf-8")
+        writer.pack("<I", len(encoded))
+        writer.write(encoded)
+    writer.pack("<IIII", *names)
+    writer.records(_INTERFACE, interfaces)
+    writer.records(_CONNECTION, connections)
+    writer.pack("<I", len(tables))
+    for vrf, source, table, default, interfaceNames, groups in tables:
+        writer.pack("<IIIIII", vrf, source, default, len(table.networks), len(interfaceNames), len(groups))
+        writer.pack("<{}I".format(len(interfaceNames)), *interfaceNames)
+        for paths in groups:
+            writer.pack("<I{}I".format(len(paths)), len(paths), *paths)
+        for column, typecode in zip((table.networks, table.lengths, table.nexthops, table.ifaces), TYPECODES):
+            writer.column(column, typecode)
+
+def _read_router(reader):
+    count, = reader.unpack("<I")
+    strings = [reader.string() for index in range(count)]
+    brand, model, os, hostname = [strings[index] for index in reader.unpack("<IIII")]
+
+    def text(number):
+        return None if number == MAIN else strings[number]
+
+    interfaces = [(strings[name], None if length == UNASSIGNED else address, length, text(vrf))
+                  for name, vrf, address, length in reader.records(_INTERFACE)]
+    connections = [tuple(strings[index] for index in row) for row in reader.records(_CONNECTION)]
+
+    tables = []
+    count, = reader.unpack("<I")
+    for index in range(count):
+        vrf, source, default, rows, names, groupCount = reader.unpack("<IIIIII")
+        interfaceNames = [strings[name] for name in reader.unpack("<{}I".format(names))]
+        groups = []
+        for group in range(groupCount):
+            paths, = reader.unpack("<I")
+            groups.append(next_hop_group(strings[path] for path in reader.unpack("<{}I".format(paths))))
+        columns = [reader.column(typecode, rows) for typecode in TYPECODES]
+        default = groups[default ^ DEFAULT_GROUP] if default & DEFAULT_GROUP else strings[default]
+        table = ArrayRouteTable.fromColumns(*columns, interfaceNames, default, groups)
+        tables.append((text(vrf), text(source), table))
+    return brand, model, os, hostname, interfaces, connections, tables
+
+def write_snapshot(path, records):
+    """ write router records (brand, model, os, hostname, interfaces, connections, tables) to path
+
+    interfaces are (name, uint32 address or None, prefix length, VRF), connections are
+    (local interface, remote hostname, remote interface) and tables are (VRF, source, routes) with
+    VRF None for the global table and source None for the routing table.
+    """
+    with open(path, "wb") as output:
+        writer = _Writer(output)
+        writer.write(MAGIC)
+        writer.pack("<I", len(records))
+        for record in records:
+            _write_router(writer, record)
+
+def read_snapshot(path):
+    """ router records of a snapshot file with ArrayRouteTable tables over the mapped file, None when it is not a snapshot """
+    with open(path, "rb") as snapshot:
+        if snapshot.read(len(MAGIC)) != MAGIC:
+            return None
+        buffer = memoryview(mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ))
+
+    reader = _Reader(buffer)
+    reader.offset = len(MAGIC)
+    count, = reader.unpack("<I")
+    return [_read_router(reader) for index in range(count)]
@@ -0,0 +1,55 @@
+""" Route summarization: the same forwarding behaviour with fewer prefixes """
+from Address import FULL_MASK, MASKS
+
+# HOSTMASKS[n] has the host bits of a /n prefix set
+HOSTMASKS = [mask ^ FULL_MASK for mask in MASKS]
+
+def _drop_redundant(rows):
+    """ leave out prefixes whose route is the one they would inherit from their closest containing prefix """
+    root = rows.get((0, 0))
+    kept = {} if root is None else {(0, 0): root}
+
+    # (last address, inherited route) of the prefixes containing the current one, the /0 at the bottom
+    stack = [(FULL_MASK, root)]
+
+    # Plain integers sort many times faster than (network, length) tuples
+    for key in sorted(network << 6 | length for network, length in rows):
+        network, length = key >> 6, key & 63
+        if length == 0:
+            continue
+        route = rows[network, length]
+        while stack[-1][0] < network:
+            stack.pop()
+        if route != stack[-1][1]:
+            kept[network, length] = route
+        stack.append((network | HOSTMASKS[length], route))
+    return kept
+
+def _merge_siblings(rows):
+    """ replace the two halves of a prefix by the prefix itself when they have the same route, bottom up """
+    levels = [{} for length in range(33)]
+    for (network, length), route in rows.items():
+        levels[length][network] = route
+
+    for length in range(32, 0, -1):
+        level, parent = levels[length], levels[length - 1]
+        bit = 1 << (32 - length)
+        for network, route in list(level.items()):
+            if network & bit or level.get(network | bit) != route:
+                continue
+
+            # Both halves cover every address of the parent, so whatever route the parent had is replaced
+            del level[network]
+            del level[network | bit]
+            parent[network] = route
+
+    return dict(((network, length), route) for length, level in enumerate(levels) for network, route in level.items())
+
+def summarize_routes(rows):
+    """ {(network, prefix length): route} with the same longest prefix match result for every address
+
+    (0, 0) is the default route. Redundant prefixes are dropped, sibling prefixes with the same route
+    are merged into their parent, and what the merges made redundant is dropped again. One sort and
+    a pass per prefix length keep it O(n log n).
+    """
+    return _drop_redundant(_merge_siblings(_drop_redundant(rows)))
@@ -1,4 +1,22 @@
 from Router import *
+from Address import *
+from RouteLoader import load_routes
+from ShowParser import normalize_interface, parse_cdp, build_topology
+import RouteTable
+from RouteTable import ArrayRouteTable
+from Topology import Topology
+from Forwarding import Forwarder
+from SPF import SPFEngine
+from Events import *
+from NextHop import NextHopGroup, flow_hash
+from Overlap import find_overlaps, OverlapDetector
+from Show import routing_lines, interface_lines, filter_lines, page, write_lines, show
+import io
+from Generator import generate, build
+from Snapshot import write_snapshot
+import os
+import random
+import tempfile
 import unittest
 
 class TestRouter(unittest.TestCase):
@@ -194,5 +212,976 @@ class TestRouter(unittest.TestCase):
 
         del rt1
 
+    def testAddressMath(self):
+        self.assertEqual(ip_to_int("192.168.1.199"), 0xC0A801C7)
+        self.assertEqual(int_to_ip(0xC0A801C7), "192.168.1.199")
+        self.assertIsNone(ip_to_int("192.168.1"))
+        self.assertIsNone(ip_to_int("192.168.1.256"))
+        self.assertIsNone(ip_to_int("192.168.-1.1"))
+
+        self.assertEqual(parse_prefix("192.168.1.199/25"), (0xC0A801C7, 25))
+        self.assertIsNone(parse_prefix("192.168.1.199"))
+        self.assertIsNone(parse_prefix("192.168.1.199/33"))
+
+        address, length = parse_prefix("192.168.1.199/25")
+        self.assertEqual(format_prefix(network_address(address, length), length), "192.168.1.128/25")
+        self.assertEqual(int_to_ip(broadcast_address(address, length)), "192.168.1.255")
+        self.assertTrue(contains(0xC0A80180, 25, address))
+        self.assertFalse(contains(0xC0A80100, 25, address))
+
+        # Route destinations are stored by their network address
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        self.assertTrue(rt1.addRoute("10.1.2.3/8", "192.168.1.2"))
+        self.assertIn("10.0.0.0/8", rt1.getRoute())
+        self.assertTrue(rt1.deleteRoute("10.9.9.9/8"))
+        self.assertNotIn("10.0.0.0/8", rt1.getRoute())
+
+        del rt1
+
+    def testLookup(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt1.addInterface("G0/0")
+        rt1.setIP("G0/0", "192.168.1.1/24")
+        rt1.addRoute("10.0.0.0/8", "192.168.1.2", "G0/0")
+        rt1.addRoute("10.1.0.0/16", "192.168.1.3")
+
+        # No default route yet
+        self.assertIsNone(rt1.lookup("8.8.8.8"))
+        self.assertIsNone(rt1.lookup("999.1.1.1"))
+
+        self.assertEqual(rt1.lookup("192.168.1.20"), ("192.168.1.0/24", "directly connected", "G0/0"))
+        self.assertEqual(rt1.lookup("10.2.3.4"), ("10.0.0.0/8", "192.168.1.2", "G0/0"))
+        self.assertEqual(rt1.lookup("10.1.2.3"), ("10.1.0.0/16", "192.168.1.3", ""))
+
+        # Table changes after the first lookup are seen by the next one
+        rt1.addRoute("10.1.2.0/24", "192.168.1.4")
+        rt1.addRoute("0.0.0.0/0", "192.168.1.254")
+        self.assertEqual(rt1.lookup("10.1.2.3")[0], "10.1.2.0/24")
+        self.assertEqual(rt1.lookup("8.8.8.8"), ("default", "192.168.1.254", ""))
+
+        rt1.deleteRoute("10.1.2.0/24")
+        rt1.deleteRoute("10.1.0.0/16")
+        self.assertEqual(rt1.lookup("10.1.2.3")[0], "10.0.0.0/8")
+
+        rt1.deleteIP("G0/0")
+        self.assertEqual(rt1.lookup("192.168.1.20")[0], "default")
+
+        del rt1
+
+    def testBulkRoutes(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt1.addInterface("G0/0")
+
+        routes = [("10.0.0.0/8", "192.168.1.2", "G0/0"), ("172.16.0.0/16", "172.16.1.1"),
+                  ("999.0.0.0/8", "192.168.1.2"), ("10.1.0.0/16", "999.1.1.1"), ("10.2.0.0/16", "192.168.1.2", "G0/10")]
+        rejected = rt1.addRoutes(routes, batch_size=2)
+        self.assertEqual([(index, reason) for index, route, reason in rejected],
+                         [(2, "invalid destination"), (3, "invalid nexthop"), (4, "unknown interface")])
+        self.assertIn("10.0.0.0/8", rt1.getRoute())
+        self.assertIn("172.16.0.0/16", rt1.getRoute())
+
+        show_ip_route = [
+            "Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP",
+            "       D - EIGRP, EX - EIGRP external, O - OSPF, IA - OSPF inter area",
+            "",
+            "Gateway of last resort is 192.168.122.1 to network 0.0.0.0",
+            "",
+            "S*    0.0.0.0/0 [1/0] via 192.168.122.1",
+            "      192.168.1.0/24 is subnetted, 2 subnets",
+            "C        192.168.1.0 is directly connected, G0/0",
+            "O IA     192.168.2.0 [110/2] via 192.168.1.2, 00:12:33, G0/0",
+            "S        10.300.0.0/16 [1/0] via 192.168.1.2",
+            "this is not a route",
+            "20.0.0.0/8,192.168.1.2,G0/0",
+        ]
+        loaded, rejected = load_routes(rt1, show_ip_route)
+        self.assertEqual(loaded, 4)
+        self.assertEqual([(lineno, reason) for lineno, line, reason in rejected], [(10, "invalid destination"), (11, "unrecognised line")])
+
+        routingtable = rt1.getRoute()
+        self.assertEqual(routingtable["default"], "192.168.122.1 ")
+        self.assertEqual(routingtable["192.168.1.0/24"], "directly connected G0/0")
+        self.assertEqual(routingtable["192.168.2.0/24"], "192.168.1.2 G0/0")
+        self.assertEqual(routingtable["20.0.0.0/8"], "192.168.1.2 G0/0")
+
+        # Long entries wrap their path onto the next line
+        loaded, rejected = load_routes(rt1, [
+            "O E2     10.200.0.0/16 ",
+            "           [110/20] via 192.168.1.2, 00:01:02, G0/0",
+            "O        10.201.0.0/16",
+            "C        192.168.1.0/24 is directly connected, G0/0",
+            "O        10.202.0.0/16",
+        ])
+        self.assertEqual(loaded, 2)
+        self.assertEqual([(lineno, reason) for lineno, line, reason in rejected], [(3, "unrecognised line"), (5, "unrecognised line")])
+        self.assertEqual(routingtable["10.200.0.0/16"], "192.168.1.2 G0/0")
+
+        del rt1
+
+    def testArrayRouteTable(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1", table=ArrayRouteTable())
+        rt1.addInterface("G0/0")
+        rt1.setIP("G0/0", "192.168.1.1/24")
+        self.assertTrue(rt1.addRoute("192.168.2.0/24", "192.168.1.2", "G0/0"))
+        self.assertTrue(rt1.addRoute("172.16.0.0/16", "172.16.1.1"))
+        self.assertTrue(rt1.addRoute("0.0.0.0/0", "8.8.8.8"))
+
+        routingtable = rt1.getRoute()
+        self.assertEqual(routingtable["default"], "8.8.8.8 ")
+        self.assertEqual(routingtable["192.168.1.0/24"], "directly connected G0/0")
+        self.assertEqual(routingtable["172.16.0.0/16"], "172.16.1.1 ")
+
+        # Rows are kept in prefix order
+        self.assertEqual(list(routingtable), ["default", "172.16.0.0/16", "192.168.1.0/24", "192.168.2.0/24"])
+        entry = list(routingtable.entries())[2]
+        self.assertEqual((entry.prefix, entry.nexthop, entry.iface), ("192.168.2.0/24", "192.168.1.2", "G0/0"))
+        with self.assertRaises(AttributeError):
+            entry.length = 8
+
+        self.assertTrue(rt1.deleteRoute("172.16.0.0/16"))
+        self.assertFalse(rt1.deleteRoute("172.16.0.0/16"))
+        self.assertNotIn("172.16.0.0/16", routingtable)
+        self.assertEqual(rt1.lookup("192.168.2.9"), ("192.168.2.0/24", "192.168.1.2", "G0/0"))
+
+        rt1.deleteIP("G0/0")
+        self.assertEqual(len(routingtable), 2)
+
+        # items() is a view of the table, not a one-shot iterator
+        items = routingtable.items()
+        self.assertEqual(list(items), list(items))
+        self.assertIn(("default", "8.8.8.8 "), items)
+        self.assertEqual(len(items), 2)
+
+        # Groups are dropped with the last route using them
+        table = ArrayRouteTable()
+        with table.bulk():
+            for index in range(4):
+                table["10.{}.0.0/16".format(index)] = next_hop_group(["1.1.1.{} ".format(index), "2.2.2.2 "])
+            self.assertEqual(len(table.networks), 0)
+        self.assertEqual(len(table.groups), 4)
+        for index in range(3):
+            del table["10.{}.0.0/16".format(index)]
+        table.flush()
+        self.assertEqual(len(table.groups), 1)
+        self.assertEqual(str(table["10.3.0.0/16"]), str(next_hop_group(["1.1.1.3 ", "2.2.2.2 "])))
+
+        # Interface index GROUP marks ECMP rows, no interface may get it
+        for index in range(RouteTable.MAX_INTERFACES):
+            table["11.0.0.0/8"] = "1.1.1.1 E{}".format(index)
+        with self.assertRaises(OverflowError):
+            table["11.0.0.0/8"] = "1.1.1.1 E{}".format(RouteTable.MAX_INTERFACES)
+
+        del rt1
+
+    def testTopology(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt2 = Router("Cisco", "Nexus", "NXOS", "R2")
+        rt3 = Router("Cisco", "csr1000v", "IOSXE", "R3")
+        for router, interfaces in [(rt1, ["G0/0", "G0/1"]), (rt2, ["G0/2", "G0/3"]), (rt3, ["G0/4", "G0/5"])]:
+            for interface in interfaces:
+                router.addInterface(interface)
+
+        # Links made before registering are picked up
+        rt1.connect("G0/1", rt2, "G0/2")
+
+        topology = Topology()
+        self.assertTrue(topology.addRouter(rt1))
+        self.assertTrue(topology.addRouter(rt2))
+        self.assertTrue(topology.addRouter(rt3))
+        self.assertFalse(topology.addRouter(Router("Cisco", "c7200", "IOS", "R1")))
+        self.assertIs(topology.getRouter("R2"), rt2)
+        self.assertEqual(topology.neighbor(rt1, "G0/1"), (rt2, "G0/2"))
+
+        rt2.connect("G0/3", rt3, "G0/4")
+        rt3.connect("G0/5", rt1, "G0/0")
+        self.assertEqual(topology.neighbor(rt1, "G0/0"), (rt3, "G0/5"))
+        self.assertEqual(len(list(topology.links())), 3)
+
+        rt3.disconnect("G0/5", rt1, "G0/0")
+        self.assertIsNone(topology.neighbor(rt1, "G0/0"))
+        self.assertEqual(topology.neighbors(rt3), {"G0/4": (rt2, "G0/3")})
+        self.assertEqual(len(list(topology.links())), 2)
+
+        # Renaming keeps the index and the neighbors' connection entries up to date
+        self.assertTrue(rt2.setHostname("Core"))
+        self.assertFalse(rt2.setHostname("R1"))
+        self.assertIsNone(topology.getRouter("R2"))
+        self.assertIs(topology.getRouter("Core"), rt2)
+        self.assertEqual(rt1.connection["G0/1"], ["Core", "G0/2"])
+        self.assertEqual(rt3.connection["G0/4"], ["Core", "G0/3"])
+
+        self.assertTrue(topology.removeRouter(rt3))
+        self.assertEqual(topology.neighbors(rt2), {"G0/2": (rt1, "G0/1")})
+
+        del rt1, rt2, rt3
+
+    def testForwarding(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt2 = Router("Cisco", "Nexus", "NXOS", "R2")
+        rt3 = Router("Cisco", "csr1000v", "IOSXE", "R3")
+        topology = Topology()
+        for router in [rt1, rt2, rt3]:
+            router.addInterface("G0/0")
+            router.addInterface("G0/1")
+            topology.addRouter(router)
+
+        # R1 -- R2 -- R3 -- 192.168.3.0/24
+        rt1.connect("G0/0", rt2, "G0/0")
+        rt2.connect("G0/1", rt3, "G0/0")
+        rt1.setIP("G0/0", "10.0.12.1/24")
+        rt2.setIP("G0/0", "10.0.12.2/24")
+        rt2.setIP("G0/1", "10.0.23.2/24")
+        rt3.setIP("G0/0", "10.0.23.3/24")
+        rt3.setIP("G0/1", "192.168.3.1/24")
+        rt1.addRoute("192.168.3.0/24", "10.0.12.2")
+        rt2.addRoute("192.168.3.0/24", "10.0.23.3", "G0/1")
+
+        forwarder = Forwarder(topology)
+        self.assertEqual(forwarder.trace(rt1, "192.168.3.50"), ("delivered", [("R1", "G0/0"), ("R2", "G0/1"), ("R3", "G0/1")]))
+        self.assertEqual(forwarder.trace(rt1, "192.168.3.1"), ("delivered", [("R1", "G0/0"), ("R2", "G0/1"), ("R3", "")]))
+        self.assertEqual(forwarder.trace(rt1, "8.8.8.8"), ("blackhole", [("R1", "")]))
+
+        rt1.addRoute("0.0.0.0/0", "10.0.12.2")
+        rt2.addRoute("0.0.0.0/0", "10.0.12.1", "G0/0")
+        self.assertEqual(forwarder.trace(rt1, "8.8.8.8")[0], "loop")
+
+        # Cached next hops follow table and link changes
+        rt2.deleteRoute("192.168.3.0/24")
+        self.assertEqual(forwarder.trace(rt1, "192.168.3.50")[0], "loop")
+        rt2.addRoute("192.168.3.0/24", "10.0.23.3", "G0/1")
+        self.assertEqual(forwarder.trace(rt1, "192.168.3.50")[0], "delivered")
+        rt2.disconnect("G0/1", rt3, "G0/0")
+        self.assertEqual(forwarder.trace(rt1, "192.168.3.50"), ("blackhole", [("R1", "G0/0"), ("R2", "")]))
+
+        statuses = dict((hostname, status) for hostname, status, path in forwarder.traceAll("10.0.12.2"))
+        self.assertEqual(statuses, {"R1": "delivered", "R2": "delivered", "R3": "blackhole"})
+
+        del rt1, rt2, rt3
+
+    def testSPF(self):
+        topology = Topology()
+        routers = [Router("Cisco", "c7200", "IOS", "R{}".format(number)) for number in range(1, 5)]
+        for number, router in enumerate(routers, 1):
+            router.addInterface("G0/0")
+            router.addInterface("G0/1")
+            router.addInterface("Lo0")
+            router.setIP("Lo0", "172.16.{}.1/24".format(number))
+            topology.addRouter(router)
+        rt1, rt2, rt3, rt4 = routers
+
+        #  R1 (G0/0) -- 10.0.12.0/24 -- (G0/1) R2
+        #  (G0/1)                           (G0/0)
+        #  10.0.14.0/24                 10.0.23.0/24
+        #  (G0/0)                           (G0/1)
+        #  R4 (G0/1) -- 10.0.34.0/24 -- (G0/0) R3
+        for local, local_int, remote, remote_int, subnet in [(rt1, "G0/0", rt2, "G0/1", 12), (rt2, "G0/0", rt3, "G0/1", 23),
+                                                             (rt3, "G0/0", rt4, "G0/1", 34), (rt4, "G0/0", rt1, "G0/1", 14)]:
+            local.setIP(local_int, "10.0.{}.1/24".format(subnet))
+            remote.setIP(remote_int, "10.0.{}.2/24".format(subnet))
+            local.connect(local_int, remote, remote_int)
+
+        # R1 -> R2 is expensive, so R1 reaches R2 through R4 and R3
+        cost = lambda router, iface: 10 if (router.getHostname(), iface) == ("R1", "G0/0") else 1
+        engine = SPFEngine(topology, cost=cost)
+        idle = SPFEngine(topology, source="isis")
+        engine.run()
+        self.assertEqual(engine.getDistance(rt1, rt2), 3)
+        self.assertEqual(rt1.getRoute("ospf")["172.16.2.0/24"], "10.0.14.1 G0/1")
+        self.assertEqual(rt2.getRoute("ospf")["172.16.1.0/24"], "10.0.12.1 G0/1")
+        self.assertNotIn("172.16.1.0/24", rt1.getRoute("ospf"))
+
+        # Learned routes are used by lookups, connected and static routes still win
+        self.assertEqual(rt1.lookup("172.16.3.9"), ("172.16.3.0/24", "10.0.14.1", "G0/1"))
+        rt1.addRoute("172.16.3.0/24", "10.0.12.2", "G0/0")
+        self.assertEqual(rt1.lookup("172.16.3.9")[1], "10.0.12.2")
+        rt1.deleteRoute("172.16.3.0/24")
+        self.assertEqual(rt1.lookup("172.16.3.9")[1], "10.0.14.1")
+
+        # Link changes are applied incrementally
+        rt3.disconnect("G0/0", rt4, "G0/1")
+        self.assertEqual(engine.getDistance(rt1, rt2), 10)
+        self.assertEqual(rt1.getRoute("ospf")["172.16.2.0/24"], "10.0.12.2 G0/0")
+        self.assertEqual(rt1.getRoute("ospf")["172.16.3.0/24"], "10.0.12.2 G0/0")
+
+        rt2.disconnect("G0/0", rt3, "G0/1")
+        self.assertIsNone(engine.getDistance(rt1, rt3))
+        self.assertNotIn("172.16.3.0/24", rt1.getRoute("ospf"))
+
+        rt3.connect("G0/0", rt4, "G0/1")
+        self.assertEqual(engine.getDistance(rt1, rt3), 2)
+        self.assertEqual(rt1.getRoute("ospf")["172.16.3.0/24"], "10.0.14.1 G0/1")
+
+        # An engine that never ran ignores link changes
+        self.assertNotIn("isis", rt1.getRouteSources())
+
+        # Removing a router takes its links down
+        self.assertTrue(topology.removeRouter(rt4))
+        self.assertIsNone(engine.getDistance(rt1, rt3))
+        self.assertNotIn("172.16.4.0/24", rt1.getRoute("ospf"))
+        self.assertNotIn("172.16.3.0/24", rt1.getRoute("ospf"))
+        self.assertEqual(rt1.getRoute("ospf")["172.16.2.0/24"], "10.0.12.2 G0/0")
+
+        # A router joining over a freshly addressed link is routed to right away, the link subnet too
+        rt5 = Router("Cisco", "c7200", "IOS", "R5")
+        rt5.addInterface("G0/0")
+        rt5.addInterface("Lo0")
+        rt5.setIP("Lo0", "172.16.5.1/24")
+        topology.addRouter(rt5)
+        rt2.addInterface("G0/2")
+        rt2.setIP("G0/2", "10.0.25.1/24")
+        rt5.setIP("G0/0", "10.0.25.2/24")
+        rt2.connect("G0/2", rt5, "G0/0")
+        self.assertEqual(engine.getDistance(rt1, rt5), 11)
+        self.assertEqual(rt1.getRoute("ospf")["172.16.5.0/24"], "10.0.12.2 G0/0")
+        self.assertEqual(rt1.getRoute("ospf")["10.0.25.0/24"], "10.0.12.2 G0/0")
+        self.assertEqual(rt5.getRoute("ospf")["172.16.1.0/24"], "10.0.25.1 G0/0")
+
+        # Removed routers are forgotten, routers added later take their place
+        self.assertTrue(topology.removeRouter(rt5))
+        self.assertNotIn("172.16.5.0/24", rt1.getRoute("ospf"))
+        self.assertEqual(rt1.getRoute("ospf")["10.0.25.0/24"], "10.0.12.2 G0/0")
+        self.assertEqual(rt5.getRoute("ospf"), {})
+        with self.assertRaises(KeyError):
+            engine.getDistance(rt1, rt5)
+        self.assertTrue(topology.addRouter(rt4))
+        self.assertEqual(engine.getDistance(rt1, rt3), 2)
+        self.assertEqual(rt1.getRoute("ospf")["172.16.3.0/24"], "10.0.14.1 G0/1")
+
+        del rt1, rt2, rt3, rt4, rt5
+
+    def testLookupMany(self):
+        import numpy as np
+
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt1.addInterface("G0/0")
+        rt1.addInterface("G0/1")
+        rt1.setIP("G0/1", "192.168.1.1/24")
+        rt1.addRoute("10.0.0.0/8", "192.168.1.2", "G0/1")
+        rt1.addRoute("10.1.0.0/16", "192.168.1.3")
+        rt1.addRoute("10.1.2.0/24", "192.168.1.4", "G0/1")
+
+        addresses = np.array([ip_to_int(ip) for ip in ["10.9.9.9", "10.1.9.9", "10.1.2.3", "192.168.1.7", "8.8.8.8"]], dtype=np.uint32)
+        nexthops, ifaces = rt1.lookup_many(addresses)
+        self.assertEqual(nexthops.tolist(), [ip_to_int("192.168.1.2"), ip_to_int("192.168.1.3"), ip_to_int("192.168.1.4"), 0xFFFFFFFF, 0])
+        self.assertEqual(ifaces.tolist(), [1, -1, 1, 1, -1])
+
+        # The compiled table follows route changes
+        rt1.addRoute("0.0.0.0/0", "192.168.1.254")
+        rt1.deleteRoute("10.1.2.0/24")
+        nexthops, ifaces = rt1.lookup_many(addresses)
+        self.assertEqual(nexthops.tolist()[2], ip_to_int("192.168.1.3"))
+        self.assertEqual(nexthops.tolist()[4], ip_to_int("192.168.1.254"))
+
+        # ECMP routes take the same path as lookup, unknown VRFs give None like lookup
+        rt1.addEcmpRoute("172.16.0.0/16", [("192.168.1.{}".format(host), "G0/1") for host in range(2, 6)])
+        addresses = np.arange(ip_to_int("172.16.0.0"), ip_to_int("172.16.0.0") + 256, dtype=np.uint32)
+        nexthops, ifaces = rt1.lookup_many(addresses)
+        self.assertEqual([int_to_ip(nexthop) for nexthop in nexthops.tolist()], [rt1.lookup(int(address))[1] for address in addresses])
+        self.assertEqual(len(set(nexthops.tolist())), 4)
+        self.assertEqual(set(ifaces.tolist()), {1})
+        flows = np.array([flow_hash(1, int(address), 6, 1024, 443) for address in addresses], dtype=np.uint32)
+        nexthops, ifaces = rt1.lookup_many(addresses, flows=flows)
+        self.assertEqual([int_to_ip(nexthop) for nexthop in nexthops.tolist()],
+                         [rt1.lookup(int(address), flow=int(flow))[1] for address, flow in zip(addresses, flows)])
+        self.assertIsNone(rt1.lookup_many(addresses, vrf="NONE"))
+
+        # Array tables match their rows in the arrays and compile them from their ranges, with the
+        # results of a dict table, also for changes that are not merged into the arrays yet
+        rng = random.Random(2020)
+        rt2 = Router("Cisco", "c7200", "IOS", "R2")
+        rt3 = Router("Cisco", "c7200", "IOS", "R3", table=ArrayRouteTable())
+        prefixes = ["10.{}.{}.0/{}".format(rng.randrange(4), rng.randrange(4), rng.choice((8, 16, 23, 24, 32))) for index in range(200)]
+        for router in (rt2, rt3):
+            router.addInterface("G0/0")
+            router.setIP("G0/0", "192.168.1.1/24")
+            router.addRoutes([(prefix, "192.168.1.{}".format(index % 7 + 2), "G0/0") for index, prefix in enumerate(prefixes)])
+            router.addEcmpRoute("10.3.0.0/16", [("192.168.1.2", "G0/0"), ("192.168.1.3", "G0/0")])
+        addresses = np.array([rng.getrandbits(32) & 0x0003FFFF | 0x0A000000 for index in range(2000)], dtype=np.uint32)
+        for change in range(3):
+            self.assertEqual([rt3.lookup(int(address)) for address in addresses], [rt2.lookup(int(address)) for address in addresses])
+            self.assertEqual([array.tolist() for array in rt3.lookup_many(addresses)], [array.tolist() for array in rt2.lookup_many(addresses)])
+            for router in (rt2, rt3):
+                router.deleteRoute(prefixes[change])
+                router.addRoute("10.{}.0.0/12".format(change), "192.168.1.9", "G0/0")
+                router.updateRoutes("ospf", {"10.{}.1.0/24".format(change): "192.168.1.10 G0/0"})
+                router.addRoute("0.0.0.0/0", "192.168.1.254")
+
+        del rt1
+
+    def testSnapshot(self):
+        topology = Topology()
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt2 = Router("Cisco", "Nexus", "NXOS", "R2")
+        for router in (rt1, rt2):
+            topology.addRouter(router)
+            router.addInterface("G0/0")
+            router.addInterface("G0/1")
+        rt1.setIP("G0/0", "10.0.12.1/24")
+        rt2.setIP("G0/0", "10.0.12.2/24")
+        rt1.connect("G0/0", rt2, "G0/0")
+        rt1.addRoute("172.16.0.0/16", "10.0.12.2", "G0/0")
+        rt1.addRoute("0.0.0.0/0", "10.0.12.2")
+        rt1.updateRoutes("ospf", {"192.168.2.0/24": "10.0.12.2 G0/0"})
+
+        path = os.path.join(tempfile.mkdtemp(), "R1.snap")
+        rt1.save(path)
+        loaded = Router.load(path)
+        self.assertEqual(loaded.getHostname(), "R1")
+        self.assertEqual(loaded.getModel(), "c7200")
+        self.assertEqual(loaded.getInterfaces(), rt1.getInterfaces())
+        self.assertEqual(loaded.getAddress("G0/0"), rt1.getAddress("G0/0"))
+        self.assertEqual(loaded.connection, {"G0/0": ["R2", "G0/0"]})
+        self.assertEqual(dict(loaded.getRoute()), dict(rt1.getRoute()))
+        self.assertEqual(loaded.getRoute("ospf"), rt1.getRoute("ospf"))
+        self.assertEqual(loaded.lookup("192.168.2.9"), ("192.168.2.0/24", "10.0.12.2", "G0/0"))
+
+        # The mapped table is copied on the first change
+        self.assertTrue(loaded.addRoute("172.17.0.0/16", "10.0.12.2"))
+        self.assertTrue(loaded.deleteRoute("172.16.0.0/16"))
+        self.assertEqual(loaded.lookup("172.17.1.1")[0], "172.17.0.0/16")
+        self.assertNotIn("172.16.0.0/16", loaded.getRoute())
+
+        # Whole topology
+        topology.save(path)
+        restored = Topology.load(path)
+        self.assertEqual(sorted(restored.getRouters()), ["R1", "R2"])
+        link = restored.neighbor(restored.getRouter("R1"), "G0/0")
+        self.assertEqual((link[0].getHostname(), link[1]), ("R2", "G0/0"))
+
+        # Other files are not snapshots
+        with open(path, "w") as other:
+            other.write("R1#show ip route\n")
+        self.assertIsNone(Router.load(path))
+
+        del rt1, rt2
+
+    def testShowParser(self):
+        self.assertEqual(normalize_interface("Gi0/1"), "GigabitEthernet0/1")
+        self.assertEqual(normalize_interface("Gig 0/1"), "GigabitEthernet0/1")
+        self.assertEqual(normalize_interface("Te1/0/1"), "TenGigabitEthernet1/0/1")
+        self.assertEqual(normalize_interface("Lo100"), "Loopback100")
+        self.assertEqual(normalize_interface("GigabitEthernet0/1.100"), "GigabitEthernet0/1.100")
+
+        r1_int = """Interface              IP-Address      OK? Method Status                Protocol
+GigabitEthernet0/0     172.31.179.4    YES NVRAM  up                    up
+GigabitEthernet0/1     172.31.179.17   YES manual up                    up
+GigabitEthernet0/2     unassigned      YES unset  administratively down down
+Loopback100            172.20.179.4    YES manual up                    up
+Loopback0              1.1.1.1         YES manual up                    up
+"""
+        r1_route = """Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP
+       D - EIGRP, EX - EIGRP external, O - OSPF, IA - OSPF inter area
+
+Gateway of last resort is not set
+
+      172.20.0.0/16 is variably subnetted, 3 subnets, 2 masks
+C        172.20.179.0/24 is directly connected, Loopback100
+L        172.20.179.4/32 is directly connected, Loopback100
+O        172.20.180.0/24 [110/2] via 172.31.179.18, 00:01:02, GigabitEthernet0/1
+      172.31.0.0/16 is variably subnetted, 4 subnets, 2 masks
+C        172.31.179.0/28 is directly connected, GigabitEthernet0/0
+L        172.31.179.4/32 is directly connected, GigabitEthernet0/0
+C        172.31.179.16/28 is directly connected, Gi0/1
+L        172.31.179.17/32 is directly connected, GigabitEthernet0/1
+S        10.0.0.0/8 [1/0] via 172.31.179.18
+      1.0.0.0/32 is subnetted, 1 subnets
+C        1.1.1.1 is directly connected, Loopback0
+"""
+        r1_cdp = """Capability Codes: R - Router, T - Trans Bridge, B - Source Route Bridge
+                  S - Switch, H - Host, I - IGMP, r - Repeater, P - Phone
+
+Device ID        Local Intrfce     Holdtme    Capability  Platform  Port ID
+R2.npa.com       Gig 0/1           163             R B S I CSR1000V  Gig 0/1
+very-long-switch-name.npa.com
+                 Gig 0/0           170              S I   Linux Uni Eth 0/1
+
+Total cdp entries displayed : 2
+"""
+        r2_int = """Interface              IP-Address      OK? Method Status                Protocol
+GigabitEthernet0/1     172.31.179.18   YES manual up                    up
+"""
+        r2_route = """C        172.31.179.16/28 is directly connected, GigabitEthernet0/1
+L        172.31.179.18/32 is directly connected, GigabitEthernet0/1
+"""
+        self.assertEqual(list(parse_cdp(r1_cdp)), [("GigabitEthernet0/1", "R2", "GigabitEthernet0/1"),
+                                                   ("GigabitEthernet0/0", "very-long-switch-name", "Ethernet0/1")])
+
+        topology, rejected = build_topology({"R1": (r1_int, r1_route.splitlines(True), r1_cdp), "R2": (r2_int, r2_route, "")})
+        self.assertEqual(rejected, {"R1": [], "R2": []})
+        rt1 = topology.getRouter("R1")
+        self.assertEqual(rt1.getInterfaces()["GigabitEthernet0/1"], "172.31.179.17/28")
+        self.assertEqual(rt1.getInterfaces()["GigabitEthernet0/2"], "unassigned IP")
+        self.assertEqual(rt1.getInterfaces()["Loopback100"], "172.20.179.4/24")
+        self.assertEqual(rt1.getRoute()["172.20.180.0/24"], "172.31.179.18 GigabitEthernet0/1")
+        self.assertEqual(rt1.getRoute()["10.0.0.0/8"], "172.31.179.18 ")
+        self.assertNotIn("172.31.179.4/32", rt1.getRoute())
+
+        # A /32 loopback only has its local route
+        self.assertEqual(rt1.getInterfaces()["Loopback0"], "1.1.1.1/32")
+        self.assertEqual(rt1.getRoute()["1.1.1.1/32"], "directly connected Loopback0")
+        self.assertEqual(rt1.connection, {"GigabitEthernet0/1": ["R2", "GigabitEthernet0/1"]})
+        self.assertEqual(topology.neighbor(rt1, "GigabitEthernet0/1")[0].getHostname(), "R2")
+
+    def testDiff(self):
+        for table in (dict, ArrayRouteTable):
+            before = Router("Cisco", "c7200", "IOS", "R1", None if table is dict else table())
+            after = Router("Cisco", "c7200", "IOS", "R1", None if table is dict else table())
+            for router in (before, after):
+                router.addInterface("G0/0")
+                router.setIP("G0/0", "192.168.1.1/24")
+                router.addRoute("10.0.0.0/8", "192.168.1.2", "G0/0")
+                router.addRoute("172.16.0.0/16", "192.168.1.3")
+            self.assertEqual(list(before.diff(after)), [])
+
+            after.addRoute("0.0.0.0/0", "192.168.1.254")
+            after.addRoute("10.1.0.0/16", "192.168.1.4")
+            after.addRoute("10.0.0.0/8", "192.168.1.5", "G0/0")
+            after.deleteRoute("172.16.0.0/16")
+            self.assertEqual(list(before.diff(after)), [
+                ("added", "default", None, "192.168.1.254 "),
+                ("changed", "10.0.0.0/8", "192.168.1.2 G0/0", "192.168.1.5 G0/0"),
+                ("added", "10.1.0.0/16", None, "192.168.1.4 "),
+                ("removed", "172.16.0.0/16", "192.168.1.3 ", None)])
+
+        # Prefixes written differently are the same route
+        before.updateRoutes("rip", {"10.2.0.1/16": "192.168.1.6 G0/0"})
+        after.updateRoutes("rip", {"10.2.0.0/16": "192.168.1.6 G0/0", "10.3.0.0/16": "192.168.1.6 G0/0"})
+        self.assertEqual(list(before.diff(after, "rip")), [("added", "10.3.0.0/16", None, "192.168.1.6 G0/0")])
+
+    def testEvents(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt2 = Router("Cisco", "Nexus", "NXOS", "R2")
+        events = []
+        batches = []
+        subscription = rt1.subscribe(events.append)
+        rt1.subscribe(batches.append, (ROUTE_ADDED, ROUTE_CHANGED, ROUTE_REMOVED), coalesce=True)
+
+        rt1.addInterface("G0/0")
+        rt2.addInterface("G0/1")
+        rt1.setIP("G0/0", "10.0.12.1/24")
+        rt1.connect("G0/0", rt2, "G0/1")
+        rt1.addRoute("172.16.0.0/16", "10.0.12.2")
+        rt1.deleteRoute("172.16.0.0/16")
+        self.assertEqual([(event.kind, event.key) for event in events], [
+            (INTERFACE_ADDED, "G0/0"), (ROUTE_ADDED, "10.0.12.0/24"), (ADDRESS_SET, "G0/0"),
+            (LINK_UP, "G0/0"), (ROUTE_ADDED, "172.16.0.0/16"), (ROUTE_REMOVED, "172.16.0.0/16")])
+        self.assertEqual(events[3].new, (rt2, "G0/1"))
+        self.assertEqual(events[5].old, "10.0.12.2 ")
+        self.assertEqual(len(batches), 3)
+
+        # Setting the same hostname changes nothing
+        renames = []
+        rt2.subscribe(renames.append, (HOSTNAME_CHANGED,))
+        self.assertTrue(rt2.setHostname("R2"))
+        self.assertEqual(renames, [])
+        self.assertTrue(rt2.setHostname("RT2"))
+        self.assertEqual([(event.old, event.new) for event in renames], [("R2", "RT2")])
+
+        # A batch is delivered once, coalesced to the net change
+        subscription.unsubscribe()
+        del batches[:]
+        with rt1.batch():
+            rt1.addRoute("172.16.0.0/16", "10.0.12.2")
+            rt1.addRoute("172.16.0.0/16", "10.0.12.3")
+            rt1.addRoute("172.17.0.0/16", "10.0.12.2")
+            rt1.deleteRoute("172.17.0.0/16")
+            rt1.updateRoutes("ospf", {"192.168.0.0/24": "10.0.12.2 G0/0"})
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([(event.kind, event.key, event.old, event.new, event.source) for event in batches[0]], [
+            (ROUTE_ADDED, "172.16.0.0/16", None, "10.0.12.3 ", None),
+            (ROUTE_ADDED, "192.168.0.0/24", None, "10.0.12.2 G0/0", "ospf")])
+
+        # Bulk adds are one batch
+        del batches[:]
+        rt1.addRoutes([("10.1.0.0/16", "10.0.12.2"), ("10.2.0.0/16", "10.0.12.2")])
+        self.assertEqual([event.key for event in batches[0]], ["10.1.0.0/16", "10.2.0.0/16"])
+        self.assertEqual(len(events), 6)
+
+        del rt1, rt2
+
+    def testSummarize(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt1.addInterface("G0/0")
+        rt1.setIP("G0/0", "192.168.1.1/24")
+        rt1.addRoute("10.0.0.0/8", "192.168.1.2", "G0/0")
+
+        # Contained in 10.0.0.0/8 with the same route
+        rt1.addRoute("10.1.0.0/16", "192.168.1.2", "G0/0")
+
+        # Siblings merged up to 172.16.0.0/22
+        for third in range(4):
+            rt1.addRoute("172.16.{}.0/24".format(third), "192.168.1.3")
+        rt1.addRoute("172.16.1.128/25", "192.168.1.4")
+
+        self.assertEqual(rt1.summarize(), {
+            "default": "not set",
+            "10.0.0.0/8": "192.168.1.2 G0/0",
+            "172.16.0.0/22": "192.168.1.3 ",
+            "172.16.1.128/25": "192.168.1.4 ",
+            "192.168.1.0/24": "directly connected G0/0"})
+
+        # A default route with the same next hop makes the /22 redundant
+        rt1.addRoute("0.0.0.0/0", "192.168.1.3")
+        summary = rt1.summarize()
+        self.assertEqual(summary["default"], "192.168.1.3 ")
+        self.assertNotIn("172.16.0.0/22", summary)
+        self.assertEqual(len(summary), 4)
+
+        del rt1
+
+    def testVrf(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt1.addInterface("G0/0")
+        rt1.addInterface("G0/1")
+        rt1.setIP("G0/0", "10.0.0.1/24")
+        rt1.setIP("G0/1", "10.0.1.1/24")
+        self.assertFalse(rt1.setVrf("G0/1", "CUST"))
+        self.assertTrue(rt1.addVrf("CUST"))
+        self.assertFalse(rt1.addVrf("CUST"))
+        self.assertEqual(rt1.getVrfs(), ["CUST"])
+
+        # Binding removes the IP address like IOS does, with the routes that depended on it
+        self.assertTrue(rt1.addRoute("172.20.0.0/16", "10.0.1.2"))
+        self.assertTrue(rt1.addRoute("172.21.0.0/16", "10.0.0.2", "G0/1"))
+        self.assertTrue(rt1.setVrf("G0/1", "CUST"))
+        self.assertNotIn("172.20.0.0/16", rt1.getRoute())
+        self.assertNotIn("172.21.0.0/16", rt1.getRoute())
+        self.assertEqual(rt1.getVrf("G0/1"), "CUST")
+        self.assertIsNone(rt1.getAddress("G0/1"))
+        self.assertTrue(rt1.setIP("G0/1", "10.0.0.1/24"))
+        self.assertEqual(rt1.getRoute()["10.0.0.0/24"], "directly connected G0/0")
+        self.assertEqual(rt1.getRoute(vrf="CUST")["10.0.0.0/24"], "directly connected G0/1")
+
+        # Same prefix in both tables, interfaces only serve their own VRF
+        self.assertTrue(rt1.addRoute("172.16.0.0/16", "10.0.0.2", "G0/0"))
+        self.assertTrue(rt1.addRoute("172.16.0.0/16", "10.0.0.3", "G0/1", vrf="CUST"))
+        self.assertFalse(rt1.addRoute("172.17.0.0/16", "10.0.0.3", "G0/0", vrf="CUST"))
+        self.assertFalse(rt1.addRoute("172.17.0.0/16", "10.0.0.3", vrf="NONE"))
+        self.assertEqual(rt1.addRoutes([("172.17.0.0/16", "10.0.0.3", "G0/0")], vrf="CUST")[0][2], "interface in another vrf")
+        self.assertEqual(rt1.lookup("172.16.1.1"), ("172.16.0.0/16", "10.0.0.2", "G0/0"))
+        self.assertEqual(rt1.lookup("172.16.1.1", vrf="CUST"), ("172.16.0.0/16", "10.0.0.3", "G0/1"))
+        self.assertIsNone(rt1.lookup("172.16.1.1", vrf="NONE"))
+
+        # Destinations and routes are stored once for every VRF
+        rt1.addRoute("192.168.0.0/16", "10.0.0.2")
+        rt1.addRoute("192.168.0.0/16", "10.0.0.2", vrf="CUST")
+        dst = [key for key in rt1.getRoute() if key == "192.168.0.0/16"][0]
+        vrfDst = [key for key in rt1.getRoute(vrf="CUST") if key == "192.168.0.0/16"][0]
+        self.assertIs(dst, vrfDst)
+        self.assertIs(rt1.getRoute()[dst], rt1.getRoute(vrf="CUST")[dst])
+
+        # Snapshots keep the VRFs and their bindings
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "r1.snap")
+            rt1.save(path)
+            rt2 = Router.load(path)
+        self.assertEqual(rt2.getVrf("G0/1"), "CUST")
+        self.assertEqual(dict(rt2.getRoute(vrf="CUST")), dict(rt1.getRoute(vrf="CUST")))
+        self.assertEqual(rt2.lookup("172.16.1.1", vrf="CUST"), ("172.16.0.0/16", "10.0.0.3", "G0/1"))
+
+        # Deleting the VRF puts its interfaces back in the global table without an IP
+        self.assertTrue(rt1.deleteVrf("CUST"))
+        self.assertIsNone(rt1.getVrf("G0/1"))
+        self.assertIsNone(rt1.getAddress("G0/1"))
+        self.assertEqual(rt1.getRoute(vrf="CUST"), {})
+        self.assertEqual(rt1.getVrfs(), [])
+
+        del rt1, rt2
+
+    def testEcmp(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        for index in range(4):
+            rt1.addInterface("G0/{}".format(index))
+            rt1.setIP("G0/{}".format(index), "10.0.{}.1/24".format(index))
+        paths = [("10.0.{}.2".format(index), "G0/{}".format(index)) for index in range(4)]
+        self.assertTrue(rt1.addEcmpRoute("172.16.0.0/16", paths))
+        self.assertTrue(rt1.addEcmpRoute("172.17.0.0/16", paths[::-1] + paths[:1]))
+        self.assertFalse(rt1.addEcmpRoute("172.18.0.0/16", paths + [("10.0.9.2", "G9/9")]))
+        self.assertFalse(rt1.addEcmpRoute("172.18.0.0/16", []))
+
+        # Groups with the same paths are one shared object
+        group = rt1.getRoute()["172.16.0.0/16"]
+        self.assertIsInstance(group, NextHopGroup)
+        self.assertIs(group, rt1.getRoute()["172.17.0.0/16"])
+        self.assertEqual(len(group), 4)
+
+        # A single path is a plain route
+        self.assertTrue(rt1.addEcmpRoute("172.19.0.0/16", paths[:1] * 2))
+        self.assertEqual(rt1.getRoute()["172.19.0.0/16"], "10.0.0.2 G0/0")
+
+        # A flow always takes the same path and flows spread over every path
+        flows = [flow_hash(ip_to_int("192.0.2.1"), ip_to_int("172.16.0.1"), 6, port, 443) for port in range(1024, 1424)]
+        self.assertEqual(rt1.lookup("172.16.0.1", flow=flows[0]), rt1.lookup("172.16.0.1", flow=flows[0]))
+        used = [rt1.lookup("172.16.0.1", flow=flow)[2] for flow in flows]
+        self.assertEqual(sorted(set(used)), ["G0/0", "G0/1", "G0/2", "G0/3"])
+        self.assertTrue(all(used.count(iface) > 60 for iface in set(used)))
+
+        # ECMP continuation lines join the route above them
+        loaded, rejected = load_routes(rt1, [
+            "",
+            "O        192.168.0.0/24 [110/2] via 10.0.0.2, 00:00:10, GigabitEthernet0/0",
+            "                        [110/2] via 10.0.1.2, 00:00:10, G0/1",
+            "         [110/2] via 10.0.2.2, 00:00:10, G0/2",
+        ])
+        self.assertEqual(loaded, 0)
+        self.assertEqual([(lineno, reason) for lineno, line, reason in rejected], [(2, "unknown interface")])
+        loaded, rejected = load_routes(rt1, [
+            "",
+            "O        192.168.0.0/24 [110/2] via 10.0.0.2, 00:00:10, G0/0",
+            "                        [110/2] via 10.0.1.2, 00:00:10, G0/1",
+        ])
+        self.assertEqual((loaded, rejected), (1, []))
+        self.assertEqual(list(rt1.getRoute()["192.168.0.0/24"]), ["10.0.0.2 G0/0", "10.0.1.2 G0/1"])
+
+        # Array tables and snapshots keep the groups
+        rt2 = Router("Cisco", "c7200", "IOS", "R2", table=ArrayRouteTable())
+        rt2.addInterface("G0/0")
+        rt2.addInterface("G0/1")
+        rt2.setIP("G0/0", "10.0.0.1/24")
+        rt2.setIP("G0/1", "10.0.1.1/24")
+        rt2.addEcmpRoute("0.0.0.0/0", paths[:2])
+        rt2.addEcmpRoute("172.16.0.0/16", paths[:2])
+        self.assertEqual(list(rt2.getRoute()["172.16.0.0/16"]), ["10.0.0.2 G0/0", "10.0.1.2 G0/1"])
+        entry = list(rt2.getRoute().entries())[2]
+        self.assertIs(entry.group, rt2.getRoute()["172.16.0.0/16"])
+        self.assertEqual((entry.prefix, entry.nexthop, entry.iface), ("172.16.0.0/16", "10.0.0.2", "G0/0"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "r2.snap")
+            rt2.save(path)
+            rt3 = Router.load(path)
+        self.assertIs(rt3.getRoute()["172.16.0.0/16"], rt2.getRoute()["172.16.0.0/16"])
+        self.assertIs(rt3.getRoute()["default"], rt2.getRoute()["default"])
+
+        del rt1, rt2, rt3
+
+    def testOverlap(self):
+        topology = Topology()
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        rt2 = Router("Cisco", "c7200", "IOS", "R2")
+        for router in (rt1, rt2):
+            router.addInterface("G0/0")
+            router.addInterface("G0/1")
+            topology.addRouter(router)
+
+        # Both ends of a link share their subnet
+        rt1.connect("G0/0", rt2, "G0/0")
+        rt1.setIP("G0/0", "10.0.12.1/30")
+        rt2.setIP("G0/0", "10.0.12.2/30")
+        rt1.setIP("G0/1", "172.16.0.1/16")
+        detector = OverlapDetector(topology)
+        self.assertTrue(detector.isClean())
+        self.assertEqual(find_overlaps(topology), [])
+
+        # Contained subnet on another router, then the same address on both ends of the link
+        rt2.setIP("G0/1", "172.16.5.1/24")
+        conflict = (("R1", "G0/1", "172.16.0.1/16"), ("R2", "G0/1", "172.16.5.1/24"))
+        self.assertEqual(detector.conflicts(), [conflict])
+        rt2.setIP("G0/0", "10.0.12.1/30")
+        self.assertEqual(len(detector.conflicts()), 2)
+        self.assertEqual(detector.conflicts(), find_overlaps(topology))
+
+        # Links and removed addresses are followed too
+        rt2.setIP("G0/0", "10.0.12.2/30")
+        rt1.disconnect("G0/0", rt2, "G0/0")
+        self.assertEqual(len(detector.conflicts()), 2)
+        rt1.connect("G0/0", rt2, "G0/0")
+        rt2.deleteIP("G0/1")
+        self.assertTrue(detector.isClean())
+
+        # Pushes can be checked before they are applied
+        self.assertEqual(detector.check(rt2, "G0/1", "172.16.0.9/24"), [("R1", "G0/1", "172.16.0.1/16")])
+        self.assertEqual(detector.check(rt2, "G0/1", "192.168.0.1/24"), [])
+        self.assertIsNone(rt2.getAddress("G0/1"))
+
+        # Prefixes in different VRFs don't overlap
+        rt2.addVrf("CUST")
+        rt2.setVrf("G0/1", "CUST")
+        rt2.setIP("G0/1", "172.16.5.1/24")
+        self.assertTrue(detector.isClean())
+
+        # Routers joining and leaving the topology later
+        rt3 = Router("Cisco", "c7200", "IOS", "R3")
+        rt3.addInterface("G0/0")
+        rt3.setIP("G0/0", "10.0.0.1/16")
+        topology.addRouter(rt3)
+        self.assertFalse(detector.addRouter(rt3))
+        self.assertEqual(len(detector.conflicts()), 2)
+        rt3.setIP("G0/0", "10.1.0.1/16")
+        self.assertTrue(detector.isClean())
+        rt3.setIP("G0/0", "10.0.0.1/16")
+        self.assertTrue(topology.removeRouter(rt3))
+        self.assertTrue(detector.isClean())
+        self.assertFalse(detector.removeRouter(rt3))
+
+        # Routers outside the topology are watched by hand
+        self.assertTrue(detector.addRouter(rt3))
+        self.assertEqual(len(detector.conflicts()), 2)
+        self.assertTrue(detector.removeRouter(rt3))
+        self.assertTrue(detector.isClean())
+
+        del rt1, rt2, rt3
+
+    def testShow(self):
+        rt1 = Router("Cisco", "c7200", "IOS", "R1")
+        for interfaceName in ("G0/10", "G0/2", "G0/1"):
+            rt1.addInterface(interfaceName)
+        rt1.setIP("G0/1", "192.168.1.1/24")
+        rt1.addRoute("172.16.0.0/16", "192.168.1.2")
+        rt1.addRoute("10.0.0.0/8", "192.168.1.2")
+        rt1.addRoute("10.0.0.0/16", "192.168.1.3")
+        rt1.updateRoutes("ospf", {"10.1.0.0/16": "192.168.1.4 G0/1"})
+
+        self.assertEqual(list(interface_lines(rt1))[2:5], ["G0/1 192.168.1.1/24", "G0/2 unassigned IP", "G0/10 unassigned IP"])
+
+        # The routing table and the route sources in prefix order
+        self.assertEqual(list(routing_lines(rt1)), [
+            "Show routing table of R1",
+            "Gateway of last resort is not set",
+            "10.0.0.0/8 via 192.168.1.2 ",
+            "10.0.0.0/16 via 192.168.1.3 ",
+            "10.1.0.0/16 via 192.168.1.4 G0/1 (ospf)",
+            "172.16.0.0/16 via 192.168.1.2 ",
+            "192.168.1.0/24 via directly connected G0/1",
+            ""])
+
+        lines = list(routing_lines(rt1))
+        self.assertEqual(list(filter_lines(lines, begin="^172")), lines[5:])
+        self.assertEqual(list(filter_lines(lines, include="10\\.")), lines[2:5])
+        self.assertEqual(list(filter_lines(lines, begin="^10", exclude="ospf")), lines[2:4] + lines[5:])
+        self.assertEqual(list(page(lines, 2, 3)), lines[3:6])
+
+        # Pages stop rendering once they are full
+        rendered = []
+        self.assertEqual(list(page((rendered.append(index) or index for index in range(100)), 1, 5)), [0, 1, 2, 3, 4])
+        self.assertEqual(len(rendered), 5)
+
+        output = io.StringIO()
+        self.assertEqual(write_lines(iter(lines), output, chunk=3), len(lines))
+        self.assertEqual(output.getvalue(), "\n".join(lines) + "\n")
+        output = io.StringIO()
+        self.assertEqual(show(routing_lines(rt1), include="via 192", page_number=1, page_size=2, output=output), 2)
+        self.assertEqual(output.getvalue().splitlines(), lines[2:4])
+
+        del rt1
+
+    def testCascadingDelete(self):
+        for table in (None, ArrayRouteTable()):
+            rt1 = Router("Cisco", "c7200", "IOS", "R1", table)
+            rt1.addInterface("G0/0")
+            rt1.addInterface("G0/1")
+            rt1.setIP("G0/0", "192.168.1.1/24")
+            rt1.setIP("G0/1", "192.168.2.1/24")
+            rt1.addRoute("10.0.0.0/8", "192.168.1.2", "G0/0")
+            rt1.addRoute("10.1.0.0/16", "192.168.1.3")
+            rt1.addRoute("10.2.0.0/16", "192.168.2.2")
+            rt1.addRoute("0.0.0.0/0", "192.168.1.254")
+            rt1.addEcmpRoute("172.16.0.0/16", [("192.168.1.2", "G0/0"), ("192.168.2.2", "G0/1")])
+
+            # Routes out of the interface or through its subnet stay configured
+            self.assertTrue(rt1.deleteIP("G0/0"))
+            self.assertEqual(len(rt1.getRoute()), 6)
+            rt1.setIP("G0/0", "192.168.1.1/24")
+
+            # unless they go with its address, ECMP routes lose one path
+            events = []
+            rt1.subscribe(events.extend, (ROUTE_REMOVED, ROUTE_CHANGED), batch=True)
+            self.assertTrue(rt1.deleteIP("G0/0", cascade=True))
+            routingtable = rt1.getRoute()
+            self.assertEqual(dict(routingtable), {
+                "default": "not set",
+                "10.2.0.0/16": "192.168.2.2 ",
+                "172.16.0.0/16": "192.168.2.2 G0/1",
+                "192.168.2.0/24": "directly connected G0/1"})
+            self.assertEqual(sorted(event.key for event in events),
+                             ["10.0.0.0/8", "10.1.0.0/16", "172.16.0.0/16", "192.168.1.0/24", "default"])
+
+            # The index follows later changes
+            rt1.addRoute("10.3.0.0/16", "192.168.2.3", "G0/1")
+            rt1.addRoute("10.2.0.0/16", "192.168.3.2", "G0/1")
+            rt1.deleteRoute("172.16.0.0/16")
+            self.assertTrue(rt1.deleteInterface("G0/1"))
+            self.assertEqual(dict(rt1.getRoute()), {"default": "not set"})
+
+            # A directly connected route without an interface depends on nothing
+            rt1.addRoute("172.17.0.0/16", "directly connected")
+            rt1.setIP("G0/0", "192.168.1.1/24")
+            self.assertTrue(rt1.deleteInterface("G0/0"))
+            self.assertTrue(rt1.addRoute("172.18.0.0/16", "directly connected"))
+            self.assertTrue(rt1.deleteRoute("172.17.0.0/16"))
+            self.assertEqual(dict(rt1.getRoute()), {"default": "not set", "172.18.0.0/16": "directly connected "})
+
+            del rt1
+
+    def testGenerator(self):
+        # Same seed, same network
+        self.assertEqual([record[:6] for record in generate("random", 50, seed=3)], [record[:6] for record in generate("random", 50, seed=3)])
+        self.assertNotEqual([record[5] for record in generate("random", 50, seed=3)], [record[5] for record in generate("random", 50, seed=4)])
+
+        links = {"spine-leaf": 4 * 30, "ring": 40, "random": 60, "hub-spoke": 3 + 37}
+        options = {"spine-leaf": {"spines": 10}, "hub-spoke": {"hubs": 3}}
+        for kind, count in links.items():
+            topology = build(generate(kind, 40, seed=1, routes=5, **options.get(kind, {})))
+            self.assertEqual(len(topology), 40)
+            self.assertEqual(len(list(topology.links())), count)
+
+            # Every link is a /30 with both ends in the routing table and reachable by lookup
+            for router, local_int, remote_host, remote_int in topology.links():
+                address, length = router.getAddress(local_int)
+                self.assertEqual(length, 30)
+                self.assertEqual(remote_host.getAddress(remote_int)[0], address ^ 3)
+                self.assertEqual(remote_host.lookup(address)[1:], ("directly connected", remote_int))
+
+            # Static routes go to the first neighbor
+            router = topology.getRouter("R7") or topology.getRouter("leaf7") or topology.getRouter("spoke7")
+            statics = [route for dst, route in router.getRoute().items() if not route.startswith("directly") and dst != "default"]
+            self.assertEqual(len(statics), 5)
+            self.assertTrue(router.addRoute("172.16.0.0/16", statics[0].split()[0]))
+
+        # Too many links for 10.0.0.0/8
+        self.assertIsNone(generate("spine-leaf", 1 << 21, spines=8, uplinks=8))
+
+        # A hub with more spokes than an ArrayRouteTable holds interfaces, by default the spokes are spread
+        self.assertIsNone(generate("hub-spoke", 70000, hubs=1))
+        records = generate("hub-spoke", 70000)
+        self.assertEqual(len(records), 70000)
+        self.assertLessEqual(max(len(record[4]) for record in records), RouteTable.MAX_INTERFACES)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fabric.snap")
+            records = generate("spine-leaf", 40, routes=3)
+            write_snapshot(path, records)
+            topology = Topology.load(path)
+        self.assertEqual(len(list(topology.links())), len(list(build(records).links())))
+
+    def testBenchmark(self):
+        import Benchmark
+        import contextlib
+        import json
+
+        # Rates regress when they drop, every other metric when it grows, missing and zero baselines are skipped
+        baseline = {"metrics": {"a.add_per_s": 100, "a.build_s": 1.0, "a.peak_memory_mb": 10, "a.gone_per_s": 5, "a.idle_s": 0}}
+        results = {"metrics": {"a.add_per_s": 70, "a.build_s": 1.1, "a.peak_memory_mb": 15, "a.idle_s": 1}}
+        self.assertEqual(Benchmark.compare(results, baseline, 0.2), [("a.add_per_s", 100, 70, -0.3), ("a.peak_memory_mb", 10, 15, 0.5)])
+        self.assertEqual(Benchmark.compare(results, baseline, 0.6), [])
+
+        # A small run writes its JSON results, a much faster baseline makes it fail
+        directory = tempfile.mkdtemp()
+        output, faster = os.path.join(directory, "results.json"), os.path.join(directory, "faster.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(Benchmark.main(["--scale", "0.01", "--only", "interfaces", "--output", output]), 0)
+        with open(output) as stored:
+            results = json.load(stored)
+        self.assertEqual(results["scale"], 0.01)
+        self.assertIn("interfaces.setIP_per_s", results["metrics"])
+        self.assertTrue(all(isinstance(value, (int, float)) for value in results["metrics"].values()))
+
+        results["metrics"]["interfaces.setIP_per_s"] *= 100
+        with open(faster, "w") as stored:
+            json.dump(results, stored)
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            self.assertEqual(Benchmark.main(["--scale", "0.01", "--only", "interfaces", "--baseline", faster]), 1)
+        self.assertIn("REGRESSION interfaces.setIP_per_s", printed.getvalue())
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
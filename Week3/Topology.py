@@ -0,0 +1,141 @@
+""" Topology: routers indexed by hostname with an adjacency index of their links """
+from Router import Router
+from Events import HOSTNAME_CHANGED, LINK_UP, LINK_DOWN
+
+class Topology:
+
+    def __init__(self):
+        self.__routers = {}
+        self.__adjacency = {}
+        self.__order = {}
+        self.__listeners = []
+        self.__subscriptions = {}
+
+    def __len__(self):
+        return len(self.__routers)
+
+    def __contains__(self, hostname):
+        return hostname in self.__routers
+
+    # Routers
+    def addRouter(self, router):
+        hostname = router.getHostname()
+        if hostname in self.__routers or router.topology is not None:
+            return False
+        self.__routers[hostname] = router
+        self.__adjacency[router] = {}
+        self.__order[router] = len(self.__order)
+        router.topology = self
+        self.__subscriptions[router] = router.subscribe(self.__routerChanged, (LINK_UP, LINK_DOWN, HOSTNAME_CHANGED))
+        self.__notify("routerAdded", router)
+
+        # Pick up links that were connected before the router was registered
+        for local_int, (remote_name, remote_int) in router.connection.items():
+            remote_host = self.__routers.get(remote_name)
+            if remote_host is not None and remote_host.connection.get(remote_int) == [hostname, local_int]:
+                self.linkUp(router, local_int, remote_host, remote_int)
+        return True
+
+    def removeRouter(self, router):
+        """ unregister router, its connections stay configured on the routers; listeners see its links go down """
+        if self.__routers.get(router.getHostname()) is not router:
+            return False
+        for local_int, (remote_host, remote_int) in list(self.__adjacency[router].items()):
+            self.linkDown(router, local_int, remote_host, remote_int)
+        del self.__routers[router.getHostname()]
+        del self.__adjacency[router]
+        del self.__order[router]
+        self.__subscriptions.pop(router).unsubscribe()
+        router.topology = None
+        self.__notify("routerRemoved", router)
+        return True
+
+    def getRouter(self, hostname):
+        return self.__routers.get(hostname)
+
+    def getRouters(self):
+        return self.__routers
+
+    # Adjacency
+    def neighbor(self, router, local_int):
+        """ (remote Router, remote interface) connected to local_int, None when nothing is connected """
+        return self.__adjacency[router].get(local_int)
+
+    def neighbors(self, router):
+        """ {local interface: (remote Router, remote interface)} """
+        return self.__adjacency[router]
+
+    def links(self):
+        """ yield every link once as (router, local interface, remote Router, remote interface) """
+        order = self.__order
+        for router, adjacency in self.__adjacency.items():
+            for local_int, (remote_host, remote_int) in adjacency.items():
+                if (order[router], local_int) < (order[remote_host], remote_int):
+                    yield router, local_int, remote_host, remote_int
+
+    def addListener(self, listener):
+        """ listener.linkUp/linkDown(router, local_int, remote_host, remote_int) are called on every link change
+
+        Listeners that define routerAdded/routerRemoved(router) are also told about routers joining,
+        before their links come up, and leaving, after their links went down.
+        """
+        self.__listeners.append(listener)
+
+    def __notify(self, method, router):
+        for listener in self.__listeners:
+            if hasattr(listener, method):
+                getattr(listener, method)(router)
+
+    # Router change events, both ends of a link report it so the second report finds the index up to date
+    def __routerChanged(self, event):
+        if event.kind == LINK_UP:
+            self.linkUp(event.router, event.key, *event.new)
+        elif event.kind == LINK_DOWN:
+            self.linkDown(event.router, event.key, *event.old)
+        else:
+            self.hostnameChanged(event.router, event.old)
+
+    def linkUp(self, router, local_int, remote_host, remote_int):
+        if router in self.__adjacency and remote_host in self.__adjacency:
+            if self.__adjacency[router].get(local_int) == (remote_host, remote_int):
+                return
+            self.__adjacency[router][local_int] = (remote_host, remote_int)
+            self.__adjacency[remote_host][remote_int] = (router, local_int)
+            for listener in self.__listeners:
+                listener.linkUp(router, local_int, remote_host, remote_int)
+
+    def linkDown(self, router, local_int, remote_host, remote_int):
+        if router in self.__adjacency and remote_host in self.__adjacency:
+            if self.__adjacency[router].get(local_int) != (remote_host, remote_int):
+                return
+            self.__adjacency[router].pop(local_int, None)
+            self.__adjacency[remote_host].pop(remote_int, None)
+            for listener in self.__listeners:
+                listener.linkDown(router, local_int, remote_host, remote_int)
+
+    def canRename(self, router, hostname):
+        return hostname not in self.__routers or self.__routers[hostname] is router
+
+    def hostnameChanged(self, router, old_hostname):
+        """ re-index router and refresh the hostname its neighbors hold in their connection """
+        del self.__routers[old_hostname]
+        hostname = router.getHostname()
+        self.__routers[hostname] = router
+        for local_int, (remote_host, remote_int) in self.__adjacency[router].items():
+            remote_host.connection[remote_int] = [hostname, local_int]
+
+    # Snapshot
+    def save(self, path):
+        """ write every router with its connections to one snapshot file """
+        Router.saveAll(path, list(self.__routers.values()))
+
+    @classmethod
+    def load(cls, path):
+        """ topology of a snapshot file, None when path is not a snapshot """
+        routers = Router.loadAll(path)
+        if routers is None:
+            return None
+        topology = cls()
+        for router in routers:
+            topology.addRouter(router)
+        return topology
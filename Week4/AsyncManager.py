@@ -0,0 +1,379 @@
+""" asyncio backend of Manager: the same operations as coroutines over asyncssh
+
+    async with AsyncManager("172.31.179.4", username, password) as manageObj:
+        await manageObj.create_loopback(number=100, ip="172.20.179.4", mask="255.255.255.0", vrf_name="Net")
+        print(await manageObj.show_interface())
+
+A session is an interactive shell read up to the next IOS prompt, so thousands of devices are
+served by one event loop instead of a blocked thread each. Sessions are pooled per device like
+Manager's, config lines are the ones of the Manager operations (see IOSCommands.py) and are
+written a chunk at a time, so a push is one round trip per chunk. netmiko is not needed. Without devices at hand, FakeIOS.py emulates them:
+
+    python AsyncManager.py --devices 1000 --latency 0.05
+"""
+import argparse
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+import asyncssh
+from FakeIOS import FakeIOS, serve
+import IOSCommands
+from IOSCommands import CONFIG_CHUNK, CONFIG_ERROR, IDLE_TIMEOUT
+
+# Seconds to log in and to wait for a prompt
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 60
+
+# SSH handshakes in progress at the same time, they are the expensive part of a session
+MAX_CONNECTING = 100
+
+class AsyncSession:
+    """ Interactive shell of one device, commands are read up to the prompt that follows them """
+
+    def __init__(self, connection, process, hostname):
+        self.connection = connection
+        self.__process = process
+        self.hostname = hostname
+        self.__prompt = re.compile(r"(^|\n){}(\([\w-]*\))?[#>]\s*$".format(re.escape(hostname)))
+        self.__exec_prompt = re.compile(r"(^|\n){}[#>]\s*$".format(re.escape(hostname)))
+
+        # Every prompt of a config push, each line typed gets one
+        self.__prompts = re.compile(r"(^|\n){}(\([\w-]*\))?[#>]".format(re.escape(hostname)))
+        self.last_used = time.monotonic()
+
+    @classmethod
+    async def open(cls, ip, username, password, port=22, timeout=CONNECT_TIMEOUT):
+        """ logged in session with paging turned off """
+        connection = await asyncio.wait_for(asyncssh.connect(ip, port, username=username, password=password,
+                                                             known_hosts=None), timeout)
+        try:
+            process = await connection.create_process(term_type="vt100")
+            banner = await _read_until(process, re.compile(r"[\w.-]+[#>]\s*$"), timeout)
+            hostname = banner.strip().splitlines()[-1].strip()[:-1]
+            session = cls(connection, process, hostname)
+            await session.send_command("terminal length 0")
+        except BaseException:
+            connection.close()
+            raise
+        return session
+
+    def is_alive(self):
+        return not self.__process.is_closing()
+
+    async def send_command(self, command, expect_string=None, timeout=READ_TIMEOUT):
+        """ output of an exec command, without the echoed command and the prompt """
+        self.__process.stdin.write(command + "\n")
+        pattern = re.compile(expect_string) if expect_string else self.__prompt
+        output = await _read_until(self.__process, pattern, timeout)
+        self.last_used = time.monotonic()
+        lines = output.replace("\r\n", "\n").split("\n")
+        # The echo is the first line, the prompt the last one
+        return "\n".join(lines[1:-1] if expect_string is None else lines[1:])
+
+    async def send_config_set(self, commands, chunk_size=CONFIG_CHUNK, timeout=READ_TIMEOUT):
+        """ output of commands typed in config mode, "conf t" and "end" around them
+
+        Lines are written chunk_size at a time without waiting for the prompt after each one, the
+        next chunk once every line of the chunk got its prompt. After a chunk with a rejected line
+        the rest is not sent, only "end".
+        """
+        lines = ["configure terminal"] + list(commands) + ["end"]
+        output = ""
+        start = 0
+        while start < len(lines):
+            chunk = lines[start:start + chunk_size]
+            start += len(chunk)
+            self.__process.stdin.write("\n".join(chunk) + "\n")
+            await self.__process.stdin.drain()
+            output += await _read_until(self.__process, self.__prompts, timeout, len(chunk))
+            if start < len(lines) and CONFIG_ERROR.search(output.replace("\r\n", "\n")):
+                lines[start:] = ["end"]
+        self.last_used = time.monotonic()
+        return output.replace("\r\n", "\n")
+
+    def close(self):
+        self.connection.close()
+
+async def _read_until(process, pattern, timeout, count=1):
+    """ output up to the first time pattern matches its end, or up to count matches anywhere """
+    output = ""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        data = await asyncio.wait_for(process.stdout.read(65536), max(0, deadline - loop.time()))
+        if not data:
+            raise ConnectionError("session closed")
+        output += data
+        if pattern.search(output) if count == 1 else sum(1 for match in pattern.finditer(output)) >= count:
+            return output
+
+class AsyncSessionPool:
+    """ One open session per device on one event loop, see HW4_Netmiko.SessionPool """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_connecting=MAX_CONNECTING):
+        self.__idle_timeout = idle_timeout
+        self.__connecting = asyncio.Semaphore(max_connecting)
+
+        # key -> [lock, session or None]
+        self.__sessions = {}
+
+    @asynccontextmanager
+    async def session(self, key, connect):
+        """ yield the open session of device key, coroutine function connect() opens one and returns False on failure """
+        entry = self.__sessions.setdefault(key, [asyncio.Lock(), None])
+        async with entry[0]:
+            session = entry[1]
+            if session and (time.monotonic() - session.last_used > self.__idle_timeout or not session.is_alive()):
+                session.close()
+                entry[1] = None
+            if not entry[1]:
+                async with self.__connecting:
+                    entry[1] = await connect()
+            try:
+                yield entry[1]
+            except BaseException:
+                # The device may be in the middle of a command
+                if entry[1]:
+                    entry[1].close()
+                entry[1] = None
+                raise
+
+    def close(self, key=None):
+        """ close the session of device key, or every session """
+        keys = list(self.__sessions) if key is None else [key]
+        for key in keys:
+            entry = self.__sessions.pop(key, None)
+            if entry and entry[1]:
+                entry[1].close()
+
+    def __len__(self):
+        return sum(1 for lock, session in self.__sessions.values() if session)
+
+class AsyncManager:
+    """ Manager whose operations are coroutines, they return what the Manager operations return """
+
+    def __init__(self, ip, username, password, port=22, pool=None):
+        self.__ip = ip
+        self.__username = username
+        self.__password = password
+        self.__port = port
+        self.__pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __key(self):
+        return self.__ip, self.__port, self.__username
+
+    async def create_connection(self):
+        """ Create connection to device """
+        try:
+            return await AsyncSession.open(self.__ip, self.__username, self.__password, self.__port)
+        except (asyncio.TimeoutError, OSError):
+            print("error: connection timeout to device = " + self.__ip)
+            return False
+        except asyncssh.PermissionDenied:
+            print("error: Authentication failed to device = " + self.__ip)
+            return False
+        except asyncssh.Error as e:
+            print("error: {} on device = {}".format(e, self.__ip))
+            return False
+
+    def session(self):
+        """ Pooled session to device, False when it cannot be opened
+
+        async with manageObj.session() as session:
+            ...
+        """
+        if self.__pool is None:
+            # An event loop of its own needs a pool of its own, asyncio locks belong to one loop
+            self.__pool = _default_pool()
+        return self.__pool.session(self.__key(), self.create_connection)
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close(self.__key())
+
+    async def send_command(self, command, expect_string=None):
+        """ output of an exec command, False when it failed """
+        async with self.session() as session:
+            if not session:
+                return False
+            try:
+                return await session.send_command(command, expect_string)
+            except (asyncio.TimeoutError, ConnectionError, asyncssh.Error) as e:
+                session.close()
+                return False
+
+    async def push_config(self, commands, chunk_size=CONFIG_CHUNK):
+        """ Configure commands in one config mode session, False when the device rejects a line """
+        commands = [cmd for cmd in commands if cmd.strip()]
+        if not commands:
+            return True
+        async with self.session() as session:
+            if not session:
+                return False
+            try:
+                output = await session.send_config_set(commands, chunk_size)
+            except (asyncio.TimeoutError, ConnectionError, asyncssh.Error) as e:
+                session.close()
+                return False
+        error = CONFIG_ERROR.search(output)
+        if error:
+            print("error: {} on device = {}".format(error.group(0).strip(), self.__ip))
+            return False
+        return True
+
+    # Exec operations
+    async def save_config(self):
+        """ Save configuration into flash """
+        return await self.send_command("write mem") is not False
+
+    async def backup_config(self, filename="config"):
+        """ Backup recent configuration into filename.old """
+        async with self.session() as session:
+            if not session:
+                return False
+            try:
+                await session.send_command("copy run flash:{}.old".format(filename), expect_string=r"Destination filename")
+                await session.send_command("")
+            except (asyncio.TimeoutError, ConnectionError, asyncssh.Error) as e:
+                session.close()
+                return False
+            return True
+
+    async def show_hostname(self):
+        hostname = await self.send_command("sh run | in hostname")
+        if not hostname:
+            return False
+        return hostname.split()[1]
+
+    async def show_vrf(self):
+        return await self.send_command("sh vrf")
+
+    async def show_interface(self):
+        return await self.send_command("sh ip int br")
+
+    async def show_acl(self):
+        return await self.send_command("show ip access")
+
+    async def show_vty_config(self):
+        return await self.send_command("show run | sec vty")
+
+    async def show_routing_table(self, vrf_name=""):
+        vrf_cmd = "vrf" if vrf_name else ""
+        return await self.send_command("sh ip route {} {}".format(vrf_cmd, vrf_name))
+
+    async def showCDP(self):
+        return await self.send_command("show cdp nei")
+
+    async def showLLDP(self):
+        return await self.send_command("show lldp nei")
+
+    async def show_interface_config(self):
+        return await self.send_command("show run | sec int")
+
+    # Config operations, their lines are those of the Manager operation of the same name
+    async def rollback_config(self, interval=2):
+        return await self.push_config(IOSCommands.rollback_config(interval))
+
+    async def create_vrf(self, vrf_name, as_number, vrf_number):
+        return await self.push_config(IOSCommands.create_vrf(vrf_name, as_number, vrf_number))
+
+    async def create_loopback(self, number, ip, mask, vrf_name):
+        return await self.push_config(IOSCommands.create_loopback(number, ip, mask, vrf_name))
+
+    async def create_subinterface(self, interface, subif_number, ip, mask, vlan, vrf_name):
+        return await self.push_config(IOSCommands.create_subinterface(interface, subif_number, ip, mask, vlan, vrf_name))
+
+    async def create_acl(self, acl_type, acl_name):
+        return await self.push_config(IOSCommands.create_acl(acl_type, acl_name))
+
+    async def add_acl_rule(self, acl_type, acl_name, action, src_nw, src_wc="", rule_number=""):
+        return await self.push_config(IOSCommands.add_acl_rule(acl_type, acl_name, action, src_nw, src_wc, rule_number))
+
+    async def apply_acl_to_vty(self, vty_start, vty_end, acl_name):
+        return await self.push_config(IOSCommands.apply_acl_to_vty(vty_start, vty_end, acl_name))
+
+    async def create_ospf_process(self, process_id, vrf_name=""):
+        return await self.push_config(IOSCommands.create_ospf_process(process_id, vrf_name))
+
+    async def advertise_ospf_network(self, process_id, network, wildcard, area, vrf_name=""):
+        return await self.push_config(IOSCommands.advertise_ospf_network(process_id, network, wildcard, area, vrf_name))
+
+    async def advertise_ospf_default_route(self, process_id, vrf_name=""):
+        return await self.push_config(IOSCommands.advertise_ospf_default_route(process_id, vrf_name))
+
+    async def enableCDP(self):
+        return await self.push_config(IOSCommands.enableCDP())
+
+    async def enableLLDP(self):
+        return await self.push_config(IOSCommands.enableLLDP())
+
+    async def add_interface_desc(self, interfaceName, description):
+        return await self.push_config(IOSCommands.add_interface_desc(interfaceName, description))
+
+    async def addRoute(self, destination, mask, nexthop="", iface="", vrf_name=""):
+        return await self.push_config(IOSCommands.addRoute(destination, mask, nexthop, iface, vrf_name))
+
+    async def enable_nat(self, interfaceName):
+        return await self.push_config(IOSCommands.enable_nat(interfaceName))
+
+    async def setNat(self, acl_name, interfaceName, vrf_name="", overload=True):
+        return await self.push_config(IOSCommands.setNat(acl_name, interfaceName, vrf_name, overload))
+
+# Event loop -> its shared AsyncSessionPool
+_pools = {}
+
+def _default_pool():
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        # Pools of closed loops are dropped with their sessions
+        _pools.clear()
+        _pools[loop] = AsyncSessionPool()
+    return _pools[loop]
+
+async def run_all(task, managers, limit=None):
+    """ [result or exception] of coroutine function task(manager) for every manager, at most limit at a time """
+    semaphore = asyncio.Semaphore(limit or len(managers) or 1)
+
+    async def run(manager):
+        async with semaphore:
+            return await task(manager)
+    return await asyncio.gather(*[run(manager) for manager in managers], return_exceptions=True)
+
+async def _benchmark(count, latency, username="admin", password="cisco"):
+    devices = [FakeIOS("R{}".format(index + 1), username, password, latency) for index in range(count)]
+    ports = await serve(devices)
+    pool = AsyncSessionPool()
+    managers = [AsyncManager("127.0.0.1", username, password, port, pool) for port in ports]
+
+    async def task(manageObj):
+        await manageObj.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+        await manageObj.create_loopback(number=100, ip="172.20.179.1", mask="255.255.255.0", vrf_name="Net")
+        return await manageObj.show_hostname()
+
+    start = time.perf_counter()
+    results = await run_all(task, managers)
+    seconds = time.perf_counter() - start
+    failed = [result for result in results if isinstance(result, BaseException) or not result]
+    print("{} devices, {} sessions, {} failed in {:.2f}s".format(count, len(pool), len(failed), seconds))
+    pool.close()
+    for device in devices:
+        device.close()
+    return seconds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Configure emulated IOS devices through AsyncManager")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every packet a device receives")
+    args = parser.parse_args(argv)
+    asyncio.run(_benchmark(args.devices, args.latency))
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+""" Local stand-in for an IOS device over SSH, for testing and benchmarking Manager backends offline
+
+    python FakeIOS.py --port 10022 --hostname R --latency 0.05
+
+Any client logs in with the configured username and password and gets an IOS-like prompt: exec
+and config modes, "conf t", "int X", "exit", "end", the show commands Manager uses, "write mem"
+and "copy run flash:". Config lines are kept as a running config, interfaces with an address show
+up in "sh ip int br", and unknown commands get "% Invalid input detected". latency seconds are
+waited once for every packet the device receives, like a round trip on a slow link.
+"""
+import argparse
+import asyncio
+import re
+import asyncssh
+
+# Config lines opening a sub mode, by their full first one or two words
+PROMPT_MODES = {
+    ("interface",): "config-if",
+    ("router",): "config-router",
+    ("line",): "config-line",
+    ("ip", "vrf"): "config-vrf",
+    ("ip", "access-list"): "config-std-nacl",
+    ("kron", "policy-list"): "config-kron-policy",
+    ("kron", "occur"): "config-kron-occurrence",
+}
+SECOND_WORDS = ("vrf", "access-list", "policy-list", "occur", "address", "route", "nat")
+
+# First words of the config lines that are top level even when typed in a sub mode
+GLOBAL_WORDS = ("hostname", "cdp", "lldp", "kron")
+
+# First words of the config lines the device accepts
+CONFIG_WORDS = ("interface", "ip", "no", "encapsulation", "router", "network", "default-information", "line", "transport",
+                "login", "access-class", "cdp", "lldp", "description", "hostname", "rd", "kron", "cli", "policy-list",
+                "permit", "deny", "shutdown", "exit", "end")
+
+INVALID = "% Invalid input detected at '^' marker."
+
+# Host keys are slow to make and any key will do
+_host_key = None
+
+def _word(word, words=CONFIG_WORDS):
+    """ full keyword of an abbreviated one such as "int" or "encap", None when there is none """
+    for full in words:
+        if full.startswith(word.lower()):
+            return full
+    return None
+
+def _global(word, second, words):
+    """ True for a config line of global config mode that opens no sub mode, such as "ip route" """
+    if word in GLOBAL_WORDS:
+        return True
+    if word == "ip" and second == "route":
+        return True
+    # "ip nat source" is global, "ip nat enable", "inside" and "outside" belong to an interface
+    return word == "ip" and second == "nat" and len(words) > 2 and "source".startswith(words[2].lower())
+
+class _Auth(asyncssh.SSHServer):
+    def __init__(self, username, password):
+        self.__username = username
+        self.__password = password
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return username == self.__username and password == self.__password
+
+class FakeIOS:
+    """ One emulated device, every SSH session shares its configuration """
+
+    def __init__(self, hostname="R1", username="admin", password="cisco", latency=0.0):
+        self.hostname = hostname
+        self.__username = username
+        self.__password = password
+        self.__latency = latency
+        self.__server = None
+
+        # Running config: [(section line, [child lines])], top level lines have no children
+        self.config = [("hostname {}".format(hostname), [])]
+
+        # Interface -> (address, mask)
+        self.interfaces = {"GigabitEthernet0/0": ("unassigned", "")}
+        self.sessions = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        """ listen on host:port, port 0 picks a free one, return the port """
+        global _host_key
+        if _host_key is None:
+            _host_key = asyncssh.generate_private_key("ssh-ed25519")
+        self.__server = await asyncssh.create_server(lambda: _Auth(self.__username, self.__password), host, port,
+                                                     server_host_keys=[_host_key], process_factory=self.__session,
+                                                     line_editor=False)
+        return self.__server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+
+    # Session
+    async def __session(self, process):
+        self.sessions += 1
+        # Mode stack, [] is exec mode
+        modes = []
+        pending = None
+        buffer = ""
+        process.stdout.write("\r\n{}#".format(self.hostname))
+        try:
+            while True:
+                data = await process.stdin.read(65536)
+                if not data:
+                    break
+                if self.__latency:
+                    await asyncio.sleep(self.__latency)
+                buffer += data
+                *lines, buffer = re.split(r"\r?\n|\r", buffer)
+                for line in lines:
+                    if pending is not None:
+                        # Answer to a "copy" question
+                        output, pending = "{} bytes copied in 0.1 secs".format(len(self.__show("sh run"))), None
+                    else:
+                        output, pending = self.__command(line.strip(), modes)
+                    if output is None:
+                        process.exit(0)
+                        return
+                    reply = line + "\r\n" + (output.replace("\n", "\r\n") + "\r\n" if output else "")
+                    process.stdout.write(reply + (pending or self.__prompt(modes)))
+        except (asyncssh.BreakReceived, asyncssh.TerminalSizeChanged, asyncssh.DisconnectError, ConnectionError):
+            pass
+        process.exit(0)
+
+    def __prompt(self, modes):
+        if not modes:
+            return "{}#".format(self.hostname)
+        return "{}({})#".format(self.hostname, modes[-1][0])
+
+    def __command(self, line, modes):
+        """ (output, question or None) of a line, output None closes the session """
+        if not line:
+            return "", None
+        if modes:
+            return self.__configure(line, modes), None
+        words = line.split()
+        command = words[0].lower()
+        if command in ("exit", "quit", "logout"):
+            return None, None
+        if command.startswith("conf"):
+            modes.append(("config", None))
+            return "Enter configuration commands, one per line.  End with CNTL/Z.", None
+        if command.startswith("term"):
+            return "", None
+        if command in ("wr", "write"):
+            return "Building configuration...\n[OK]", None
+        if command == "copy" and len(words) == 3:
+            return "", "Destination filename [{}]? ".format(words[2].split(":")[-1])
+        if command in ("sh", "show"):
+            return self.__show(line), None
+        return INVALID, None
+
+    def __configure(self, line, modes):
+        words = line.split()
+        # ACL rules start with a sequence number
+        if words[0].isdigit():
+            words = words[1:]
+        word = _word(words[0]) if words else None
+        if word is None:
+            return INVALID
+        if word == "end":
+            modes.clear()
+            return ""
+        if word == "exit":
+            modes.pop()
+            return ""
+
+        text = " ".join(words)
+        second = _word(words[1], SECOND_WORDS) if len(words) > 1 else None
+        mode = PROMPT_MODES.get((word,)) or PROMPT_MODES.get((word, second))
+        # "ip vrf forward" puts an interface in a VRF, it opens no VRF
+        if mode == "config-vrf" and len(words) > 2 and "forwarding".startswith(words[2].lower()):
+            mode = None
+        if len(modes) > 1 and mode is None and not _global(word, second, words):
+            section = modes[-1][1]
+            if word == "ip" and len(words) == 4 and second == "address" and modes[-1][0] == "config-if":
+                self.interfaces[section[0].split()[1]] = (words[2], words[3])
+            section[1].append(" " + text)
+            return ""
+
+        # A top level line, it also leaves the section it is typed in
+        del modes[1:]
+        if word == "interface" and len(words) > 1:
+            self.interfaces.setdefault(words[1], ("unassigned", ""))
+        section = self.__section(text)
+        if mode is not None:
+            modes.append((mode, section))
+        return ""
+
+    def __section(self, text):
+        for section in self.config:
+            if section[0] == text:
+                return section
+        section = (text, [])
+        self.config.append(section)
+        return section
+
+    def __show(self, line):
+        filtered = line.split("|")
+        command = filtered[0].split()[1:]
+        what = command[0].lower() if command else ""
+        if what.startswith("run"):
+            lines = []
+            for section, children in self.config:
+                lines.append(section)
+                lines.extend(children)
+            if len(filtered) > 1:
+                kind, pattern = (filtered[1].split(None, 1) + [""])[:2]
+                if kind.startswith("sec"):
+                    lines = []
+                    for section, children in self.config:
+                        if re.search(pattern, section):
+                            lines.append(section)
+                            lines.extend(children)
+                else:
+                    lines = [l for l in lines if re.search(pattern, l)]
+            return "\n".join(lines)
+        if what == "ip" and len(command) > 1 and command[1].startswith("int"):
+            rows = ["Interface                  IP-Address      OK? Method Status                Protocol"]
+            for name, (address, mask) in self.interfaces.items():
+                rows.append("{:<27}{:<16}YES manual up                    up".format(name, address))
+            return "\n".join(rows)
+        if what == "ip" and len(command) > 1 and command[1].startswith("ro"):
+            return "Gateway of last resort is not set\n"
+        if what == "ip" and len(command) > 1 and command[1].startswith("acc"):
+            return "\n".join(section for section, children in self.config if section.startswith("ip access-list"))
+        if what == "vrf":
+            return "\n".join("  {}".format(section.split()[-1]) for section, children in self.config if section.startswith("ip vrf"))
+        if what in ("cdp", "lldp"):
+            return "Capability Codes: R - Router\n\nDevice ID        Local Intrfce     Holdtme    Capability  Platform  Port ID\n\nTotal cdp entries displayed : 0"
+        return INVALID
+
+async def serve(devices, host="127.0.0.1", port=0):
+    """ start every FakeIOS of devices, ports counting up from port or free ones for port 0, return the ports """
+    ports = []
+    for index, device in enumerate(devices):
+        ports.append(await device.start(host, port + index if port else 0))
+    return ports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emulated IOS devices over SSH")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10022, help="port of the first device")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--hostname", default="R", help="devices are named R1, R2, ...")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="cisco")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every packet")
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    devices = [FakeIOS("{}{}".format(args.hostname, index + 1), args.username, args.password, args.latency) for index in range(args.devices)]
+    ports = loop.run_until_complete(serve(devices, args.host, args.port))
+    print("{} device(s) on {}:{}-{}".format(len(devices), args.host, ports[0], ports[-1]))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    main()
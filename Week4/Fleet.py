@@ -0,0 +1,174 @@
+""" Run one task against every device of an inventory on a bounded pool of worker threads
+
+    results = run_fleet(task_5, {host: (host_template, number, 100, "Net") for ...}, workers=32, timeout=120)
+
+Every host gets a HostResult with the return value or the exception of its task, nothing is
+lost when a host fails. Every task runs on its own daemon thread, at most workers at a time. A
+host whose task runs longer than timeout seconds is reported as "timeout" and its thread is left
+behind, a thread blocked in a socket read cannot be killed, while a new thread takes its slot so
+the hosts after it still start on time. Threads left behind count against max_threads, the
+ceiling of live threads: once they fill it no host starts until one of them returns, and when
+none has after another timeout the hosts still waiting are cancelled. cancel() stops every host
+that has not started yet, Ctrl-C also stops waiting for the running ones.
+"""
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+# Hosts running at once, and how often running hosts are checked for cancel()
+WORKERS = 16
+TICK = 0.5
+
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+class HostResult:
+    """ Outcome of the task of one host: status, return value or exception, and seconds it ran """
+    __slots__ = ("host", "status", "result", "error", "elapsed")
+
+    def __init__(self, host, status, result=None, error=None, elapsed=0.0):
+        self.host = host
+        self.status = status
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __repr__(self):
+        detail = repr(self.error) if self.error is not None else repr(self.result)
+        return "HostResult({}, {}, {}, {:.2f}s)".format(self.host, self.status, detail, self.elapsed)
+
+def print_progress(done, total, hostResult):
+    """ default progress report, one line per finished host """
+    print("[{}/{}] {} {} {:.2f}s".format(done, total, hostResult.host, hostResult.status, hostResult.elapsed), file=sys.stderr)
+
+def _arguments(inventory):
+    """ [(host, args)] of {host: args} or of an iterable of hosts, a host is then the only argument
+
+    Hosts listed twice run twice, results are kept by position.
+    """
+    if isinstance(inventory, dict):
+        return [(host, args if isinstance(args, (tuple, list)) else (args,)) for host, args in inventory.items()]
+    return [(host, (host,)) for host in inventory]
+
+class Fleet:
+    """ A run of task over an inventory, results come back in inventory order """
+
+    def __init__(self, task, inventory, workers=WORKERS, timeout=None, progress=print_progress, max_threads=None):
+        self.__task = task
+        self.__hosts = _arguments(inventory)
+        self.__workers = max(1, min(workers, len(self.__hosts) or 1))
+
+        # Running and left behind threads together, twice the workers unless given
+        self.__maxThreads = max(self.__workers, max_threads or 2 * self.__workers)
+        self.__timeout = timeout
+        self.__progress = progress
+        self.__cancelled = threading.Event()
+
+    def cancel(self):
+        """ stop every host that has not started, run() still waits for the running ones up to their timeout """
+        self.__cancelled.set()
+
+    def cancelled(self):
+        """ tasks running long loops may check this to stop early """
+        return self.__cancelled.is_set()
+
+    def __call(self, index, host, args, start, finished):
+        try:
+            result = self.__task(*args)
+        except Exception as e:
+            finished.put((index, HostResult(host, FAILED, error=e, elapsed=time.monotonic() - start)))
+        else:
+            finished.put((index, HostResult(host, OK, result, elapsed=time.monotonic() - start)))
+
+    def __wait(self, running, now):
+        """ seconds until the next running host is overdue, at most TICK """
+        if self.__timeout is None or not running:
+            return TICK
+        return max(0.0, min(TICK, min(running.values()) + self.__timeout - now))
+
+    def run(self):
+        """ [HostResult] of every host """
+        results = {}
+        waiting = deque(enumerate(self.__hosts))
+
+        # Index -> start time and thread of the hosts holding a worker slot, the results their threads
+        # send back, and thread -> when it was left behind for the threads of timed out hosts
+        running = {}
+        threads = {}
+        finished = queue.Queue()
+        abandoned = {}
+
+        def finish(index, hostResult):
+            results[index] = hostResult
+            if self.__progress is not None:
+                self.__progress(len(results), len(self.__hosts), hostResult)
+
+        def cancelRest(error=None):
+            while waiting:
+                index, (host, args) = waiting.popleft()
+                finish(index, HostResult(host, CANCELLED, error=error))
+
+        try:
+            while waiting or running:
+                if self.__cancelled.is_set():
+                    cancelRest()
+                for thread in [thread for thread in abandoned if not thread.is_alive()]:
+                    del abandoned[thread]
+                while waiting and len(running) < self.__workers and len(running) + len(abandoned) < self.__maxThreads:
+                    index, (host, args) = waiting.popleft()
+                    running[index] = time.monotonic()
+                    threads[index] = threading.Thread(target=self.__call, args=(index, host, args, running[index], finished), daemon=True)
+                    threads[index].start()
+
+                # Threads left behind fill the ceiling, give them one more timeout to come back
+                now = time.monotonic()
+                if waiting and not running and abandoned and all(now - left >= self.__timeout for left in abandoned.values()):
+                    cancelRest(RuntimeError("{} threads of timed out hosts still running".format(len(abandoned))))
+                    continue
+
+                try:
+                    index, hostResult = finished.get(timeout=self.__wait(running, now))
+                except queue.Empty:
+                    pass
+                else:
+                    # Results of hosts reported as timeout come too late
+                    if running.pop(index, None) is not None:
+                        del threads[index]
+                        finish(index, hostResult)
+
+                # An overdue host gives its slot to the next one, its thread is left behind
+                now = time.monotonic()
+                if self.__timeout is not None:
+                    for index, start in list(running.items()):
+                        if now - start >= self.__timeout:
+                            del running[index]
+                            abandoned[threads.pop(index)] = now
+                            finish(index, HostResult(self.__hosts[index][0], TIMEOUT,
+                                                     error=TimeoutError("no result after {}s".format(self.__timeout)),
+                                                     elapsed=now - start))
+        except KeyboardInterrupt:
+            # Ctrl-C does not wait for anything, running hosts are left behind
+            self.cancel()
+            for index, (host, args) in enumerate(self.__hosts):
+                if index not in results:
+                    finish(index, HostResult(host, CANCELLED))
+        return [results[index] for index in range(len(self.__hosts))]
+
+def run_fleet(task, inventory, workers=WORKERS, timeout=None, progress=print_progress, max_threads=None):
+    """ run task(*args) for every host of inventory, {host: args} or hosts, and return [HostResult] in inventory order """
+    return Fleet(task, inventory, workers, timeout, progress, max_threads).run()
+
+def summary(results):
+    """ one line count of the results by status """
+    counts = {}
+    for hostResult in results:
+        counts[hostResult.status] = counts.get(hostResult.status, 0) + 1
+    return ", ".join("{} {}".format(count, status) for status, count in sorted(counts.items()))
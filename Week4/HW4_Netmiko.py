@@ -1,14 +1,142 @@
-from netmiko import NetMikoAuthenticationException, NetmikoAuthError, NetmikoTimeoutError, NetMikoTimeoutException
+from netmiko import NetMikoAuthenticationException, NetMikoTimeoutException
 from netmiko import ConnectHandler
+from contextlib import contextmanager
+import atexit
 import getpass
 import threading
+import time
+import IOSCommands
+from Fleet import run_fleet, summary
+from IOSCommands import CONFIG_CHUNK, CONFIG_ERROR, IDLE_TIMEOUT
+
+# Seconds between two reap() runs of a pool
+REAP_INTERVAL = 60
+
+class _Session:
+    """ The open connection of one device and the lock of whoever is using it """
+
+    def __init__(self):
+        # Reentrant, a Transaction runs Manager operations inside its own session
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.connection = None
+        self.last_used = 0.0
+
+    def close(self):
+        if self.connection:
+            try:
+                self.connection.disconnect()
+            except Exception as e:
+                pass
+        self.connection = None
+
+class SessionPool:
+    """ One open session per device, shared by every Manager of the device
+
+    A session is handed to one caller at a time. It is checked with is_alive() before it is
+    handed out and reopened when it died or sat unused for longer than idle_timeout seconds.
+    A thread asking again for the session it holds gets it as it is. A daemon thread started
+    with the first session closes idle sessions every reap_interval seconds, until close().
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, reap_interval=REAP_INTERVAL):
+        self.__idle_timeout = idle_timeout
+        self.__reap_interval = reap_interval
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+
+        # Event stopping the running reaper thread, None when there is none
+        self.__reaper = None
+
+    @contextmanager
+    def session(self, key, connect):
+        """ yield the open connection of device key, connect() opens one when needed and returns False on failure """
+        with self.__lock:
+            entry = self.__sessions.setdefault(key, _Session())
+            if self.__reaper is None and self.__reap_interval:
+                self.__reaper = threading.Event()
+                threading.Thread(target=self.__reap_loop, args=(self.__reaper,), name="SessionPool reaper", daemon=True).start()
+
+        with entry.lock:
+            if entry.depth == 0:
+                if entry.connection and not self.__healthy(entry):
+                    entry.close()
+                if not entry.connection:
+                    entry.connection = connect()
+            entry.depth += 1
+            try:
+                yield entry.connection
+            except BaseException:
+                # The device may be in the middle of a command
+                entry.close()
+                raise
+            finally:
+                entry.depth -= 1
+            entry.last_used = time.monotonic()
+
+    def __healthy(self, entry):
+        if time.monotonic() - entry.last_used > self.__idle_timeout:
+            return False
+        try:
+            return entry.connection.is_alive()
+        except Exception as e:
+            return False
+
+    def __reap_loop(self, stopped):
+        while not stopped.wait(self.__reap_interval):
+            self.reap()
+
+    def reap(self):
+        """ close the sessions that sat unused for longer than idle_timeout, return how many were closed """
+        closed = 0
+        with self.__lock:
+            entries = list(self.__sessions.values())
+        for entry in entries:
+            # A session in use is not idle
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.depth == 0 and entry.connection and time.monotonic() - entry.last_used > self.__idle_timeout:
+                        entry.close()
+                        closed += 1
+                finally:
+                    entry.lock.release()
+        return closed
+
+    def close(self, key=None):
+        """ close the session of device key, or every session and the reaper """
+        with self.__lock:
+            if key is None:
+                entries = list(self.__sessions.values())
+                self.__sessions.clear()
+                if self.__reaper is not None:
+                    self.__reaper.set()
+                    self.__reaper = None
+            else:
+                entries = [self.__sessions.pop(key)] if key in self.__sessions else []
+        for entry in entries:
+            with entry.lock:
+                entry.close()
+
+    def __len__(self):
+        return sum(1 for entry in list(self.__sessions.values()) if entry.connection)
+
+# Sessions are shared by every Manager unless it gets its own pool
+default_pool = SessionPool()
+atexit.register(default_pool.close)
 
 class Manager:
-    def __init__(self, ip, username, password, device_type):
+    def __init__(self, ip, username, password, device_type, pool=None):
         self.__ip = ip
         self.__username = username
         self.__password = password
         self.__device_type = device_type
+        self.__pool = default_pool if pool is None else pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def create_connection(self):
         """ Create connection to device """
@@ -20,594 +148,449 @@ class Manager:
         }
         try:
             connection = ConnectHandler(**device)
-        except (NetMikoTimeoutException, NetmikoTimeoutError):
+        except NetMikoTimeoutException:
             print("error: connection timeout to device = " + device['ip'])
             return False
-        except (NetmikoAuthError, NetMikoAuthenticationException):
+        except NetMikoAuthenticationException:
             print("error: Authentication failed to device = " + device['ip'])
             return False
         return connection
 
+    def session(self):
+        """ Pooled connection to device, False when it cannot be opened
+
+        with manageObj.session() as connection:
+            ...
+        """
+        return self.__pool.session((self.__ip, self.__username, self.__device_type), self.create_connection)
+
+    def close(self):
+        """ Close the pooled session of device """
+        self.__pool.close((self.__ip, self.__username, self.__device_type))
+
+    def transaction(self):
+        """ Queue operations and run them in order in one session, consecutive config operations in one push
+
+        with manageObj.transaction() as tx:
+            tx.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+            hostname = tx.show_hostname()
+        print(tx.results[hostname])
+        """
+        return Transaction(self)
+
+    def push_config(self, commands, chunk_size=CONFIG_CHUNK):
+        """ Configure commands in one config mode session, False when the device rejects a line
+
+        Lines are streamed chunk_size at a time without waiting for the prompt after each one,
+        so a push costs about one round trip per chunk instead of one per line. A chunk is the
+        unit of failure: the lines after a rejected one in its chunk are already on their way
+        and are applied, the chunks after it are not sent. chunk_size=1 stops at the rejected line.
+        """
+        commands = [cmd for cmd in commands if cmd.strip()]
+        if not commands:
+            return True
+        # A failure between chunks leaves the device in config mode, the exception reaches the
+        # pool so that it closes the session instead of handing it out again
+        try:
+            with self.session() as connection:
+                if not connection:
+                    return False
+                for start in range(0, len(commands), chunk_size):
+                    last = start + chunk_size >= len(commands)
+                    output = connection.send_config_set(commands[start:start + chunk_size], enter_config_mode=start == 0,
+                                                        exit_config_mode=last, cmd_verify=False)
+                    error = CONFIG_ERROR.search(output)
+                    if error:
+                        # Later chunks are not sent after a rejected line
+                        if not last:
+                            connection.exit_config_mode()
+                        print("error: {} on device = {}".format(error.group(0).strip(), self.__ip))
+                        return False
+        except Exception as e:
+            return False
+        return True
+
     def save_config(self):
         """ Save configuration into flash """
-        connection = self.create_connection()
-        if not connection:
-            return False
         try:
-            wr = connection.send_command(command_string="write mem", expect_string=r"#")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                wr = connection.send_command(command_string="write mem", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return True
-        finally:
-            connection.disconnect()
 
 
     def backup_config(self, filename="config"):
         """ Backup recent configuration into filename.old """
-        connection = self.create_connection()
-        if not connection:
-            return False
         try:
-            wr = connection.send_command(command_string="copy run flash:{}.old".format(filename), expect_string=r"Destination filename")
-            wr = connection.send_command(command_string="\n")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                wr = connection.send_command(command_string="copy run flash:{}.old".format(filename), expect_string=r"Destination filename")
+                wr = connection.send_command(command_string="\n")
         except Exception as e:
             return False
         else:
             return True
-        finally:
-            connection.disconnect()
 
     def rollback_config(self, interval=2):
         """ Rollback config to backup config """
-        connection = self.create_connection()
-        if not connection:
-            return False
-        try:
-            connection.send_command("term len 0", expect_string=r"#")
-            connection.send_command("conf t", expect_string=r"#")
-
-            rollbackScriptPolicy = ["kron policy-list ROLLBACK", "cli copy config.old running", "exit"]
-            for cmd in rollbackScriptPolicy:
-                connection.send_command(cmd, expect_string=r"#")
-
-            rollbackScriptScheduler = ["kron occur ROLLBACK-CFG in {} oneshot".format(str(interval).zfill(3)), "policy-list rollback-backup", "end"]
-            for cmd in rollbackScriptScheduler:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.rollback_config(interval))
 
     def show_hostname(self):
-        connection = self.create_connection()
-        if not connection:
-            return False
         try:
-            hostname = connection.send_command("sh run | in hostname")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                hostname = connection.send_command("sh run | in hostname")
         except Exception as e:
             return False
         else:
             return hostname.split()[1]
-        finally:
-            connection.disconnect()
 
     def create_vrf(self, vrf_name, as_number, vrf_number):
-        connection = self.create_connection()
-        if not connection:
-            return False
-        try:
-            vrf_cmd = ["conf t", "ip vrf {}".format(vrf_name), "rd {}:{}".format(str(as_number), str(vrf_number)), "end"]
-            for cmd in vrf_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.create_vrf(vrf_name, as_number, vrf_number))
 
     def show_vrf(self):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
         try:
-            vrf_list = connection.send_command("sh vrf", expect_string=r"#")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                vrf_list = connection.send_command("sh vrf", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return vrf_list
-        finally:
-            connection.disconnect()
 
     def create_loopback(self, number, ip, mask, vrf_name):
         """ Create loopback from loopback number, ip, and subnet mask """
-        connection = self.create_connection()
-        if not connection:
-            return False
-        try:
-            loopbackcmd = ["conf t", "int lo{}".format(str(number)), "ip vrf forward {}".format(vrf_name), "ip add {} {}".format(ip, mask), "end"]
-            for cmd in loopbackcmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.create_loopback(number, ip, mask, vrf_name))
 
     def create_subinterface(self, interface, subif_number, ip, mask, vlan, vrf_name):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
-        try:
-            interface_command = ["conf t", "int {}.{}".format(interface, subif_number), "encap dot1Q {}".format(vlan),\
-            "ip vrf forward {}".format(vrf_name), "ip add {} {}".format(ip, mask), "int {}".format(interface), "no shut", "end"]
-
-            for cmd in interface_command:
-                connection.send_command(cmd, expect_string=r"#")
-
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.create_subinterface(interface, subif_number, ip, mask, vlan, vrf_name))
 
     def show_interface(self):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
         try:
-            interfaces = connection.send_command("sh ip int br", expect_string=r"#")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                interfaces = connection.send_command("sh ip int br", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return interfaces
-        finally:
-            connection.disconnect()
 
     def create_acl(self, acl_type, acl_name):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
-        try:
-            connection.send_command("conf t", expect_string=r"#")
-            connection.send_command("ip access-list {} {}".format(acl_type, acl_name), expect_string=r"#")
-            connection.send_command("end", expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.create_acl(acl_type, acl_name))
 
     def add_acl_rule(self, acl_type, acl_name, action, src_nw, src_wc="", rule_number=""):
         """ Add acl rule (for standard acl only) """
-        connection = self.create_connection()
-        if not connection:
-            return False
-
-        try:
-            add_rule_command = ["conf t", "ip access-list {} {}".format(acl_type, acl_name),\
-            "{} {} {} {}".format(rule_number, action, src_nw, src_wc), "end"]
-
-            for cmd in add_rule_command:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.add_acl_rule(acl_type, acl_name, action, src_nw, src_wc, rule_number))
 
     def show_acl(self):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
         try:
-            acl_list = connection.send_command("show ip access", expect_string=r"#")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                acl_list = connection.send_command("show ip access", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return acl_list
-        finally:
-            connection.disconnect()
 
     def apply_acl_to_vty(self, vty_start, vty_end, acl_name):
         """ Apply the acl to line vty """
-        connection = self.create_connection()
-        if not connection:
-            return False
-
-        try:
-            apply_cmd = ["conf t", "line vty {} {}".format(str(vty_start), str(vty_end)), "trans input telnet ssh",\
-            "login local", "access-class {} in vrf-also".format(acl_name), "end"]
-
-            for cmd in apply_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.apply_acl_to_vty(vty_start, vty_end, acl_name))
 
     def show_vty_config(self):
-        connection = self.create_connection()
-        if not connection:
-            return False
-
         try:
-            vty_cfg = connection.send_command("show run | sec vty", expect_string=r"#")
+            with self.session() as connection:
+                if not connection:
+                    return False
+                vty_cfg = connection.send_command("show run | sec vty", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return vty_cfg
-        finally:
-            connection.disconnect()
 
     def create_ospf_process(self, process_id, vrf_name=""):
-        connection = self.create_connection()
-        if vrf_name == "":
-            vrf_cmd = ""
-        else:
-            vrf_cmd = "vrf"
-
-        if not connection:
-            return False
-
-        try:
-            ospf_cmd = ["conf t", "router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name), "end"]
-            for cmd in ospf_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.create_ospf_process(process_id, vrf_name))
 
     def advertise_ospf_network(self, process_id, network, wildcard, area, vrf_name=""):
-        connection = self.create_connection()
-        if vrf_name == "":
-            vrf_cmd = ""
-        else:
-            vrf_cmd = "vrf"
-
-        if not connection:
-            return False
-
-        try:
-            advertise_cmd = ["conf t", "router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name),\
-            "network {} {} area {}".format(network, wildcard, str(area)), "end"]
-            for cmd in advertise_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.advertise_ospf_network(process_id, network, wildcard, area, vrf_name))
 
     def advertise_ospf_default_route(self, process_id, vrf_name=""):
-        connection = self.create_connection()
-        if vrf_name == "":
-            vrf_cmd = ""
-        else:
-            vrf_cmd = "vrf"
-
-        if not connection:
-            return False
-
-        try:
-            advertise_cmd = ["conf t", "router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name),\
-            "default-information originate", "end"]
-            for cmd in advertise_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.advertise_ospf_default_route(process_id, vrf_name))
 
     def show_routing_table(self, vrf_name=""):
-        connection = self.create_connection()
-        if vrf_name == "":
-            vrf_cmd = ""
-        else:
-            vrf_cmd = "vrf"
-
-        if not connection:
-            return False
-
         try:
-            routing_table = connection.send_command("sh ip route {} {}".format(vrf_cmd, vrf_name), expect_string=r"#")
+            with self.session() as connection:
+                if vrf_name == "":
+                    vrf_cmd = ""
+                else:
+                    vrf_cmd = "vrf"
+
+                if not connection:
+                    return False
+                routing_table = connection.send_command("sh ip route {} {}".format(vrf_cmd, vrf_name), expect_string=r"#")
         except Exception as e:
             return False
         else:
             return routing_table
-        finally:
-            connection.disconnect()
 
     def enableCDP(self):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
-        try:
-            connection.send_command("conf t", expect_string=r"#")
-            connection.send_command("cdp run", expect_string=r"#")
-            connection.send_command("end", expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.enableCDP())
 
     def enableLLDP(self):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
-        try:
-            connection.send_command("conf t", expect_string=r"#")
-            connection.send_command("lldp run", expect_string=r"#")
-            connection.send_command("end", expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.enableLLDP())
 
     def showCDP(self):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
         try:
-            cdp_neighbors = connection.send_command("show cdp nei", expect_string=r"#")
+            with self.session() as connection:
+
+                if not connection:
+                    return False
+                cdp_neighbors = connection.send_command("show cdp nei", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return cdp_neighbors
-        finally:
-            connection.disconnect()
 
     def showLLDP(self):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
         try:
-            lldp_neighbors = connection.send_command("show lldp nei", expect_string=r"#")
+            with self.session() as connection:
+
+                if not connection:
+                    return False
+                lldp_neighbors = connection.send_command("show lldp nei", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return lldp_neighbors
-        finally:
-            connection.disconnect()
 
     def add_interface_desc(self, interfaceName, description):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
-        try:
-            desc_cmd = ["conf t", "int {}".format(interfaceName), "desc {}".format(description), "end"]
-            for cmd in desc_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.add_interface_desc(interfaceName, description))
 
 
     def show_interface_config(self):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
         try:
-            int_cfg = connection.send_command("show run | sec int", expect_string=r"#")
+            with self.session() as connection:
+
+                if not connection:
+                    return False
+                int_cfg = connection.send_command("show run | sec int", expect_string=r"#")
         except Exception as e:
             return False
         else:
             return int_cfg
-        finally:
-            connection.disconnect()
 
     def addRoute(self, destination, mask, nexthop="", iface="", vrf_name=""):
-        connection = self.create_connection()
-
-        vrf_cmd = "vrf"
-        if vrf_name == "":
-            vrf_cmd = ""
-
-        if not connection:
-            return False
-
-        try:
-            route_cmd = ["conf t", "ip route {} {} {} {} {} {}".format(vrf_cmd, vrf_name, destination, mask, iface, nexthop), "end"]
-            for cmd in route_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.addRoute(destination, mask, nexthop, iface, vrf_name))
 
 
     def enable_nat(self, interfaceName):
-        connection = self.create_connection()
-
-        if not connection:
-            return False
-
-        try:
-            nat_cmd = ["conf t", "int {}".format(interfaceName), "ip nat enable", "end"]
-            for cmd in nat_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.enable_nat(interfaceName))
 
     def setNat(self, acl_name, interfaceName, vrf_name="", overload=True):
         """ NAT basic Configuration """
-        connection = self.create_connection()
-        vrf_cmd = "vrf"
-        overload = "overload"
-
-        if vrf_name == "":
-            vrf_cmd = ""
-
-        if not overload:
-            overload = ""
-
-        command = "ip nat source list {} interface {} {} {} {}".format(acl_name, interfaceName, vrf_cmd, vrf_name, overload)
-
-        if not connection:
-            return False
-
-        try:
-            nat_cmd = ["conf t", command, "end"]
-            for cmd in nat_cmd:
-                connection.send_command(cmd, expect_string=r"#")
-        except Exception as e:
-            return False
-        else:
-            return True
-        finally:
-            connection.disconnect()
+        return self.push_config(IOSCommands.setNat(acl_name, interfaceName, vrf_name, overload))
+
+class _ConfigRecorder(Manager):
+    """ Manager that collects the config lines of its operations instead of sending them """
+
+    def __init__(self):
+        Manager.__init__(self, None, None, None, None)
+        self.lines = []
+
+        # Set by an operation that needs the device in exec mode, such as a show
+        self.exec_mode = False
+
+    @contextmanager
+    def session(self):
+        self.exec_mode = True
+        yield False
+
+    def push_config(self, commands, chunk_size=CONFIG_CHUNK):
+        self.lines.extend(cmd for cmd in commands if cmd.strip())
+        return True
+
+def _record(operation, *args, **kwargs):
+    recorder = _ConfigRecorder()
+    getattr(recorder, operation)(*args, **kwargs)
+    return recorder
+
+class Transaction:
+    """ Manager operations queued and run together when the with block ends
+
+    Every queued operation returns its index in results. Operations run in the order they were
+    queued in one session, the config lines of config operations queued one after the other
+    are pushed in one config mode session. A rejected push stops the transaction: the
+    operations after it do not run and their result stays None. Nothing is sent when the with
+    block raises.
+    """
+
+    def __init__(self, manager):
+        self.__manager = manager
+
+        # (operation, args, kwargs, recorder)
+        self.__operations = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def __getattr__(self, operation):
+        if operation.startswith("_") or operation in ("create_connection", "session", "close", "transaction") or \
+            not callable(getattr(Manager, operation, None)):
+            raise AttributeError(operation)
+
+        def queue(*args, **kwargs):
+            # The recorder tells config from exec operations and checks the arguments now
+            self.__operations.append((operation, args, kwargs, _record(operation, *args, **kwargs)))
+            return len(self.__operations) - 1
+        return queue
+
+    def lines(self):
+        """ Config lines the transaction pushes """
+        return [cmd for operation, args, kwargs, recorder in self.__operations for cmd in recorder.lines]
+
+    def commit(self):
+        """ Run the queued operations, return True when all of them ran and succeeded """
+        operations, self.__operations = self.__operations, []
+        self.results = [None] * len(operations)
+        with self.__manager.session() as connection:
+            if not connection:
+                return False
+            index = 0
+            while index < len(operations):
+                operation, args, kwargs, recorder = operations[index]
+                if recorder.exec_mode:
+                    self.results[index] = getattr(self.__manager, operation)(*args, **kwargs)
+                    index += 1
+                    continue
+
+                # A run of config operations is one push
+                end = index
+                while end < len(operations) and not operations[end][3].exec_mode:
+                    end += 1
+                pushed = self.__manager.push_config([cmd for operation, args, kwargs, recorder in operations[index:end] for cmd in recorder.lines])
+                self.results[index:end] = [pushed] * (end - index)
+                if not pushed:
+                    break
+                index = end
+        return all(result is not None and result is not False for result in self.results)
 
 def task_1(host_template, loopback_template, last_octet):
     """ Create loopback for all device """
     host = host_template + str(last_octet)
     loopback_ip = loopback_template + str(last_octet)
 
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    manageObj.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
-    manageObj.create_loopback(number=100, ip=loopback_ip, mask="255.255.255.0", vrf_name="Net")
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj, manageObj.transaction() as tx:
+        tx.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+        tx.create_loopback(number=100, ip=loopback_ip, mask="255.255.255.0", vrf_name="Net")
 
-    hostname = manageObj.show_hostname()
-    interfaces = manageObj.show_interface()
-    print(hostname, interfaces, sep="\n")
+        hostname = tx.show_hostname()
+        interfaces = tx.show_interface()
+    print(tx.results[hostname], tx.results[interfaces], sep="\n")
     print("-"*50)
 
 def task_3(host, interface_info, subif_number, vlan, vrf_name):
     """ Apply vrf to the interface for sepertate management and data traffic """
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    for iface in interface_info:
-        interface = iface.split()
-        interfaceName = interface[0]
-        interface_ip = interface[1]
-        interface_subnetmask = interface[2]
-
-        manageObj.create_subinterface(interface=interfaceName, subif_number=subif_number, ip=interface_ip, mask=interface_subnetmask, vlan=vlan, vrf_name=vrf_name)
-
-    hostname = manageObj.show_hostname()
-    interfaces = manageObj.show_interface()
-    print(hostname, interfaces, sep="\n")
-    print("-"*50)
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj:
+        for iface in interface_info:
+            interface = iface.split()
+            interfaceName = interface[0]
+            interface_ip = interface[1]
+            interface_subnetmask = interface[2]
+
+            manageObj.create_subinterface(interface=interfaceName, subif_number=subif_number, ip=interface_ip, mask=interface_subnetmask, vlan=vlan, vrf_name=vrf_name)
+
+        hostname = manageObj.show_hostname()
+        interfaces = manageObj.show_interface()
+        print(hostname, interfaces, sep="\n")
+        print("-"*50)
 
 def task_4(host_template, last_octet, acl_type, acl_name):
     """ Create acl for allow only management IP address """
     host = host_template + str(last_octet)
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    manageObj.create_acl(acl_type=acl_type, acl_name=acl_name)
-    manageObj.add_acl_rule(acl_type=acl_type, acl_name=acl_name, action="permit", src_nw="172.31.179.0", src_wc="0.0.0.15")
-    manageObj.add_acl_rule(acl_type=acl_type, acl_name=acl_name, action="permit", src_nw="10.253.190.0", src_wc="0.0.0.255")
-    manageObj.apply_acl_to_vty(50, 100, acl_name)
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj:
+        manageObj.create_acl(acl_type=acl_type, acl_name=acl_name)
+        manageObj.add_acl_rule(acl_type=acl_type, acl_name=acl_name, action="permit", src_nw="172.31.179.0", src_wc="0.0.0.15")
+        manageObj.add_acl_rule(acl_type=acl_type, acl_name=acl_name, action="permit", src_nw="10.253.190.0", src_wc="0.0.0.255")
+        manageObj.apply_acl_to_vty(50, 100, acl_name)
 
-    hostname = manageObj.show_hostname()
-    vty_config = manageObj.show_vty_config()
-    acl_list = manageObj.show_acl()
+        hostname = manageObj.show_hostname()
+        vty_config = manageObj.show_vty_config()
+        acl_list = manageObj.show_acl()
 
-    print(hostname, acl_list, vty_config,sep="\n")
-    print("-"*50)
+        print(hostname, acl_list, vty_config,sep="\n")
+        print("-"*50)
 
 def task_5(host_template, last_octet, ospf_processID, vrf_name=""):
     """ Config OSPF to all device """
     host = host_template + str(last_octet)
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    manageObj.create_ospf_process(process_id=ospf_processID, vrf_name="Net")
-    manageObj.advertise_ospf_network(process_id=ospf_processID, network="172.31.179.0", wildcard="0.0.0.255", area=0, vrf_name="Net")
-    manageObj.advertise_ospf_network(process_id=ospf_processID, network="172.20.179.0", wildcard="0.0.0.255", area=0, vrf_name="Net")
-
-    hostname = manageObj.show_hostname()
-    routing_table = manageObj.show_routing_table()
-    print(hostname, routing_table, sep="\n")
-    print("-"*50)
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj:
+        manageObj.create_ospf_process(process_id=ospf_processID, vrf_name="Net")
+        manageObj.advertise_ospf_network(process_id=ospf_processID, network="172.31.179.0", wildcard="0.0.0.255", area=0, vrf_name="Net")
+        manageObj.advertise_ospf_network(process_id=ospf_processID, network="172.20.179.0", wildcard="0.0.0.255", area=0, vrf_name="Net")
+
+        hostname = manageObj.show_hostname()
+        routing_table = manageObj.show_routing_table()
+        print(hostname, routing_table, sep="\n")
+        print("-"*50)
 
 def task_6(host_template, last_octet):
     """ Enable CDP and LLDP on all devices """
     host = host_template + str(last_octet)
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    manageObj.enableCDP()
-    manageObj.enableLLDP()
-
-    hostname = manageObj.show_hostname()
-    cdp_neighbors = manageObj.showCDP()
-    lldp_neighbors = manageObj.showLLDP()
-    print(hostname, cdp_neighbors, lldp_neighbors, sep="\n")
-    print("-"*50)
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj:
+        manageObj.enableCDP()
+        manageObj.enableLLDP()
+
+        hostname = manageObj.show_hostname()
+        cdp_neighbors = manageObj.showCDP()
+        lldp_neighbors = manageObj.showLLDP()
+        print(hostname, cdp_neighbors, lldp_neighbors, sep="\n")
+        print("-"*50)
 
 def task_7(host_template, last_octet):
     """ Add description to the interface based on cdp information """
     host = host_template + str(last_octet)
-    manageObj = Manager(ip=host, username=username, password=password, device_type=device_type)
-    cdp_neighbors = manageObj.showCDP()
-
-    for neighbor in cdp_neighbors.split('\n')[5:-2]:
-        remote_name = neighbor.split()[0].split('.')[0]
-        remote_int = neighbor.split()[-2] + neighbor.split()[-1]
-        local_int = neighbor.split()[1] + neighbor.split()[2]
-        description = "Connect to {} of {}".format(remote_int, remote_name)
-        manageObj.add_interface_desc(interfaceName=local_int, description=description)
-
-    hostname = manageObj.show_hostname()
-    interface_cfg = manageObj.show_interface_config()
-    print(hostname, interface_cfg, sep="\n")
-    print("-"*50)
+    with Manager(ip=host, username=username, password=password, device_type=device_type) as manageObj:
+        cdp_neighbors = manageObj.showCDP()
+
+        for neighbor in cdp_neighbors.split('\n')[5:-2]:
+            remote_name = neighbor.split()[0].split('.')[0]
+            remote_int = neighbor.split()[-2] + neighbor.split()[-1]
+            local_int = neighbor.split()[1] + neighbor.split()[2]
+            description = "Connect to {} of {}".format(remote_int, remote_name)
+            manageObj.add_interface_desc(interfaceName=local_int, description=description)
+
+        hostname = manageObj.show_hostname()
+        interface_cfg = manageObj.show_interface_config()
+        print(hostname, interface_cfg, sep="\n")
+        print("-"*50)
 
 def task_8():
     """ Config NAT and advertise default route on R5 """
-    manageObj = Manager(ip="172.31.179.9", username=username, password=password, device_type=device_type)
-    manageObj.create_acl(acl_type="standard", acl_name="forNAT")
-    manageObj.add_acl_rule(acl_type="standard", acl_name="forNAT", action="permit", src_nw="any")
-    manageObj.enable_nat(interfaceName="G0/1.100")
-    manageObj.enable_nat(interfaceName="G0/2")
-    manageObj.addRoute(destination="0.0.0.0", mask="0.0.0.0", nexthop="192.168.122.1", iface="G0/2", vrf_name="Net")
-    manageObj.advertise_ospf_default_route(process_id=100, vrf_name="Net")
-    manageObj.setNat(acl_name="forNAT", interfaceName="G0/2", vrf_name="Net", overload=True)
-
-    hostname = manageObj.show_hostname()
-    ifconfig = manageObj.show_interface_config()
-    print(hostname, ifconfig, sep="\n")
+    with Manager(ip="172.31.179.9", username=username, password=password, device_type=device_type) as manageObj, manageObj.transaction() as tx:
+        tx.create_acl(acl_type="standard", acl_name="forNAT")
+        tx.add_acl_rule(acl_type="standard", acl_name="forNAT", action="permit", src_nw="any")
+        tx.enable_nat(interfaceName="G0/1.100")
+        tx.enable_nat(interfaceName="G0/2")
+        tx.addRoute(destination="0.0.0.0", mask="0.0.0.0", nexthop="192.168.122.1", iface="G0/2", vrf_name="Net")
+        tx.advertise_ospf_default_route(process_id=100, vrf_name="Net")
+        tx.setNat(acl_name="forNAT", interfaceName="G0/2", vrf_name="Net", overload=True)
+
+        hostname = tx.show_hostname()
+        ifconfig = tx.show_interface_config()
+    print(tx.results[hostname], tx.results[ifconfig], sep="\n")
 
 if __name__ == '__main__':
     # Test method
@@ -617,66 +600,48 @@ if __name__ == '__main__':
     password = getpass.getpass()
     device_type = "cisco_ios"
 
+    # Devices configured at the same time and seconds a device may take
+    workers = 16
+    timeout = 300
+
     # print(manageObj.backup_config(filename="OLDCONFIG"))
     # print(manageObj.save_config())
     # print(manageObj.rollback_config(interval=5))
 
     # # Task1 add loopback
-    # task1_threads = []
-    # for number in range(1, 10):
-    #     thread_arg = [host_template, loopback_template, number]
-    #     task1_threads.append(threading.Thread(target=task_1, args=thread_arg))
-    #     # task_1(host_template, loopback_template, number, username, password, device_type)
-    # for t in task1_threads:
-    #     t.start()
+    # inventory = dict((host_template + str(number), (host_template, loopback_template, number)) for number in range(1, 10))
+    # print(summary(run_fleet(task_1, inventory, workers=workers, timeout=timeout)))
 
     # # Task2 completed by manual
 
     # # Task3 add vrf
-    # task3_threads = []
     # Routers = { "172.31.179.4" : ["G0/1 172.31.179.17 255.255.255.240", "G0/2 172.31.179.33 255.255.255.240"],
     #            "172.31.179.5" : ["G0/1 172.31.179.18 255.255.255.240", "G0/2 172.31.179.49 255.255.255.240"],
     #            "172.31.179.6" : ["G0/1 172.31.179.34 255.255.255.240", "G0/2 172.31.179.50 255.255.255.240", "G0/3 172.31.179.65 255.255.255.240"],
     #            "172.31.179.7" : ["G0/1 172.31.179.66 255.255.255.240"],
     #            "172.31.179.9" : ["G0/1 172.31.179.67 255.255.255.240"]
     # }
-    # for router in Routers:
-    #     thread_arg = [router, Routers[router], 100, 100, "Net"]
-    #     task3_threads.append(threading.Thread(target=task_3, args=thread_arg))
-    # for t in task3_threads:
-    #     t.start()
+    # inventory = dict((router, (router, Routers[router], 100, 100, "Net")) for router in Routers)
+    # print(summary(run_fleet(task_3, inventory, workers=workers, timeout=timeout)))
 
     # # Task4 ACL for Management Only
-    # task4_threads = []
-    # for number in range(1, 10):
-    #     thread_arg = [host_template, number, "standard", "AllowManagement"]
-    #     task4_threads.append(threading.Thread(target=task_4, args=thread_arg))
-    # for t in task4_threads:
-    #     t.start()
+    # inventory = dict((host_template + str(number), (host_template, number, "standard", "AllowManagement")) for number in range(1, 10))
+    # print(summary(run_fleet(task_4, inventory, workers=workers, timeout=timeout)))
 
     # # Task 5 OSPF configuration
-    # task5_threads = []
-    # for number in range(1, 10):
-    #     thread_arg = [host_template, number, 100, "Net"]
-    #     task5_threads.append(threading.Thread(target=task_5, args=thread_arg))
-    # for t in task5_threads:
-    #     t.start()
+    # inventory = dict((host_template + str(number), (host_template, number, 100, "Net")) for number in range(1, 10))
+    # print(summary(run_fleet(task_5, inventory, workers=workers, timeout=timeout)))
 
     # # Task 6 enable cdp and lldp
-    # task6_threads = []
-    # for number in range(1, 10):
-    #     thread_arg = [host_template, number]
-    #     task6_threads.append(threading.Thread(target=task_6, args=thread_arg))
-    # for t in task6_threads:
-    #     t.start()
+    # inventory = dict((host_template + str(number), (host_template, number)) for number in range(1, 10))
+    # print(summary(run_fleet(task_6, inventory, workers=workers, timeout=timeout)))
 
     # # Task 7 add description based on cdp
-    # task7_threads = []
-    # for number in range(1, 10):
-    #     thread_arg = [host_template, number]
-    #     task7_threads.append(threading.Thread(target=task_7, args=thread_arg))
-    # for t in task7_threads:
-    #     t.start()
+    # inventory = dict((host_template + str(number), (host_template, number)) for number in range(1, 10))
+    # results = run_fleet(task_7, inventory, workers=workers, timeout=timeout)
+    # for hostResult in results:
+    #     if not hostResult.ok:
+    #         print(hostResult)
 
     # # Task 8 Config NAT on R5 and advertise default route
     # task_8()
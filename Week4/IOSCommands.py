@@ -0,0 +1,98 @@
+""" IOS config lines of the Manager operations, shared by HW4_Netmiko and AsyncManager
+
+Every function returns the lines the config operation of the same name pushes, without
+"conf t" and "end" around them. Nothing here imports netmiko, so the asyncio backend runs
+without it.
+"""
+import re
+
+# Seconds an unused session stays open
+IDLE_TIMEOUT = 300
+
+# Config lines sent before waiting for the device, and the IOS messages of a rejected line
+CONFIG_CHUNK = 100
+CONFIG_ERROR = re.compile(r"^%\s*(Invalid input|Incomplete command|Ambiguous command|Unknown command|Unrecognized command).*$", re.M)
+
+def rollback_config(interval=2):
+    """ Rollback config to backup config """
+    rollbackScriptPolicy = ["kron policy-list ROLLBACK", "cli copy config.old running", "exit"]
+    rollbackScriptScheduler = ["kron occur ROLLBACK-CFG in {} oneshot".format(str(interval).zfill(3)), "policy-list rollback-backup"]
+    return rollbackScriptPolicy + rollbackScriptScheduler
+
+def create_vrf(vrf_name, as_number, vrf_number):
+    return ["ip vrf {}".format(vrf_name), "rd {}:{}".format(str(as_number), str(vrf_number))]
+
+def create_loopback(number, ip, mask, vrf_name):
+    """ Create loopback from loopback number, ip, and subnet mask """
+    return ["int lo{}".format(str(number)), "ip vrf forward {}".format(vrf_name), "ip add {} {}".format(ip, mask)]
+
+def create_subinterface(interface, subif_number, ip, mask, vlan, vrf_name):
+    return ["int {}.{}".format(interface, subif_number), "encap dot1Q {}".format(vlan),\
+    "ip vrf forward {}".format(vrf_name), "ip add {} {}".format(ip, mask), "int {}".format(interface), "no shut"]
+
+def create_acl(acl_type, acl_name):
+    return ["ip access-list {} {}".format(acl_type, acl_name)]
+
+def add_acl_rule(acl_type, acl_name, action, src_nw, src_wc="", rule_number=""):
+    """ Add acl rule (for standard acl only) """
+    return ["ip access-list {} {}".format(acl_type, acl_name),\
+    "{} {} {} {}".format(rule_number, action, src_nw, src_wc)]
+
+def apply_acl_to_vty(vty_start, vty_end, acl_name):
+    """ Apply the acl to line vty """
+    return ["line vty {} {}".format(str(vty_start), str(vty_end)), "trans input telnet ssh",\
+    "login local", "access-class {} in vrf-also".format(acl_name)]
+
+def create_ospf_process(process_id, vrf_name=""):
+    if vrf_name == "":
+        vrf_cmd = ""
+    else:
+        vrf_cmd = "vrf"
+    return ["router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name)]
+
+def advertise_ospf_network(process_id, network, wildcard, area, vrf_name=""):
+    if vrf_name == "":
+        vrf_cmd = ""
+    else:
+        vrf_cmd = "vrf"
+    return ["router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name),\
+    "network {} {} area {}".format(network, wildcard, str(area))]
+
+def advertise_ospf_default_route(process_id, vrf_name=""):
+    if vrf_name == "":
+        vrf_cmd = ""
+    else:
+        vrf_cmd = "vrf"
+    return ["router ospf {} {} {}".format(str(process_id), vrf_cmd, vrf_name),\
+    "default-information originate"]
+
+def enableCDP():
+    return ["cdp run"]
+
+def enableLLDP():
+    return ["lldp run"]
+
+def add_interface_desc(interfaceName, description):
+    return ["int {}".format(interfaceName), "desc {}".format(description)]
+
+def addRoute(destination, mask, nexthop="", iface="", vrf_name=""):
+    vrf_cmd = "vrf"
+    if vrf_name == "":
+        vrf_cmd = ""
+    return ["ip route {} {} {} {} {} {}".format(vrf_cmd, vrf_name, destination, mask, iface, nexthop)]
+
+def enable_nat(interfaceName):
+    return ["int {}".format(interfaceName), "ip nat enable"]
+
+def setNat(acl_name, interfaceName, vrf_name="", overload=True):
+    """ NAT basic Configuration """
+    vrf_cmd = "vrf"
+    overload = "overload"
+
+    if vrf_name == "":
+        vrf_cmd = ""
+
+    if not overload:
+        overload = ""
+
+    return ["ip nat source list {} interface {} {} {} {}".format(acl_name, interfaceName, vrf_cmd, vrf_name, overload)]
@@ -0,0 +1,464 @@
+from Fleet import *
+from AsyncManager import AsyncManager, AsyncSessionPool
+from FakeIOS import FakeIOS
+from HW4_Netmiko import Manager, SessionPool
+from netmiko import ConnectHandler
+from unittest import mock
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+class TestFleet(unittest.TestCase):
+
+    def testRun(self):
+        def task(host, number):
+            if number == 2:
+                raise ValueError(host)
+            return number * 10
+
+        inventory = dict(("R{}".format(number), ("R{}".format(number), number)) for number in range(1, 5))
+        results = run_fleet(task, inventory, workers=2, progress=None)
+
+        # Results come back in inventory order, a failed host keeps its exception
+        self.assertEqual([hostResult.host for hostResult in results], ["R1", "R2", "R3", "R4"])
+        self.assertEqual([hostResult.status for hostResult in results], [OK, FAILED, OK, OK])
+        self.assertEqual(results[0].result, 10)
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertEqual(summary(results), "1 failed, 3 ok")
+
+        # Hosts alone are their only argument
+        self.assertEqual([hostResult.result for hostResult in run_fleet(str.upper, ["a", "b"], progress=None)], ["A", "B"])
+
+    def testTimeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def task(host):
+            if host == "a":
+                release.wait(10)
+            return host
+
+        # The blocked host gives its only worker slot to the next one
+        start = time.monotonic()
+        results = run_fleet(task, ["a", "b"], workers=1, timeout=0.5, progress=None)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual([hostResult.status for hostResult in results], [TIMEOUT, OK])
+        self.assertIsInstance(results[0].error, TimeoutError)
+        self.assertEqual(results[1].result, "b")
+
+    def testThreadCeiling(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        started = []
+
+        def task(host):
+            started.append(host)
+            if host in ("a", "b"):
+                release.wait(10)
+            elif host == "slow":
+                time.sleep(0.45)
+            return host
+
+        # Threads of timed out hosts fill the ceiling, the hosts after them are cancelled without a thread
+        results = run_fleet(task, ["a", "b", "c", "d"], workers=1, timeout=0.3, progress=None, max_threads=2)
+        self.assertEqual([hostResult.status for hostResult in results], [TIMEOUT, TIMEOUT, CANCELLED, CANCELLED])
+        self.assertIsInstance(results[2].error, RuntimeError)
+        self.assertEqual(started, ["a", "b"])
+
+        # A thread coming back frees its place for the next host
+        results = run_fleet(task, ["slow", "e"], workers=1, timeout=0.3, progress=None, max_threads=1)
+        self.assertEqual([hostResult.status for hostResult in results], [TIMEOUT, OK])
+
+    def testDuplicateHosts(self):
+        # Hosts listed twice run twice and keep their own result
+        results = run_fleet(str.upper, ["a", "b", "a"], workers=3, progress=None)
+        self.assertEqual([(hostResult.host, hostResult.result) for hostResult in results], [("a", "A"), ("b", "B"), ("a", "A")])
+
+    def testCancel(self):
+        started = []
+
+        def task(host):
+            started.append(host)
+            fleet.cancel()
+            return host
+
+        # Hosts that have not started are cancelled, the running one finishes
+        fleet = Fleet(task, ["a", "b", "c"], workers=1, progress=None)
+        results = fleet.run()
+        self.assertTrue(fleet.cancelled())
+        self.assertEqual(started, ["a"])
+        self.assertEqual([hostResult.status for hostResult in results], [OK, CANCELLED, CANCELLED])
+
+class TestAsyncManager(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.device = FakeIOS("R1", "admin", "cisco")
+        port = self.loop.run_until_complete(self.device.start())
+        self.pool = AsyncSessionPool()
+        self.manageObj = AsyncManager("127.0.0.1", "admin", "cisco", port, self.pool)
+
+    def tearDown(self):
+        self.pool.close()
+        self.device.close()
+
+        # Device sessions end like asyncio.run() ends its tasks
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def testPush(self):
+        self.assertTrue(self.wait(self.manageObj.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)))
+        self.assertTrue(self.wait(self.manageObj.create_loopback(number=100, ip="172.20.179.1", mask="255.255.255.0", vrf_name="Net")))
+        self.assertIn(("ip vrf Net", [" rd 300:100"]), self.device.config)
+        self.assertEqual(self.device.interfaces["lo100"], ("172.20.179.1", "255.255.255.0"))
+
+        # Shows read up to the prompt, without the echo
+        self.assertEqual(self.wait(self.manageObj.show_hostname()), "R1")
+        self.assertIn("172.20.179.1", self.wait(self.manageObj.show_interface()))
+        self.assertEqual(self.wait(self.manageObj.show_vrf()).strip(), "Net")
+
+    def testConfigError(self):
+        # A rejected line fails the push, the session is back in exec mode for the next operation
+        self.assertFalse(self.wait(self.manageObj.push_config(["ip vrf Net", "bogus command"])))
+        self.assertTrue(self.wait(self.manageObj.enableCDP()))
+        self.assertEqual(self.wait(self.manageObj.show_hostname()), "R1")
+        self.assertEqual(self.device.sessions, 1)
+
+    def testChunks(self):
+        # Every chunk waits for the prompts of the one before
+        lines = ["interface Loopback{}".format(number) for number in range(5)]
+        self.assertTrue(self.wait(self.manageObj.push_config(lines, chunk_size=2)))
+        self.assertEqual([section for section, children in self.device.config if section.startswith("interface")], lines)
+
+        # With "conf t" first the chunks are [conf t, Lo10], [bogus, Lo11], [Lo12, end]: the rejected
+        # chunk is applied, the one after it is not sent
+        lines = ["interface Loopback10", "bogus command", "interface Loopback11", "interface Loopback12"]
+        self.assertFalse(self.wait(self.manageObj.push_config(lines, chunk_size=2)))
+        self.assertIn("Loopback11", self.device.interfaces)
+        self.assertNotIn("Loopback12", self.device.interfaces)
+        self.assertEqual(self.wait(self.manageObj.show_hostname()), "R1")
+
+    def testMixedPush(self):
+        # Global lines typed in a sub mode leave it, interface lines stay in their interface
+        lines = ["int lo100", "ip vrf Net", "rd 300:100", "int lo100", "ip vrf forward Net", "ip add 172.20.179.1 255.255.255.0",
+                 "ip route 0.0.0.0 0.0.0.0 10.0.0.1", "cdp run", "router ospf 1", "network 172.20.179.0 0.0.0.255 area 0",
+                 "ip access-list standard Mgmt", "10 permit 10.0.0.0 0.0.0.255", "lldp run"]
+        self.assertTrue(self.wait(self.manageObj.push_config(lines)))
+        self.assertEqual(self.wait(self.manageObj.send_command("sh run")).splitlines(),
+                         ["hostname R1", "int lo100", " ip vrf forward Net", " ip add 172.20.179.1 255.255.255.0",
+                          "ip vrf Net", " rd 300:100", "ip route 0.0.0.0 0.0.0.0 10.0.0.1", "cdp run",
+                          "router ospf 1", " network 172.20.179.0 0.0.0.255 area 0",
+                          "ip access-list standard Mgmt", " permit 10.0.0.0 0.0.0.255", "lldp run"])
+        self.assertEqual(self.device.interfaces["lo100"], ("172.20.179.1", "255.255.255.0"))
+
+    def testSessionReuse(self):
+        async def task():
+            await self.manageObj.create_acl(acl_type="standard", acl_name="Mgmt")
+            await self.manageObj.add_acl_rule(acl_type="standard", acl_name="Mgmt", action="permit", src_nw="10.0.0.0", src_wc="0.0.0.255")
+            return await asyncio.gather(*[self.manageObj.show_acl() for index in range(5)])
+
+        # Every operation of a device shares its one session
+        self.assertEqual(self.wait(task()), ["ip access-list standard Mgmt"] * 5)
+        self.assertEqual(self.device.sessions, 1)
+        self.assertEqual(len(self.pool), 1)
+
+        # Closed sessions are opened again on demand
+        self.manageObj.close()
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(self.wait(self.manageObj.show_hostname()), "R1")
+        self.assertEqual(self.device.sessions, 2)
+
+class _Device:
+    """ device whose connections count how often they are opened and closed """
+
+    def __init__(self):
+        self.connects = 0
+        self.disconnects = 0
+        self.alive = True
+
+    def connect(self):
+        self.connects += 1
+        return _Link(self)
+
+class _Link:
+    def __init__(self, device):
+        self.device = device
+
+    def is_alive(self):
+        return self.device.alive
+
+    def disconnect(self):
+        self.device.disconnects += 1
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        # The pool reads time.monotonic(), the tests move it forward by hand
+        self.now = 1000.0
+        patcher = mock.patch("HW4_Netmiko.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.device = _Device()
+        self.pool = SessionPool(idle_timeout=300, reap_interval=0)
+        self.addCleanup(self.pool.close)
+
+    def use(self):
+        with self.pool.session("R1", self.device.connect) as connection:
+            return connection
+
+    def testReuse(self):
+        # A healthy session is handed out again, a dead one is reopened
+        first = self.use()
+        self.assertIs(self.use(), first)
+        self.assertEqual((self.device.connects, self.device.disconnects), (1, 0))
+        self.device.alive = False
+        self.assertIsNot(self.use(), first)
+        self.assertEqual((self.device.connects, self.device.disconnects), (2, 1))
+
+        # So is one that sat unused for longer than idle_timeout
+        self.device.alive = True
+        second = self.use()
+        self.now += 301
+        self.assertIsNot(self.use(), second)
+        self.assertEqual((self.device.connects, self.device.disconnects), (3, 2))
+
+    def testReentrant(self):
+        # A holder asking again gets its own session without a health check
+        with self.pool.session("R1", self.device.connect) as outer:
+            self.device.alive = False
+            with self.pool.session("R1", self.device.connect) as inner:
+                self.assertIs(inner, outer)
+
+            # Sessions in use are never idle
+            self.now += 301
+            self.assertEqual(self.pool.reap(), 0)
+        self.assertEqual((self.device.connects, self.device.disconnects), (1, 0))
+
+    def testFailedCommand(self):
+        # The device may be in the middle of the failed command, its session is closed
+        with self.assertRaises(ValueError):
+            with self.pool.session("R1", self.device.connect):
+                raise ValueError("timeout")
+        self.assertEqual(len(self.pool), 0)
+        self.use()
+        self.assertEqual((self.device.connects, self.device.disconnects), (2, 1))
+
+    def testReap(self):
+        self.use()
+        self.now += 200
+        self.assertEqual(self.pool.reap(), 0)
+        self.now += 101
+        self.assertEqual(self.pool.reap(), 1)
+        self.assertEqual((len(self.pool), self.device.disconnects), (0, 1))
+
+    def testReaper(self):
+        # The reaper starts with the first session and stops with close()
+        pool = SessionPool(idle_timeout=300, reap_interval=0.01)
+        with pool.session("R1", self.device.connect):
+            reapers = [thread for thread in threading.enumerate() if thread.name == "SessionPool reaper"]
+        self.now += 301
+        deadline = time.time() + 5
+        while len(pool) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.device.disconnects, 1)
+        pool.close()
+        for thread in reapers:
+            thread.join(5)
+        self.assertFalse(any(thread.is_alive() for thread in reapers))
+
+    def testClose(self):
+        self.use()
+        with self.pool.session("R2", self.device.connect):
+            pass
+        self.pool.close("R2")
+        self.assertEqual((len(self.pool), self.device.disconnects), (1, 1))
+        self.pool.close()
+        self.assertEqual((len(self.pool), self.device.disconnects), (0, 2))
+
+    def testCloseAtExit(self):
+        # The shared pool closes its sessions when the interpreter exits
+        script = "\n".join([
+            "import HW4_Netmiko",
+            "class Link:",
+            "    def disconnect(self):",
+            "        print('disconnect')",
+            "with HW4_Netmiko.default_pool.session('R1', Link):",
+            "    pass",
+        ])
+        output = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=60).stdout
+        self.assertEqual(output, "disconnect\n")
+
+class _Connection:
+    """ netmiko connection that logs what it is sent, lines with "bogus" are rejected and "hang" times out """
+
+    def __init__(self, log):
+        self.log = log
+
+    def is_alive(self):
+        return True
+
+    def disconnect(self):
+        self.log.append("disconnect")
+
+    def send_command(self, command_string, expect_string=None, **kwargs):
+        self.log.append(command_string)
+        return "hostname R1" if "hostname" in command_string else ""
+
+    def send_config_set(self, commands, enter_config_mode=True, exit_config_mode=True, **kwargs):
+        commands = list(commands)
+        if enter_config_mode:
+            self.log.append("conf t")
+        self.log.append(commands)
+        if any("hang" in cmd for cmd in commands):
+            raise OSError("timeout")
+        if exit_config_mode:
+            self.log.append("end")
+        return "\n".join("% Invalid input detected at '^' marker." if "bogus" in cmd else cmd for cmd in commands)
+
+    def exit_config_mode(self):
+        self.log.append("end")
+
+class _Manager(Manager):
+    def __init__(self, log):
+        Manager.__init__(self, "192.0.2.1", "admin", "cisco", "cisco_ios", SessionPool(reap_interval=0))
+        self.log = log
+
+    def create_connection(self):
+        return _Connection(self.log)
+
+class TestPushConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.log = []
+        self.manageObj = _Manager(self.log)
+        self.addCleanup(self.manageObj.close)
+
+    def testChunks(self):
+        # Config mode is entered before the first chunk and left after the last one
+        lines = ["line {}".format(number) for number in range(5)]
+        self.assertTrue(self.manageObj.push_config(lines, chunk_size=2))
+        self.assertEqual(self.log, ["conf t", lines[0:2], lines[2:4], lines[4:], "end"])
+
+        # A push of exactly chunk_size lines is one chunk, one more line makes two
+        del self.log[:]
+        self.assertTrue(self.manageObj.push_config(lines[:4], chunk_size=4))
+        self.assertEqual(self.log, ["conf t", lines[:4], "end"])
+        del self.log[:]
+        self.assertTrue(self.manageObj.push_config(lines, chunk_size=4))
+        self.assertEqual(self.log, ["conf t", lines[:4], lines[4:], "end"])
+
+        # Blank lines are not sent, nothing left is no push at all
+        del self.log[:]
+        self.assertTrue(self.manageObj.push_config(["", "  "]))
+        self.assertEqual(self.log, [])
+
+    def testRejectedChunk(self):
+        # The rest of the rejected chunk is applied, later chunks are not sent
+        lines = ["line 0", "bogus 1", "line 2", "line 3", "line 4"]
+        self.assertFalse(self.manageObj.push_config(lines, chunk_size=3))
+        self.assertEqual(self.log, ["conf t", lines[:3], "end"])
+
+        # The session stays open for the next push
+        del self.log[:]
+        self.assertTrue(self.manageObj.push_config(lines[2:], chunk_size=3))
+        self.assertEqual(self.log, ["conf t", lines[2:], "end"])
+
+    def testFailureBetweenChunks(self):
+        # A chunk that fails leaves the device in config mode, the session is closed instead of reused
+        lines = ["line 0", "line 1", "hang 2", "line 3"]
+        self.assertFalse(self.manageObj.push_config(lines, chunk_size=2))
+        self.assertEqual(self.log, ["conf t", lines[:2], lines[2:], "disconnect"])
+        del self.log[:]
+        self.assertTrue(self.manageObj.push_config(lines[:2], chunk_size=2))
+        self.assertEqual(self.log, ["conf t", lines[:2], "end"])
+
+class _FakeIOSManager(Manager):
+    """ Manager of a FakeIOS device on a local port """
+
+    def __init__(self, port, pool):
+        Manager.__init__(self, "127.0.0.1", "admin", "cisco", "cisco_ios", pool)
+        self.port = port
+
+    def create_connection(self):
+        return ConnectHandler(ip="127.0.0.1", port=self.port, username="admin", password="cisco", device_type="cisco_ios")
+
+class TestTransaction(unittest.TestCase):
+
+    def testOrder(self):
+        log = []
+        with _Manager(log) as manageObj, manageObj.transaction() as tx:
+            backup = tx.backup_config()
+            tx.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+            loopback = tx.create_loopback(number=100, ip="172.20.179.1", mask="255.255.255.0", vrf_name="Net")
+            hostname = tx.show_hostname()
+            tx.save_config()
+
+        # Exec operations stay where they were queued, consecutive config operations are one push
+        self.assertEqual(log, ["copy run flash:config.old", "\n", "conf t",
+                               ["ip vrf Net", "rd 300:100", "int lo100", "ip vrf forward Net", "ip add 172.20.179.1 255.255.255.0"],
+                               "end", "sh run | in hostname", "write mem", "disconnect"])
+        self.assertEqual(tx.results, [True, True, True, "R1", True])
+        self.assertTrue(tx.results[backup] and tx.results[loopback])
+        self.assertEqual(tx.results[hostname], "R1")
+
+    def testMixedLines(self):
+        loop = asyncio.new_event_loop()
+        device = FakeIOS("R1", "admin", "cisco")
+        port = loop.run_until_complete(device.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            with _FakeIOSManager(port, SessionPool(reap_interval=0)) as manageObj, manageObj.transaction() as tx:
+                tx.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+                tx.create_loopback(number=100, ip="172.20.179.1", mask="255.255.255.0", vrf_name="Net")
+                tx.addRoute(destination="0.0.0.0", mask="0.0.0.0", nexthop="10.0.0.1")
+                tx.enable_nat(interfaceName="lo100")
+                tx.setNat(acl_name="Mgmt", interfaceName="lo100")
+                tx.add_interface_desc(interfaceName="lo100", description="Mgmt")
+                tx.enableCDP()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            device.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+        # Every operation opens the section of its lines, the one push keeps them where they belong
+        self.assertTrue(all(tx.results))
+        self.assertEqual([(section, children) for section, children in device.config],
+                         [("hostname R1", []), ("ip vrf Net", [" rd 300:100"]),
+                          ("int lo100", [" ip vrf forward Net", " ip add 172.20.179.1 255.255.255.0", " ip nat enable", " desc Mgmt"]),
+                          ("ip route 0.0.0.0 0.0.0.0 10.0.0.1", []), ("ip nat source list Mgmt interface lo100 overload", []),
+                          ("cdp run", [])])
+
+    def testRejectedPush(self):
+        log = []
+        manageObj = _Manager(log)
+        tx = manageObj.transaction()
+        tx.create_vrf(vrf_name="Net", as_number=300, vrf_number=100)
+        tx.add_interface_desc(interfaceName="G0/1", description="bogus")
+        tx.save_config()
+        tx.create_acl(acl_type="standard", acl_name="Mgmt")
+
+        # Nothing runs after the rejected push
+        self.assertFalse(tx.commit())
+        self.assertEqual(tx.results, [False, False, None, None])
+        self.assertNotIn("write mem", log)
+        manageObj.close()
+
+if __name__ == '__main__':
+    unittest.main()